@@ -2,18 +2,41 @@
 import streamlit as st
 from PIL import Image
 import numpy as np
-import tensorflow as tf
-from tensorflow import keras
-import cv2
-from io import StringIO
-
-# Set page config with enhanced visuals
-st.set_page_config(
-    page_title="🌿 AI-Powered Crop Weed Management",
-    page_icon="🌱",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from io import BytesIO, StringIO
+
+from background_jobs import JobManager, JobQueueFull
+from cascade import (DEFAULT_THRESHOLD as DEFAULT_CASCADE_THRESHOLD, PATH_FIRST_STAGE, Cascade, CascadeCounts,
+                     load_first_stage)
+from compiled_inference import CompiledModel
+from embedding_search import (DEFAULT_STORE_DIR as DEFAULT_EMBEDDING_DIR, EmbeddingStore, RecentEmbeddings,
+                              store_directory)
+from field_analysis import analyze_field, render_heatmap
+from herbicide_cover import HerbicideIndex
+from history_store import DEFAULT_DB_PATH as DEFAULT_HISTORY_DB_PATH, DEFAULT_FIELD, HistoryStore
+from inference_backends import TFLiteBackend, available_model_paths
+from inference_governor import (GovernedModel, InferenceGovernor, ServerBusy, configure_tensorflow_threads,
+                                default_max_concurrent)
+from instrumentation import metrics
+from model_registry import ModelRegistry, ModelSpec, discover, load_manifest
+from model_server import ModelServerClient
+from near_duplicates import NearDuplicateIndex
+from prediction_cache import PredictionCache, model_identity
+from preprocessing import decode_reduced, load_batch, model_input_size
+from templates import recommendation_card, result_card, tank_mix_options
+from video_analysis import DetectionTimeline, VideoClassifier, video_info
+from warm_start import DEFAULT_CACHE_DIR as DEFAULT_RELOAD_CACHE_DIR, ModelPreloader, preload
+
+# WeedAI events such as startup timings go to the server log (the script reruns, so add the handler once)
+logger = logging.getLogger("weedai")
+if not logger.handlers:
+    logger.setLevel(logging.INFO)
+    logger.addHandler(logging.StreamHandler())
 
 # Custom CSS for modern interface with enhanced visuals
 def set_custom_style():
@@ -273,56 +296,443 @@ def set_custom_style():
     </style>
     """, unsafe_allow_html=True)
 
-set_custom_style()
-
-# App header with enhanced design
-st.markdown("""
-<div class="header animate-fade-in">
-    <h1 style="margin:0;font-size:2.8rem;font-weight:700">🌿 AI-Powered Crop Weed Management</h1>
-    <p style="margin:10px 0 0;font-size:1.3rem;opacity:0.9">Smart weed identification and precision control recommendations</p>
-</div>
-""", unsafe_allow_html=True)
-
 # Default model path
 DEFAULT_MODEL_PATH = "crop_weed_classifier_final.keras"
 
-# Load model function with caching
-@st.cache_resource
+# Reload cache for Keras models - see warm_start.py
+MODEL_RELOAD_CACHE_DIR = os.environ.get("WEEDAI_MODEL_CACHE_DIR", DEFAULT_RELOAD_CACHE_DIR)
+
+# Background import, load and warm-up, started once per server process - by serve_app.py before the server starts,
+# else by the first script run
+def get_model_preloader(model_path):
+    return preload(model_path, cache_dir=MODEL_RELOAD_CACHE_DIR)
+
+# Optional shared model server (see model_server.py) - when it serves the selected model, this process loads none
+MODEL_SERVER_ADDRESS = os.environ.get("WEEDAI_MODEL_SERVER")
+
+@st.cache_resource(show_spinner=False)
+def get_model_server():
+    if not MODEL_SERVER_ADDRESS:
+        return None
+    try:
+        return ModelServerClient(MODEL_SERVER_ADDRESS)
+    except Exception as e:
+        logger.warning("Model server at %s unavailable, loading the model in-process: %s", MODEL_SERVER_ADDRESS, e)
+        return None
+
+def served_by_model_server(model_path):
+    server = get_model_server()
+    return server is not None and server.serves(model_path)
+
+# Keras models run through one compiled, retrace-free tf.function (see compiled_inference.py); XLA is opt-in
+COMPILED_INFERENCE = os.environ.get("WEEDAI_COMPILED_INFERENCE", "1") == "1"
+XLA_JIT = os.environ.get("WEEDAI_XLA") == "1"
+
+# Load one model - not cached here; the model registry decides which models stay in memory
 def load_model(model_path):
     try:
-        model = keras.models.load_model(model_path)
+        if served_by_model_server(model_path):
+            return get_model_server()
+        if model_path.endswith(".tflite"):
+            return TFLiteBackend(model_path)
+        preloader = get_model_preloader(model_path)
+        if preloader.taken:
+            # Loaded before and since evicted - load it again, from the reload cache when there is one
+            preloader = ModelPreloader(model_path, cache_dir=MODEL_RELOAD_CACHE_DIR)
+        model = preloader.take()
+        if COMPILED_INFERENCE:
+            model = CompiledModel(model, jit_compile=XLA_JIT).warm_up()
         return model
     except Exception as e:
         st.error(f"❌ Error loading model: {str(e)}")
         return None
 
+# Model registry (see model_registry.py) - models from a manifest or a directory, else the default model and
+# its TFLite exports. Models load on first use and the least recently used are evicted over the memory budget
+MODEL_MANIFEST = os.environ.get("WEEDAI_MODEL_MANIFEST")
+MODEL_DIR = os.environ.get("WEEDAI_MODEL_DIR")
+MODEL_MEMORY_BUDGET_MB = float(os.environ.get("WEEDAI_MODEL_MEMORY_BUDGET_MB", "1024"))
+
+@st.cache_resource(show_spinner=False)
+def get_model_registry():
+    if MODEL_MANIFEST:
+        specs = load_manifest(MODEL_MANIFEST, CLASS_NAMES)
+    elif MODEL_DIR:
+        specs = discover(MODEL_DIR, CLASS_NAMES)
+    else:
+        specs = [ModelSpec(os.path.basename(path), path, CLASS_NAMES)
+                 for path in available_model_paths(DEFAULT_MODEL_PATH)]
+    return ModelRegistry(specs, load_model, memory_budget_bytes=int(MODEL_MEMORY_BUDGET_MB * 1024 * 1024))
+
+# Confidence-gated cascade (see cascade.py) - off unless switched on in the sidebar or with WEEDAI_CASCADE=1.
+# Only offered with a trained first stage: the untrained stand-in escalates every image, so it would only add cost
+CASCADE_ENABLED = os.environ.get("WEEDAI_CASCADE") == "1"
+CASCADE_THRESHOLD = float(os.environ.get("WEEDAI_CASCADE_THRESHOLD", DEFAULT_CASCADE_THRESHOLD))
+CASCADE_FIRST_STAGE = os.environ.get("WEEDAI_CASCADE_FIRST_STAGE")
+
+@st.cache_resource(show_spinner="⏳ Loading first-stage model...")
+def get_first_stage():
+    return load_first_stage(CASCADE_FIRST_STAGE)
+
+# Counts are kept per model and threshold; the cascade itself is rebuilt per run so it never pins an evicted model
+@st.cache_resource
+def get_cascade_counts(model_name, threshold):
+    return CascadeCounts()
+
+def get_cascade(model, model_name, threshold):
+    try:
+        first_stage = get_first_stage()
+    except Exception as e:
+        st.error(f"❌ Error loading first-stage model: {str(e)}")
+        return None
+    return Cascade(first_stage, model, threshold, first_stage_name=os.path.basename(CASCADE_FIRST_STAGE),
+                   counts=get_cascade_counts(model_name, threshold))
+
+# Admission control around model execution (see inference_governor.py): at most this many predict calls run at
+# once, the rest queue for a bounded wait, and callers beyond the queue get ServerBusy straight away
+MAX_CONCURRENT_INFERENCE = int(os.environ.get("WEEDAI_MAX_CONCURRENT_INFERENCE", default_max_concurrent()))
+INFERENCE_QUEUE_SIZE = int(os.environ.get("WEEDAI_INFERENCE_QUEUE_SIZE", "16"))
+INFERENCE_MAX_WAIT = float(os.environ.get("WEEDAI_INFERENCE_MAX_WAIT", "10"))
+
+# Created before any model loads, so the TensorFlow thread pools are sized for the concurrency limit
+@st.cache_resource
+def get_inference_governor():
+    threads = configure_tensorflow_threads(MAX_CONCURRENT_INFERENCE)
+    if threads:
+        logger.info("TensorFlow thread pools: %d intra-op, %d inter-op", *threads)
+    return InferenceGovernor(MAX_CONCURRENT_INFERENCE, INFERENCE_QUEUE_SIZE, INFERENCE_MAX_WAIT)
+
+# Size the thread pools and start loading the default model - the registry's first; returns its path.
+# serve_app.py calls this before the Streamlit server starts; under plain `streamlit run` the first session does
+@st.cache_resource(show_spinner=False)
+def start_model_preloading():
+    get_inference_governor()
+    registry = get_model_registry()
+    default_model_path = registry.specs[registry.names[0]].path
+    if default_model_path.endswith(".keras") and not served_by_model_server(default_model_path):
+        get_model_preloader(default_model_path)
+    return default_model_path
+
 # Enhanced image preprocessing
 def preprocess_image(image, target_size=(120, 120)):
+    return preprocess_images([image], target_size)
+
+# Batch preprocessing - reduced-size decode straight into one float32 (N, H, W, 3) tensor.
+# With raise_errors (background jobs, which have no page to show st.error on) errors propagate instead
+def preprocess_images(images, target_size=(120, 120), raise_errors=False):
     try:
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        image = image.resize(target_size)
-        image_array = np.array(image) / 255.0
-        image_array = np.expand_dims(image_array, axis=0)
-        return image_array
+        with metrics.stage("preprocess"):
+            return load_batch(images, target_size)
     except Exception as e:
+        if raise_errors:
+            raise
         st.error(f"❌ Error preprocessing image: {str(e)}")
         return None
 
 # Weed classification with confidence display
 def classify_weed(model, image_array, class_names):
+    results = classify_weeds(model, image_array, class_names)
+    if not results:
+        return None, None
+    return results[0]
+
+# (class name, confidence) of the most likely class for each row of predicted probabilities
+def top_predictions(predictions, class_names):
+    predicted_classes = np.argmax(predictions, axis=1)
+    confidences = np.max(predictions, axis=1)
+    return [(class_names[c], float(p)) for c, p in zip(predicted_classes, confidences)]
+
+# Batch classification - one predict call, split into batches of batch_size.
+# If paths is a list, the path each image took ("first stage" / "full model" for a cascade, else "model") is appended.
+# If embeddings is a list, each image's embedding from the same forward pass is appended - None when the model has none.
+# With raise_errors, errors propagate to the caller instead of being shown with st.error
+def classify_weeds(model, image_batch, class_names, batch_size=32, paths=None, embeddings=None, raise_errors=False):
     try:
-        if model.input_shape[1:3] != image_array.shape[1:3]:
-            image_array = tf.image.resize(image_array, model.input_shape[1:3])
+        if not getattr(model, "resizes_inputs", False) and model.input_shape[1:3] != image_batch.shape[1:3]:
+            import tensorflow as tf
+            with metrics.stage("resize_fallback"):
+                image_batch = tf.image.resize(image_batch, model.input_shape[1:3])
         
-        predictions = model.predict(image_array)
-        predicted_class = np.argmax(predictions[0])
-        confidence = np.max(predictions[0])
-        return class_names[predicted_class], confidence
+        with get_inference_governor().admit(), metrics.stage("predict"):
+            batch_embeddings = None
+            if isinstance(model, Cascade):
+                predictions, image_paths = model.predict(image_batch, batch_size=batch_size, verbose=0, return_paths=True)
+            elif embeddings is not None and getattr(model, "has_embeddings", False):
+                predictions, batch_embeddings = model.predict_with_embeddings(image_batch, batch_size=batch_size)
+                image_paths = ["model"] * len(predictions)
+            else:
+                predictions = model.predict(image_batch, batch_size=batch_size, verbose=0)
+                image_paths = ["model"] * len(predictions)
+        if paths is not None:
+            paths.extend(image_paths)
+        if embeddings is not None:
+            embeddings.extend(batch_embeddings if batch_embeddings is not None else [None] * len(predictions))
+        return top_predictions(predictions, class_names)
+    except ServerBusy:
+        # Not a classification error - the caller tells the user to retry
+        raise
     except Exception as e:
+        if raise_errors:
+            raise
         st.error(f"❌ Error during classification: {str(e)}")
-        return None, None
+        return None
+
+# Prediction cache shared by every session - the disk tier is enabled by setting the directory
+PREDICTION_CACHE_SIZE = 512
+PREDICTION_CACHE_DIR = os.environ.get("WEEDAI_PREDICTION_CACHE_DIR")
+
+@st.cache_resource
+def get_prediction_cache():
+    return PredictionCache(max_entries=PREDICTION_CACHE_SIZE, cache_dir=PREDICTION_CACHE_DIR)
+
+# Identifies the model behind cached predictions - changes whenever the model file or the cascade settings do
+def prediction_model_id(model, model_path):
+    try:
+        model_id = model_identity(model_path)
+    except OSError:
+        model_id = model_path
+    if isinstance(model, Cascade):
+        model_id = f"{model_id}|{model.identity}"
+    return model_id
+
+# Near-duplicate suppression (see near_duplicates.py) - an image within this many bits of a recently classified
+# one reuses its prediction. Off (-1) unless set; pick the distance with `near_duplicates.py evaluate` first
+NEAR_DUPLICATE_DISTANCE = int(os.environ.get("WEEDAI_NEAR_DUPLICATE_DISTANCE", "-1"))
+PATH_NEAR_DUPLICATE = "near duplicate"
+
+# One index per model and field, so an upload only reuses predictions for photos of the same field
+@st.cache_resource
+def get_near_duplicate_index(model_id, field):
+    return NearDuplicateIndex(max_distance=NEAR_DUPLICATE_DISTANCE)
+
+# Similar confirmed images (see embedding_search.py) - one embedding store per model file under this directory;
+# set WEEDAI_EMBEDDING_DIR to "" to switch it off
+EMBEDDING_DIR = os.environ.get("WEEDAI_EMBEDDING_DIR", DEFAULT_EMBEDDING_DIR)
+SIMILAR_IMAGES = 5
+# Below this confidence the similar images are shown open
+SIMILAR_IMAGES_CONFIDENCE = 0.7
+
+# Embeddings of recently predicted images by prediction cache key, shared by every session
+@st.cache_resource
+def get_recent_embeddings():
+    return RecentEmbeddings(max_entries=PREDICTION_CACHE_SIZE)
+
+@st.cache_resource
+def get_embedding_store(model_path, dim):
+    try:
+        return EmbeddingStore(store_directory(EMBEDDING_DIR, model_path), dim)
+    except Exception as e:
+        logger.warning("Embedding store for %s unavailable, similar images are not shown: %s", model_path, e)
+        return None
+
+# Classification behind the prediction cache and the near-duplicate index - only uncached images are decoded and
+# resized, and only those that are not near-duplicates are predicted.
+# image_batch is the already-preprocessed tensor for images_bytes, when the caller has one; paths as in classify_weeds
+def classify_cached(model, images_bytes, class_names, batch_size=32, model_path=DEFAULT_MODEL_PATH, image_batch=None,
+                    paths=None, raise_errors=False, field=DEFAULT_FIELD):
+    cache = get_prediction_cache()
+    model_id = prediction_model_id(model, model_path)
+    
+    with metrics.stage("cache_lookup"):
+        keys = [cache.make_key(image_bytes, model_id) for image_bytes in images_bytes]
+        results = [cache.get(key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    image_paths = ["cache"] * len(results)
+    if not missing:
+        if paths is not None:
+            paths.extend(image_paths)
+        return results
+    
+    if image_batch is not None:
+        image_batch = image_batch[missing]
+    else:
+        try:
+            with metrics.stage("image_open"):
+                images = [Image.open(BytesIO(images_bytes[i])) for i in missing]
+        except Exception as e:
+            if raise_errors:
+                raise
+            st.error(f"❌ Error opening image: {str(e)}")
+            return None
+        image_batch = preprocess_images(images, model_input_size(model), raise_errors=raise_errors)
+        if image_batch is None:
+            return None
+    fresh_paths = []
+    # Embeddings from the same forward pass, kept for the similar-images search
+    fresh_embeddings = [] if EMBEDDING_DIR else None
+    if NEAR_DUPLICATE_DISTANCE >= 0:
+        index = get_near_duplicate_index(model_id, field)
+        
+        # The index keeps each result with its embedding, so a near-duplicate reuses both
+        def predict(batch):
+            embeddings = [] if EMBEDDING_DIR else None
+            batch_results = classify_weeds(model, batch, class_names, batch_size=batch_size, paths=fresh_paths,
+                                           embeddings=embeddings, raise_errors=raise_errors)
+            if batch_results is None:
+                return None
+            return list(zip(batch_results, embeddings or [None] * len(batch_results)))
+        
+        fresh_pairs, predicted = index.predict(image_batch, predict)
+        if fresh_pairs is None:
+            return None
+        fresh_results = [result for result, _ in fresh_pairs]
+        if fresh_embeddings is not None:
+            fresh_embeddings = [embedding for _, embedding in fresh_pairs]
+        predicted_paths = dict(zip(predicted, fresh_paths))
+        fresh_paths = [predicted_paths.get(i, PATH_NEAR_DUPLICATE) for i in range(len(fresh_results))]
+    else:
+        fresh_results = classify_weeds(model, image_batch, class_names, batch_size=batch_size, paths=fresh_paths,
+                                       embeddings=fresh_embeddings, raise_errors=raise_errors)
+    if fresh_results is None:
+        return None
+    
+    for i, result, path in zip(missing, fresh_results, fresh_paths):
+        cache.put(keys[i], result)
+        results[i] = result
+        image_paths[i] = path
+    if fresh_embeddings:
+        recent = get_recent_embeddings()
+        for i, embedding in zip(missing, fresh_embeddings):
+            if embedding is not None:
+                recent.put(keys[i], embedding)
+    if paths is not None:
+        paths.extend(image_paths)
+    return results
+
+# Inference runs on a worker pool shared by every session, so the script thread only polls for progress.
+# One worker per execution the governor runs or queues, so its queue fills and it turns callers away; a job
+# beyond that is refused at submit instead of waiting for a worker
+JOB_WORKERS = int(os.environ.get("WEEDAI_JOB_WORKERS", MAX_CONCURRENT_INFERENCE + INFERENCE_QUEUE_SIZE))
+
+@st.cache_resource
+def get_job_manager():
+    return JobManager(max_workers=JOB_WORKERS, max_in_flight=JOB_WORKERS)
+
+# Identification and recommendation history (see history_store.py) - set WEEDAI_HISTORY_DB to "" to switch it off
+HISTORY_DB = os.environ.get("WEEDAI_HISTORY_DB", DEFAULT_HISTORY_DB_PATH)
+
+@st.cache_resource
+def get_history_store():
+    if not HISTORY_DB:
+        return None
+    try:
+        return HistoryStore(HISTORY_DB)
+    except Exception as e:
+        logger.warning("History store at %s unavailable, nothing will be recorded: %s", HISTORY_DB, e)
+        return None
+
+# Job body: classifies the uploads chunk by chunk so progress can be reported between chunks.
+# history is (store, field, model name) to record each result, or None
+def identify_job(job, model, model_path, class_names, images_bytes, batch_size=32, image_batch=None, history=None,
+                 field=DEFAULT_FIELD):
+    with metrics.profile_request("identify"), metrics.stage("identify_total"):
+        start = time.perf_counter()
+        results, paths = [], []
+        for offset in range(0, len(images_bytes), batch_size):
+            chunk = classify_cached(model, images_bytes[offset:offset + batch_size], class_names,
+                                    batch_size=batch_size, model_path=model_path,
+                                    image_batch=None if image_batch is None else image_batch[offset:offset + batch_size],
+                                    paths=paths, raise_errors=True, field=field)
+            results.extend(chunk)
+            job.progress = len(results) / len(images_bytes)
+        total_time = time.perf_counter() - start
+        
+        if history is not None:
+            store, field, model_name = history
+            model_version = f"{model_name}|{model.identity}" if isinstance(model, Cascade) else model_name
+            for image_bytes, (predicted_class, confidence), path in zip(images_bytes, results, paths):
+                store.record_prediction(predicted_class, confidence, model_version,
+                                        hashlib.sha256(image_bytes).hexdigest(), field=field, path=path)
+        return results, total_time, paths
+
+# Identical uploads for the same model share one job, so a double click or a second session does not re-run inference.
+# Results are recorded in the history under field and model_name. Raises ServerBusy when every job worker is taken
+def submit_identify_job(model, model_path, class_names, images_bytes, batch_size=32, image_batch=None, field=None,
+                        model_name=None):
+    digest = hashlib.sha256()
+    for image_bytes in images_bytes:
+        digest.update(hashlib.sha256(image_bytes).digest())
+    key = ("identify", model_path, getattr(model, "identity", None), batch_size, field, digest.hexdigest())
+    label = f"Analyzing {len(images_bytes)} image{'s' if len(images_bytes) != 1 else ''}"
+    store = get_history_store()
+    history = (store, field or DEFAULT_FIELD, model_name or os.path.basename(model_path)) if store else None
+    try:
+        return get_job_manager().submit(key, label, identify_job, model, model_path, class_names, images_bytes,
+                                        batch_size, image_batch, history, field or DEFAULT_FIELD)
+    except JobQueueFull as e:
+        raise ServerBusy(f"The model is busy - {e}, please retry in a moment") from e
+
+# Decoded image, display thumbnail and model tensor per upload, kept across reruns and keyed by file identity.
+# A rerun caused by any other widget reuses them instead of decoding the upload and sending it at full resolution
+UPLOAD_CACHE_SIZE = 4
+THUMBNAIL_SIZE = (800, 800)
+
+def get_upload(uploaded_file, target_size):
+    uploads = st.session_state.setdefault("uploads", OrderedDict())
+    key = (uploaded_file.file_id, tuple(target_size))
+    entry = uploads.get(key)
+    if entry is not None:
+        uploads.move_to_end(key)
+        return entry
+    
+    with metrics.stage("upload"):
+        image_bytes = uploaded_file.getvalue()
+    try:
+        # Decoded once at display size - a JPEG is only decoded at a reduced scale
+        with metrics.stage("image_open"):
+            image = decode_reduced(Image.open(BytesIO(image_bytes)), THUMBNAIL_SIZE)
+            image.load()
+    except Exception as e:
+        st.error(f"❌ Error opening image: {str(e)}")
+        return None
+    # Decoded separately at model scale so it matches what classify_cached computes from the bytes
+    tensor = preprocess_images([Image.open(BytesIO(image_bytes))], target_size)
+    if tensor is None:
+        return None
+    
+    # Encoded once, so st.image neither resizes nor re-encodes it on later reruns
+    with metrics.stage("thumbnail"):
+        thumbnail = image.copy()
+        thumbnail.thumbnail(THUMBNAIL_SIZE)
+        buffer = BytesIO()
+        thumbnail.save(buffer, format="JPEG", quality=85)
+    
+    entry = uploads[key] = {"image": image, "thumbnail": buffer.getvalue(), "tensor": tensor,
+                            "bytes": image_bytes}
+    while len(uploads) > UPLOAD_CACHE_SIZE:
+        uploads.popitem(last=False)
+    return entry
+
+# Polls a running job without rerunning the whole page, then reruns once so the results render
+@st.fragment(run_every=0.5)
+def render_job_progress(job):
+    if job.done:
+        st.rerun()
+    st.progress(job.progress, text=f"🧠 {job.label}... {job.elapsed:.1f} s")
+
+# The job stored under session_key if it belongs to the current upload; shows progress while it runs
+def current_job(session_key, upload_id):
+    job_upload_id, job = st.session_state.get(session_key, (None, None))
+    if job is None or job_upload_id != upload_id:
+        return None
+    if not job.done:
+        render_job_progress(job)
+        return None
+    if isinstance(job.error, ServerBusy):
+        st.warning(f"⏳ {str(job.error)}")
+        return None
+    if job.error is not None:
+        st.error(f"❌ Error during classification: {str(job.error)}")
+        return None
+    return job
+
+# All weed classes, in the order of the model's output layer
+CLASS_NAMES = [
+    "Carpetweeds", "Crabgrass", "Eclipta", "Goosegrass", 
+    "Morningglory", "Nutsedge", "PalmerAmaranth", "Prickly Sida",
+    "Purslane", "Ragweed", "Sicklepod", "SpottedSpurge",
+    "SpurredAnoda", "Swinecress", "Waterhemp"
+]
 
 # Complete weed information database
 WEED_INFO = {
@@ -418,6 +828,39 @@ WEED_INFO = {
     }
 }
 
+# Soil-specific advice
+SOIL_ADVICE = {
+    "clay": "For clay soil, add a surfactant to improve herbicide absorption and use higher application rates.",
+    "sandy": "On sandy soils, reduce application rates by 20% to prevent leaching and potential groundwater contamination.",
+    "loamy": "Loamy soils provide ideal conditions for most herbicide applications.",
+    "silty": "On silty soils, apply herbicides when soil moisture is optimal to prevent runoff.",
+    "peaty": "For peaty soils, consider using foliar-applied herbicides for better effectiveness."
+}
+
+# Temperature advice - above HOT_TEMPERATURE is "hot", below COLD_TEMPERATURE is "cold"
+HOT_TEMPERATURE = 30
+COLD_TEMPERATURE = 10
+TEMPERATURE_ADVICE = {
+    "hot": "⚠️ Avoid herbicide application during high temperatures (>30°C) to prevent volatilization and plant damage.",
+    "cold": "⚠️ Herbicides may be less effective in cold temperatures (<10°C). Wait for warmer conditions.",
+    "ideal": "✅ Current temperature is ideal for herbicide application."
+}
+
+# Crop-specific advice
+CROP_ADVICE = {
+    "wheat": "For wheat crops, consider using Axial or Puma Super for grass weed control.",
+    "corn": "In corn fields, use atrazine-based products for broadleaf weed control.",
+    "soyabean": "For soybeans, Flexstar or Roundup Ready systems work well for post-emergent control."
+}
+
+# Active ingredients, as named in WEED_INFO, of the products each crop's advice recommends; tank mixes with them rank
+# first for that crop. Axial (pinoxaden) controls none of the listed weeds, so it has no entry
+CROP_ADVICE_INGREDIENTS = {
+    "wheat": ["Fenoxaprop"],                 # Puma Super
+    "corn": ["Atrazine"],                    # atrazine-based products
+    "soyabean": ["Fomesafen", "Glyphosate"],  # Flexstar, Roundup Ready systems
+}
+
 # Enhanced pesticide recommendation engine
 def get_pesticide_recommendation(weed_type, soil_type, temperature, crop_type):
     try:
@@ -428,40 +871,501 @@ def get_pesticide_recommendation(weed_type, soil_type, temperature, crop_type):
         recommendations = []
         
         # Soil-specific advice
-        soil_advice = {
-            "clay": "For clay soil, add a surfactant to improve herbicide absorption and use higher application rates.",
-            "sandy": "On sandy soils, reduce application rates by 20% to prevent leaching and potential groundwater contamination.",
-            "loamy": "Loamy soils provide ideal conditions for most herbicide applications.",
-            "silty": "On silty soils, apply herbicides when soil moisture is optimal to prevent runoff.",
-            "peaty": "For peaty soils, consider using foliar-applied herbicides for better effectiveness."
-        }
-        if soil_type.lower() in soil_advice:
-            recommendations.append(soil_advice[soil_type.lower()])
+        if soil_type.lower() in SOIL_ADVICE:
+            recommendations.append(SOIL_ADVICE[soil_type.lower()])
         
         # Temperature advice
-        if temperature > 30:
-            recommendations.append("⚠️ Avoid herbicide application during high temperatures (>30°C) to prevent volatilization and plant damage.")
-        elif temperature < 10:
-            recommendations.append("⚠️ Herbicides may be less effective in cold temperatures (<10°C). Wait for warmer conditions.")
+        if temperature > HOT_TEMPERATURE:
+            recommendations.append(TEMPERATURE_ADVICE["hot"])
+        elif temperature < COLD_TEMPERATURE:
+            recommendations.append(TEMPERATURE_ADVICE["cold"])
         else:
-            recommendations.append("✅ Current temperature is ideal for herbicide application.")
+            recommendations.append(TEMPERATURE_ADVICE["ideal"])
         
         # Crop-specific advice
-        crop_advice = {
-            "wheat": "For wheat crops, consider using Axial or Puma Super for grass weed control.",
-            "corn": "In corn fields, use atrazine-based products for broadleaf weed control.",
-            "soyabean": "For soybeans, Flexstar or Roundup Ready systems work well for post-emergent control."
-        }
-        if crop_type.lower() in crop_advice:
-            recommendations.append(crop_advice[crop_type.lower()])
+        if crop_type.lower() in CROP_ADVICE:
+            recommendations.append(CROP_ADVICE[crop_type.lower()])
         
         return pesticides, general_rec, recommendations
     except Exception as e:
         st.error(f"❌ Error generating recommendations: {str(e)}")
         return [], "", []
 
+# Herbicide -> weeds bitset index for tank-mix selection (see herbicide_cover.py), built once per process
+@st.cache_resource
+def get_herbicide_index():
+    return HerbicideIndex(WEED_INFO, CROP_ADVICE_INGREDIENTS)
+
+# The soil, temperature and crop considerations get_pesticide_recommendation adds to every weed's advice
+def application_considerations(soil_type, temperature, crop_type):
+    return get_pesticide_recommendation(None, soil_type or "", temperature, crop_type or "")[2]
+
+# Result card for a single identification - one memoized HTML payload
+def render_result_card(predicted_class, confidence):
+    info = WEED_INFO.get(predicted_class, {})
+    with metrics.stage("render_result"):
+        st.markdown(result_card(predicted_class, confidence, info.get("icon", "🌿"), info.get("description", "")),
+                    unsafe_allow_html=True)
+
+# The most similar images confirmed earlier, searched with this image's embedding, and a button to confirm this one.
+# A fragment, so confirming does not rerun the page
+@st.fragment
+def render_similar_images(model, model_path, class_names, upload, predicted_class, confidence):
+    if not EMBEDDING_DIR:
+        return
+    key = get_prediction_cache().make_key(upload["bytes"], prediction_model_id(model, model_path))
+    embedding = get_recent_embeddings().get(key)
+    if embedding is None:
+        # Cascades, TFLite and the model server return no embeddings
+        return
+    store = get_embedding_store(model_path, len(embedding))
+    if store is None:
+        return
+    
+    image_hash = hashlib.sha256(upload["bytes"]).hexdigest()
+    with st.expander(f"🔎 Similar confirmed images ({len(store)} in the reference set)",
+                     expanded=confidence < SIMILAR_IMAGES_CONFIDENCE):
+        with metrics.stage("similarity_search"):
+            matches = store.search(embedding, k=SIMILAR_IMAGES, exclude={image_hash})[0]
+        if matches:
+            for col, (similarity, entry) in zip(st.columns(SIMILAR_IMAGES), matches):
+                if entry["thumbnail"]:
+                    col.image(entry["thumbnail"], use_column_width=True)
+                col.caption(f"{entry['species']} · {similarity:.2f}")
+        else:
+            st.caption("No other confirmed images yet - confirm identifications to build the reference set")
+        
+        if image_hash in store:
+            st.caption("✅ This image is in the reference set")
+            return
+        default = class_names.index(predicted_class) if predicted_class in class_names else 0
+        confirm_cols = st.columns([2, 1], vertical_alignment="bottom")
+        species = confirm_cols[0].selectbox("Confirmed species", class_names, index=default)
+        # Added in the click callback, before the rerun, so the reference set shown next already includes it
+        confirm_cols[1].button("✅ Confirm", use_container_width=True, on_click=store.add,
+                               args=(embedding, [species], [image_hash], [upload["image"]]))
+
+# Multi-image identification with batched inference and a sortable results table
+def render_batch_identification(model, model_path, class_names, model_name=None):
+    uploaded_images = st.file_uploader("Upload crop field images", 
+                                       type=['jpg', 'jpeg', 'png'],
+                                       accept_multiple_files=True,
+                                       label_visibility="collapsed")
+    batch_size = st.select_slider("Batch size", options=[1, 8, 16, 32, 64, 128], value=32)
+    
+    if not uploaded_images:
+        return
+    
+    st.caption(f"{len(uploaded_images)} images selected")
+    upload_id = tuple(uploaded.file_id for uploaded in uploaded_images)
+    if st.button("🔍 Identify Weeds", type="primary", use_container_width=True):
+        try:
+            st.session_state.batch_job = upload_id, submit_identify_job(
+                model, model_path, class_names, [uploaded.getvalue() for uploaded in uploaded_images], batch_size,
+                field=st.session_state.get("field"), model_name=model_name
+            )
+        except ServerBusy as e:
+            st.warning(f"⏳ {str(e)}")
+            return
+    
+    job = current_job("batch_job", upload_id)
+    if job is None:
+        return
+    results, total_time, paths = job.result()
+    
+    metric_cols = st.columns(3)
+    metric_cols[0].metric("Images", len(results))
+    metric_cols[1].metric("Total time", f"{total_time:.2f} s")
+    metric_cols[2].metric("Per image", f"{total_time / len(results) * 1000:.1f} ms")
+    
+    rows = [
+        {
+            "Image": uploaded.name,
+            "Weed": predicted_class,
+            "Confidence (%)": round(confidence * 100, 1),
+            "Path": path,
+        }
+        for uploaded, (predicted_class, confidence), path in zip(uploaded_images, results, paths)
+    ]
+    st.dataframe(rows, use_container_width=True, hide_index=True)
+    
+    # The most frequent species feeds the recommendation form, all of them the tank-mix panel
+    species = [predicted_class for predicted_class, _ in results]
+    st.session_state.predicted_weed = max(set(species), key=species.count)
+    st.session_state.detected_weeds = sorted(set(species))
+
+# Whole-field analysis: overlapping tiles classified in batches, with a weed density heatmap
+def render_field_analysis(model, class_names):
+    uploaded_field = st.file_uploader("Upload wide crop field image", 
+                                      type=['jpg', 'jpeg', 'png'],
+                                      label_visibility="collapsed")
+    settings = st.columns(3)
+    tile_size = settings[0].number_input("Tile size (px)", min_value=32, max_value=1024,
+                                         value=model_input_size(model)[0], step=8)
+    stride = settings[1].number_input("Stride (px)", min_value=8, max_value=1024,
+                                      value=tile_size // 2, step=8)
+    batch_size = settings[2].select_slider("Batch size", options=[16, 32, 64, 128, 256], value=64)
+    
+    if uploaded_field is not None and st.button("🗺️ Analyze Field", type="primary", use_container_width=True):
+        with st.spinner("🧠 Analyzing field tiles..."):
+            try:
+                st.session_state.field_analysis = uploaded_field.file_id, analyze_field(
+                    GovernedModel(model, get_inference_governor()), Image.open(uploaded_field), class_names,
+                    tile_size=tile_size, stride=stride, batch_size=batch_size
+                )
+            except ServerBusy as e:
+                st.warning(f"⏳ {str(e)}")
+                return
+            except Exception as e:
+                st.error(f"❌ Error analyzing field: {str(e)}")
+                return
+    
+    # Results are kept across reruns so the heatmap species can be switched without re-running inference
+    analyzed_file_id, analysis = st.session_state.get("field_analysis", (None, None))
+    if uploaded_field is None or analyzed_file_id != uploaded_field.file_id:
+        return
+    
+    coverage = analysis["coverage"]
+    heatmap_class = st.selectbox("Heatmap species", class_names,
+                                 index=class_names.index(next(iter(coverage))) if coverage else 0)
+    start = time.perf_counter()
+    heatmap = render_heatmap(analysis["pixels"],
+                             analysis["probabilities"][..., class_names.index(heatmap_class)])
+    heatmap_time = time.perf_counter() - start
+    st.image(heatmap, caption=f"{heatmap_class} density", use_column_width=True)
+    
+    rows, cols = analysis["grid"]
+    st.caption(f"{analysis['tile_count']} tiles ({rows} × {cols}) · "
+               f"{analysis['uncertain']:.1f}% of tiles below the confidence threshold")
+    st.dataframe(
+        [{"Weed": weed, "Coverage (%)": round(percent, 1)} for weed, percent in coverage.items()],
+        use_container_width=True, hide_index=True
+    )
+    
+    timings = {**analysis["timings"], "heatmap": heatmap_time}
+    timing_cols = st.columns(len(timings))
+    for col, (phase, seconds) in zip(timing_cols, timings.items()):
+        col.metric(phase.capitalize(), f"{seconds * 1000:.0f} ms")
+    
+    if coverage:
+        st.session_state.predicted_weed = next(iter(coverage))
+        st.session_state.detected_weeds = list(coverage)
+
+# Drone / tractor-cam video: overlapped decode, preprocess and batched inference
+def render_video_analysis(model, class_names):
+    uploaded_video = st.file_uploader("Upload field video", 
+                                      type=['mp4', 'mov', 'avi', 'mkv'],
+                                      label_visibility="collapsed")
+    settings = st.columns(3)
+    sample_fps = settings[0].number_input("Frames per second to sample", min_value=0.1, max_value=30.0,
+                                          value=2.0, step=0.5)
+    batch_size = settings[1].select_slider("Batch size", options=[8, 16, 32, 64], value=32)
+    min_confidence = settings[2].slider("Min confidence", min_value=0.0, max_value=1.0, value=0.5)
+    
+    if uploaded_video is None or not st.button("🎥 Analyze Video", type="primary", use_container_width=True):
+        return
+    
+    # OpenCV reads from a path, so the upload is spooled to a temporary file
+    suffix = os.path.splitext(uploaded_video.name)[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix) as video_file:
+        video_file.write(uploaded_video.getbuffer())
+        video_file.flush()
+        
+        try:
+            video_fps, frame_count = video_info(video_file.name)
+            expected_frames = max(1, frame_count // max(1, round(video_fps / sample_fps)))
+            # A fresh index per video, so frames only reuse predictions from earlier in the same video
+            near_duplicates = (NearDuplicateIndex(max_distance=NEAR_DUPLICATE_DISTANCE)
+                               if NEAR_DUPLICATE_DISTANCE >= 0 else None)
+            classifier = VideoClassifier(GovernedModel(model, get_inference_governor()), class_names,
+                                         sample_fps=sample_fps, batch_size=batch_size, near_duplicates=near_duplicates)
+            timeline = DetectionTimeline(min_confidence=min_confidence)
+            progress = st.progress(0.0, text="🧠 Analyzing video...")
+            start = time.perf_counter()
+            for detection in classifier.classify(video_file.name):
+                timeline.add(*detection)
+                if timeline.frames % batch_size == 0:
+                    progress.progress(min(1.0, timeline.frames / expected_frames),
+                                      text=f"🧠 Analyzed {timeline.frames} of ~{expected_frames} frames")
+            total_time = time.perf_counter() - start
+            progress.progress(1.0, text=f"✅ Analyzed {timeline.frames} frames in {total_time:.1f} s")
+        except ServerBusy as e:
+            st.warning(f"⏳ {str(e)}")
+            return
+        except Exception as e:
+            st.error(f"❌ Error analyzing video: {str(e)}")
+            return
+    
+    fps_cols = st.columns(5)
+    fps_cols[0].metric("Overall", f"{timeline.frames / total_time:.1f} fps")
+    for col, (stage, stats) in zip(fps_cols[1:], classifier.stats.items()):
+        col.metric(stage.capitalize(), f"{stats.fps:.1f} fps")
+    if near_duplicates is not None:
+        fps_cols[4].metric("Near-duplicate frames", f"{near_duplicates.skip_rate * 100:.0f}%")
+    
+    summary = timeline.summary()
+    st.markdown("**Species found**")
+    st.dataframe(
+        [
+            {
+                "Weed": row["species"],
+                "Frames": row["frames"],
+                "Share (%)": round(row["share"], 1),
+                "Mean confidence (%)": round(row["mean_confidence"] * 100, 1),
+                "First seen (s)": round(row["first_seen"], 1),
+            }
+            for row in summary
+        ],
+        use_container_width=True, hide_index=True
+    )
+    st.markdown("**Detection timeline**")
+    st.dataframe(
+        [
+            {
+                "Start (s)": round(segment["start"], 1),
+                "End (s)": round(segment["end"], 1),
+                "Weed": segment["species"],
+                "Frames": segment["frames"],
+            }
+            for segment in timeline.segments
+        ],
+        use_container_width=True, hide_index=True
+    )
+    
+    if summary:
+        st.session_state.predicted_weed = summary[0]["species"]
+        st.session_state.detected_weeds = [row["species"] for row in summary]
+
+# Prometheus text export of the stage metrics, rewritten after every script run when set
+METRICS_FILE = os.environ.get("WEEDAI_METRICS_FILE")
+
+# Per-stage latency histograms and on-demand profiling of a single request
+def render_debug_panel():
+    with st.expander("🩺 Performance Debug", expanded=False):
+        metrics.enabled = st.toggle("Collect stage timings", value=metrics.enabled)
+        
+        stats = metrics.snapshot()
+        if stats:
+            st.dataframe(
+                [
+                    {
+                        "Stage": name,
+                        "Count": stage["count"],
+                        "p50 (ms)": round(stage[0.5] * 1000, 2),
+                        "p95 (ms)": round(stage[0.95] * 1000, 2),
+                        "p99 (ms)": round(stage[0.99] * 1000, 2),
+                    }
+                    for name, stage in sorted(stats.items())
+                ],
+                use_container_width=True, hide_index=True
+            )
+            debug_cols = st.columns(2)
+            debug_cols[0].download_button("⬇️ Prometheus", metrics.prometheus_text(),
+                                          file_name="weedai_metrics.prom", use_container_width=True)
+            if debug_cols[1].button("Reset", use_container_width=True):
+                metrics.reset()
+        elif metrics.enabled:
+            st.caption("No requests timed yet")
+        
+        profiler = st.radio("Profile the next request", ["cProfile", "TensorFlow trace"], horizontal=True)
+        if st.button("🎯 Arm profiler", use_container_width=True):
+            metrics.arm_profile("cprofile" if profiler == "cProfile" else "tensorflow")
+        if metrics.armed_profile:
+            st.info(f"Profiler armed: the next identify or recommend request is captured with {metrics.armed_profile}")
+        
+        if metrics.last_profile:
+            st.caption(f"Last {metrics.last_profile['kind']} profile ({metrics.last_profile['label']}): "
+                       f"{metrics.last_profile['path']}")
+            st.code(metrics.last_profile["summary"], language=None)
+
+# Recommendation panel - a fragment, so its widgets rerun only this panel and not the image pipeline
+@st.fragment
+def render_recommendation_panel():
+    with st.container():
+        st.markdown("""
+        <h3 style="display:flex;align-items:center;gap:0.5rem">
+            <span style="background:var(--accent);color:white;width:40px;height:40px;display:flex;align-items:center;justify-content:center;border-radius:50%">🧪</span>
+            Control Recommendations
+        </h3>
+        """, unsafe_allow_html=True)
+        
+        with st.form("recommendation_form"):
+            soil_type = st.selectbox("Soil Type", 
+                                   ["Select", "Clay", "Loamy", "Sandy", "Silty", "Peaty"],
+                                   index=0)
+            
+            temperature = st.slider("Temperature (°C)", 
+                                  min_value=-10, max_value=50, value=25)
+            
+            default_weed = st.session_state.get('predicted_weed', '')
+            weed_type = st.text_input("Weed Type", 
+                                     value=default_weed if default_weed else "",
+                                     placeholder="Detected automatically")
+            
+            crop_type = st.text_input("Crop Type", 
+                                    placeholder="e.g., Wheat, Corn, Soyabean")
+            
+            st.markdown("<div style='height:10px'></div>", unsafe_allow_html=True)
+            
+            if st.form_submit_button("Get Custom Recommendations", type="primary", use_container_width=True):
+                if not all([soil_type != "Select", weed_type, crop_type]):
+                    st.warning("Please fill all fields")
+                else:
+                    with metrics.profile_request("recommend"), metrics.stage("recommend_total"), st.spinner("🔍 Generating recommendations..."):
+                        with metrics.stage("recommend"):
+                            pesticides, general_rec, specific_recs = get_pesticide_recommendation(
+                                weed_type, soil_type, temperature, crop_type
+                            )
+                        
+                        history = get_history_store()
+                        if history is not None:
+                            history.record_recommendation(weed_type, soil_type, temperature, crop_type, pesticides,
+                                                          field=st.session_state.get("field"))
+                        
+                        # Display recommendations with enhanced design
+                        with metrics.stage("render_recommendation"):
+                            st.markdown(recommendation_card(tuple(pesticides), general_rec, tuple(specific_recs)),
+                                        unsafe_allow_html=True)
+
+# Tank-mix panel - the fewest herbicides that control every detected weed, under crop, soil and temperature limits
+@st.fragment
+def render_tank_mix_panel():
+    index = get_herbicide_index()
+    with st.container():
+        st.markdown("""
+        <h3 style="display:flex;align-items:center;gap:0.5rem">
+            <span style="background:var(--accent);color:white;width:40px;height:40px;display:flex;align-items:center;justify-content:center;border-radius:50%">🛢️</span>
+            Tank Mix
+        </h3>
+        """, unsafe_allow_html=True)
+        
+        detected = [weed for weed in st.session_state.get("detected_weeds", []) if weed in WEED_INFO]
+        weeds = st.multiselect("Weeds to control", index.weeds, default=detected,
+                               placeholder="Detected automatically")
+        constraint_cols = st.columns(2)
+        crop_type = constraint_cols[0].selectbox("Crop", ["Any", "Wheat", "Corn", "Soyabean"], key="tank_mix_crop")
+        soil_type = constraint_cols[1].selectbox("Soil", ["Any", "Clay", "Loamy", "Sandy", "Silty", "Peaty"],
+                                                 key="tank_mix_soil")
+        temperature = st.slider("Temperature (°C)", min_value=-10, max_value=50, value=25, key="tank_mix_temperature")
+        exclude = st.multiselect("Products to leave out", index.herbicides, key="tank_mix_exclude",
+                                 placeholder="None - e.g. products unsafe on this crop")
+        
+        if not weeds:
+            st.caption("Identify weeds or pick them above to find the smallest covering tank mix")
+            return
+        
+        with metrics.stage("tank_mix"):
+            cover = index.minimal_covers(weeds, crop_type, exclude)
+        
+        if cover["combinations"]:
+            size = len(cover["combinations"][0])
+            st.markdown(f"**{size} {'products cover' if size > 1 else 'product covers'} "
+                        f"{len(weeds) - len(cover['uncovered'])} of {len(weeds)} weeds**")
+            st.markdown(tank_mix_options(tuple(cover["combinations"])), unsafe_allow_html=True)
+        if cover["uncovered"]:
+            st.warning(f"No herbicide left in the mix controls {', '.join(cover['uncovered'])}")
+        
+        # The same application advice as the single-weed recommendation card
+        considerations = application_considerations(soil_type, temperature, crop_type)
+        if considerations:
+            st.markdown("\n".join(f"- {consideration}" for consideration in considerations))
+
+# Season history dashboard - reads the weekly rollup, so it stays quick however many predictions are stored
+@st.fragment
+def render_history_dashboard():
+    store = get_history_store()
+    if store is None:
+        st.info("History is switched off - set WEEDAI_HISTORY_DB to a database path to record identifications")
+        return
+    
+    filters = st.columns(2)
+    field = filters[0].selectbox("Show field", ["All fields", *store.fields()])
+    field = None if field == "All fields" else field
+    weeks = filters[1].slider("Weeks", min_value=1, max_value=52, value=12)
+    since = time.time() - weeks * 7 * 24 * 3600
+    
+    with metrics.stage("history_query"):
+        weekly = store.weekly_species_counts(field, since=since)
+        totals = store.species_totals(field, since=since)
+    if not totals:
+        st.caption("No identifications recorded in this period yet")
+        return
+    
+    metric_cols = st.columns(3)
+    metric_cols[0].metric("Identifications", sum(count for _, count, _ in totals))
+    metric_cols[1].metric("Species", len(totals))
+    metric_cols[2].metric("Most frequent", totals[0][0])
+    
+    st.markdown("**Identifications per week**")
+    st.bar_chart([{"Week": week, "Species": species, "Count": count} for week, species, count, _ in weekly],
+                 x="Week", y="Count", color="Species")
+    st.dataframe(
+        [
+            {"Weed": species, "Count": count, "Mean confidence (%)": round(mean_confidence * 100, 1)}
+            for species, count, mean_confidence in totals
+        ],
+        use_container_width=True, hide_index=True
+    )
+    
+    with st.expander("Recent activity"):
+        st.dataframe(
+            [
+                {
+                    "Time": time.strftime("%Y-%m-%d %H:%M", time.localtime(ts)),
+                    "Field": row_field,
+                    "Weed": species,
+                    "Confidence (%)": round(confidence * 100, 1),
+                    "Model": model_version,
+                    "Image": image_hash[:12],
+                }
+                for ts, row_field, species, confidence, model_version, image_hash, _ in store.recent_predictions(field, 50)
+            ],
+            use_container_width=True, hide_index=True
+        )
+        st.dataframe(
+            [
+                {
+                    "Time": time.strftime("%Y-%m-%d %H:%M", time.localtime(ts)),
+                    "Field": row_field,
+                    "Weed": weed_type,
+                    "Soil": soil_type,
+                    "Temperature (°C)": temperature,
+                    "Crop": crop_type,
+                    "Herbicides": herbicides,
+                }
+                for ts, row_field, weed_type, soil_type, temperature, crop_type, herbicides
+                in store.recent_recommendations(field, 50)
+            ],
+            use_container_width=True, hide_index=True
+        )
+    
+    stats = store.stats()
+    st.caption(f"{stats['written']} rows written in {stats['batches']} batches since startup · "
+               f"{stats['pending']} pending · {stats['dropped']} dropped")
+
 # Main application with enhanced modern layout
 def main():
+    # Set page config with enhanced visuals
+    st.set_page_config(
+        page_title="🌿 AI-Powered Crop Weed Management",
+        page_icon="🌱",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+    
+    registry = get_model_registry()
+    default_model_path = start_model_preloading()
+    
+    set_custom_style()
+    
+    # App header with enhanced design
+    st.markdown("""
+    <div class="header animate-fade-in">
+        <h1 style="margin:0;font-size:2.8rem;font-weight:700">🌿 AI-Powered Crop Weed Management</h1>
+        <p style="margin:10px 0 0;font-size:1.3rem;opacity:0.9">Smart weed identification and precision control recommendations</p>
+    </div>
+    """, unsafe_allow_html=True)
+    
     # Sidebar with enhanced design
     with st.sidebar:
         st.markdown("""
@@ -473,17 +1377,85 @@ def main():
         
         # Model information
         with st.expander("⚙️ Model Information", expanded=True):
-            model = load_model(DEFAULT_MODEL_PATH)
+            model_name = st.selectbox("Model", registry.names, disabled=len(registry.names) == 1)
+            model_spec = registry.specs[model_name]
+            model_path, class_names = model_spec.path, model_spec.class_names
+            if model_spec.description:
+                st.caption(model_spec.description)
+            with st.spinner("⏳ Warming up model..."):
+                model = registry.get(model_name)
+            if model and CASCADE_FIRST_STAGE and st.toggle(
+                    "⚡ Cascade with a fast first stage", value=CASCADE_ENABLED,
+                    help="Only images the first-stage model is unsure about go to the full model"):
+                threshold = st.slider("Escalation threshold", min_value=0.5, max_value=0.99,
+                                      value=CASCADE_THRESHOLD, step=0.01)
+                model = get_cascade(model, model_name, threshold)
             if model:
                 st.success("✅ Model loaded successfully!")
                 st.markdown(f"""
                 <div class="highlight">
-                    <span style="font-weight:600">Input shape:</span> {model.input_shape[1:]}
+                    <span style="font-weight:600">Input shape:</span> {model.input_shape[1:]} · {len(class_names)} classes
                 </div>
                 """, unsafe_allow_html=True)
+                
+                if isinstance(model, Cascade):
+                    st.markdown(f"""
+                    <div class="highlight">
+                        <span style="font-weight:600">Cascade ({model.first_stage_name}):</span> {model.first_stage_answers} answered by the first stage · {model.escalations} escalated ({model.escalation_rate * 100:.0f}%)
+                    </div>
+                    """, unsafe_allow_html=True)
+                
+                if isinstance(model, ModelServerClient):
+                    st.markdown(f"""
+                    <div class="highlight">
+                        <span style="font-weight:600">Model server:</span> {MODEL_SERVER_ADDRESS}
+                    </div>
+                    """, unsafe_allow_html=True)
+                
+                registry_stats = registry.stats()
+                st.markdown(f"""
+                <div class="highlight">
+                    <span style="font-weight:600">Model registry:</span> {registry_stats['loaded']}/{registry_stats['models']} loaded · {registry_stats['resident_bytes'] / 2**20:.0f}/{registry_stats['memory_budget_bytes'] / 2**20:.0f} MB · {registry_stats['hits']} hits · {registry_stats['loads']} loads ({registry_stats['load_seconds']:.1f} s) · {registry_stats['evictions']} evictions
+                </div>
+                """, unsafe_allow_html=True)
+                
+                preloader = (get_model_preloader(default_model_path) if default_model_path.endswith(".keras")
+                             and not served_by_model_server(default_model_path) else None)
+                if preloader and preloader.ready and preloader.timings:
+                    timings = preloader.timings
+                    st.markdown(f"""
+                    <div class="highlight">
+                        <span style="font-weight:600">Startup ({preloader.loaded_from}):</span> imports {timings['imports']:.2f}s · load {timings['artifact_load']:.2f}s · first predict {timings['first_predict']:.2f}s
+                    </div>
+                    """, unsafe_allow_html=True)
+                
+                cache = get_prediction_cache()
+                st.markdown(f"""
+                <div class="highlight">
+                    <span style="font-weight:600">Prediction cache:</span> {cache.hits} hits · {cache.misses} misses · {len(cache)}/{cache.max_entries} entries
+                </div>
+                """, unsafe_allow_html=True)
+                
+                governor = get_inference_governor().stats()
+                st.markdown(f"""
+                <div class="highlight">
+                    <span style="font-weight:600">Inference:</span> {governor['running']}/{governor['max_concurrent']} running · {governor['queued']} queued · {governor['admitted']} admitted · {governor['rejected']} rejected · {governor['timed_out']} timed out · wait p95 {governor['wait_p95'] * 1000:.0f} ms
+                </div>
+                """, unsafe_allow_html=True)
+                
+                if NEAR_DUPLICATE_DISTANCE >= 0:
+                    index = get_near_duplicate_index(prediction_model_id(model, model_path),
+                                                     st.session_state.get("field") or DEFAULT_FIELD)
+                    st.markdown(f"""
+                    <div class="highlight">
+                        <span style="font-weight:600">Near duplicates (≤{index.max_distance} bits):</span> {index.skips}/{index.lookups} skipped ({index.skip_rate * 100:.0f}%) · {len(index)}/{index.max_entries} hashes
+                    </div>
+                    """, unsafe_allow_html=True)
             else:
                 st.error("Model failed to load")
         
+        render_debug_panel()
+        
         # Quick guide
         with st.expander("📚 How to Use", expanded=True):
             st.markdown("""
@@ -521,174 +1493,91 @@ def main():
             </div>
             """, unsafe_allow_html=True)
 
-    # Main content columns
-    col1, col2 = st.columns([2, 1], gap="large")
+    # Identification and season history tabs
+    identify_tab, history_tab = st.tabs(["🔍 Identify", "📊 History"])
     
-    with col1:
-        # Weed identification card
-        with st.container():
-            st.markdown("""
-            <h3 style="display:flex;align-items:center;gap:0.5rem">
-                <span style="background:var(--primary);color:white;width:40px;height:40px;display:flex;align-items:center;justify-content:center;border-radius:50%">📷</span>
-                Weed Identification
-            </h3>
-            """, unsafe_allow_html=True)
-            
-            uploaded_image = st.file_uploader("Upload crop field image", 
-                                           type=['jpg', 'jpeg', 'png'],
-                                           label_visibility="collapsed")
-            
-            if uploaded_image is not None and model:
-                image = Image.open(uploaded_image)
-                st.image(image, caption="Uploaded Image", use_column_width=True)
-                
-                # Define all weed classes
-                class_names = [
-                    "Carpetweeds", "Crabgrass", "Eclipta", "Goosegrass", 
-                    "Morningglory", "Nutsedge", "PalmerAmaranth", "Prickly Sida",
-                    "Purslane", "Ragweed", "Sicklepod", "SpottedSpurge",
-                    "SpurredAnoda", "Swinecress", "Waterhemp"
-                ]
-                
-                if st.button("🔍 Identify Weed", type="primary", use_container_width=True):
-                    with st.spinner("🧠 Analyzing weed..."):
-                        image_array = preprocess_image(image)
-                        predicted_class, confidence = classify_weed(model, image_array, class_names)
-                        
-                        if predicted_class and confidence:
-                            st.session_state.predicted_weed = predicted_class
-                            
-                            # Display results in a beautiful card
-                            weed_icon = WEED_INFO.get(predicted_class, {}).get("icon", "🌿")
-                            with st.container():
-                                st.markdown(f"""
-                                <div class="card animate-fade-in">
-                                    <div style="display:flex;align-items:center;gap:1.5rem;margin-bottom:1.5rem">
-                                        <div style="width:60px;height:60px;background:linear-gradient(135deg, var(--primary-light), var(--primary));color:white;display:flex;align-items:center;justify-content:center;border-radius:50%;font-size:2rem;box-shadow:0 4px 10px rgba(0,0,0,0.1)">
-                                            {weed_icon}
-                                        </div>
-                                        <div style="flex-grow:1">
-                                            <h3 style="margin:0;font-size:1.5rem;color:var(--primary-dark)">{predicted_class}</h3>
-                                            <div style="display:flex;align-items:center;gap:0.8rem;margin-top:0.5rem">
-                                                <div style="flex-grow:1;background:#e0e0e0;border-radius:10px;height:10px;overflow:hidden">
-                                                    <div style="width:{confidence*100:.0f}%;background:linear-gradient(90deg, var(--primary), var(--primary-light));height:100%;border-radius:10px"></div>
-                                                </div>
-                                                <span style="font-weight:600;color:var(--primary-dark)">{confidence*100:.1f}% Confidence</span>
-                                            </div>
-                                        </div>
-                                    </div>
-                                    <div style="background:rgba(129, 199, 132, 0.1);border-radius:10px;padding:1rem;border-left:4px solid var(--primary)">
-                                        <p style="margin:0;font-size:1.05rem">{WEED_INFO.get(predicted_class, {}).get('description', '')}</p>
-                                    </div>
-                                </div>
-                                """, unsafe_allow_html=True)
-    
-    with col2:
-        # Recommendation card
-        if 'predicted_weed' in st.session_state or model:
+    with identify_tab:
+        # Main content columns
+        col1, col2 = st.columns([2, 1], gap="large")
+        
+        with col1:
+            # Weed identification card
             with st.container():
                 st.markdown("""
                 <h3 style="display:flex;align-items:center;gap:0.5rem">
-                    <span style="background:var(--accent);color:white;width:40px;height:40px;display:flex;align-items:center;justify-content:center;border-radius:50%">🧪</span>
-                    Control Recommendations
+                    <span style="background:var(--primary);color:white;width:40px;height:40px;display:flex;align-items:center;justify-content:center;border-radius:50%">📷</span>
+                    Weed Identification
                 </h3>
                 """, unsafe_allow_html=True)
                 
-                with st.form("recommendation_form"):
-                    soil_type = st.selectbox("Soil Type", 
-                                           ["Select", "Clay", "Loamy", "Sandy", "Silty", "Peaty"],
-                                           index=0)
-                    
-                    temperature = st.slider("Temperature (°C)", 
-                                          min_value=-10, max_value=50, value=25)
-                    
-                    default_weed = st.session_state.get('predicted_weed', '')
-                    weed_type = st.text_input("Weed Type", 
-                                             value=default_weed if default_weed else "",
-                                             placeholder="Detected automatically")
-                    
-                    crop_type = st.text_input("Crop Type", 
-                                            placeholder="e.g., Wheat, Corn, Soyabean")
+                st.text_input("Field", value=DEFAULT_FIELD, key="field",
+                              help="Field or plot name, recorded with every identification and recommendation")
+                
+                mode = st.radio("Mode", ["📷 Single image", "📂 Multiple images", "🗺️ Field analysis", "🎥 Video"],
+                                horizontal=True, label_visibility="collapsed")
+                
+                uploaded_image = None
+                if mode == "📂 Multiple images":
+                    if model:
+                        render_batch_identification(model, model_path, class_names, model_name)
+                elif mode == "🗺️ Field analysis":
+                    if model:
+                        render_field_analysis(model, class_names)
+                elif mode == "🎥 Video":
+                    if model:
+                        render_video_analysis(model, class_names)
+                else:
+                    uploaded_image = st.file_uploader("Upload crop field image", 
+                                                   type=['jpg', 'jpeg', 'png'],
+                                                   label_visibility="collapsed")
+                
+                upload = get_upload(uploaded_image, model_input_size(model)) if uploaded_image is not None and model else None
+                if upload is not None:
+                    with metrics.stage("display_image"):
+                        st.image(upload["thumbnail"], caption="Uploaded Image", use_column_width=True)
                     
-                    st.markdown("<div style='height:10px'></div>", unsafe_allow_html=True)
+                    upload_id = uploaded_image.file_id
+                    if st.button("🔍 Identify Weed", type="primary", use_container_width=True):
+                        try:
+                            st.session_state.identify_job = upload_id, submit_identify_job(
+                                model, model_path, class_names, [upload["bytes"]], image_batch=upload["tensor"],
+                                field=st.session_state.get("field"), model_name=model_name
+                            )
+                        except ServerBusy as e:
+                            st.session_state.pop("identify_job", None)
+                            st.warning(f"⏳ {str(e)}")
                     
-                    if st.form_submit_button("Get Custom Recommendations", type="primary", use_container_width=True):
-                        if not all([soil_type != "Select", weed_type, crop_type]):
-                            st.warning("Please fill all fields")
-                        else:
-                            with st.spinner("🔍 Generating recommendations..."):
-                                pesticides, general_rec, specific_recs = get_pesticide_recommendation(
-                                    weed_type, soil_type, temperature, crop_type
-                                )
-                                
-                                # Display recommendations with enhanced design
-                                with st.container():
-                                    st.markdown("""
-                                    <div class="card animate-fade-in">
-                                        <div style="display:flex;align-items:center;gap:1rem;margin-bottom:1rem">
-<div style="width:40px;height:40px;background:linear-gradient(135deg, var(--accent-light), var(--accent));color:white;display:flex;align-items:center;justify-content:center;border-radius:50%;font-size:1.2rem">🧪</div>
-                                            <h4 style="margin:0;color:var(--accent-dark);font-size:1.3rem">Recommended Treatment</h4>
-                                        </div>
-                                    """, unsafe_allow_html=True)
-                                    
-                                    if pesticides:
-                                        st.markdown("""
-                                        <div style="background:rgba(255, 255, 255, 0.7);border-radius:10px;padding:1rem;margin-bottom:1rem">
-                                            <h5 style="margin-top:0;color:var(--primary-dark);display:flex;align-items:center;gap:0.5rem">
-                                                <span style="color:var(--accent)">🧪</span> Recommended Herbicides
-                                            </h5>
-                                            <div style="display:flex;flex-wrap:wrap;gap:0.5rem">
-                                        """, unsafe_allow_html=True)
-                                        
-                                        for pesticide in pesticides:
-                                            st.markdown(f"""
-                                                <span class="herbicide-pill">{pesticide}</span>
-                                            """, unsafe_allow_html=True)
-                                        
-                                        st.markdown("</div></div>", unsafe_allow_html=True)
-                                        
-                                        st.markdown("""
-                                        <div style="background:rgba(255, 255, 255, 0.7);border-radius:10px;padding:1rem;margin-bottom:1rem">
-                                            <h5 style="margin-top:0;color:var(--primary-dark);display:flex;align-items:center;gap:0.5rem">
-                                                <span style="color:var(--accent)">💡</span> Application Advice
-                                            </h5>
-                                        """, unsafe_allow_html=True)
-                                        st.info(general_rec)
-                                        st.markdown("</div>", unsafe_allow_html=True)
-                                        
-                                        if specific_recs:
-                                            st.markdown("""
-                                            <div style="background:rgba(255, 255, 255, 0.7);border-radius:10px;padding:1rem;margin-bottom:1rem">
-                                                <h5 style="margin-top:0;color:var(--primary-dark);display:flex;align-items:center;gap:0.5rem">
-                                                    <span style="color:var(--accent)">🌦️</span> Environmental Considerations
-                                                </h5>
-                                                <ul style="margin-bottom:0">
-                                            """, unsafe_allow_html=True)
-                                            
-                                            for rec in specific_recs:
-                                                st.markdown(f"<li>{rec}</li>", unsafe_allow_html=True)
-                                            
-                                            st.markdown("</ul></div>", unsafe_allow_html=True)
-                                        
-                                        st.markdown("""
-                                        <div style="background:rgba(255, 143, 0, 0.1);border-radius:10px;padding:1rem;border-left:4px solid var(--accent)">
-                                            <h5 style="margin-top:0;color:var(--accent-dark);display:flex;align-items:center;gap:0.5rem">
-                                                <span style="color:var(--accent)">⚠️</span> Safety Precautions
-                                            </h5>
-                                            <ul style="margin-bottom:0">
-                                                <li>Wear protective clothing, gloves, and eye protection</li>
-                                                <li>Avoid application on windy days (wind speed > 10 mph)</li>
-                                                <li>Follow manufacturer's instructions precisely</li>
-                                                <li>Observe pre-harvest intervals for food safety</li>
-                                                <li>Store pesticides in original containers away from children</li>
-                                            </ul>
-                                        </div>
-                                        """, unsafe_allow_html=True)
-                                    else:
-                                        st.warning("No specific recommendations available for this weed type")
-                                    
-                                    st.markdown("</div>", unsafe_allow_html=True)
+                    job = current_job("identify_job", upload_id)
+                    if job is not None:
+                        results, _, paths = job.result()
+                        predicted_class, confidence = results[0]
+                        if predicted_class and confidence:
+                            st.session_state.predicted_weed = predicted_class
+                            st.session_state.detected_weeds = [predicted_class]
+                            
+                            # Display results in a beautiful card
+                            render_result_card(predicted_class, confidence)
+                            render_similar_images(model, model_path, class_names, upload, predicted_class, confidence)
+                            if paths[0] == PATH_NEAR_DUPLICATE:
+                                st.caption("♻️ Near-duplicate of a recently classified image - its prediction was reused")
+                            elif isinstance(model, Cascade):
+                                st.caption(f"⚡ Answered by the {paths[0]}" if paths[0] == PATH_FIRST_STAGE
+                                           else f"🧠 Path: {paths[0]}")
+        
+        with col2:
+            # Recommendation card
+            if 'predicted_weed' in st.session_state or model:
+                render_recommendation_panel()
+                render_tank_mix_panel()
+    
+    with history_tab:
+        render_history_dashboard()
 
 if __name__ == "__main__":
+    # Outside main() and any page element, so without serve_app.py the model at least loads while the first page is built
+    start_model_preloading()
     main()
+    
+    if metrics.enabled and METRICS_FILE:
+        metrics.write_prometheus(METRICS_FILE)
   
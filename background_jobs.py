@@ -0,0 +1,98 @@
+"""Background inference jobs that outlive Streamlit reruns.
+
+Every widget interaction reruns the app script from the top, so inference
+cannot run inside the script without blocking the session. Jobs are
+submitted to a worker pool shared by all sessions instead. The script keeps
+the returned `Job` in `st.session_state` and polls it. Submitting a key that
+is already in flight returns the existing job rather than starting a
+duplicate. With `max_in_flight`, a submission beyond that many unfinished
+jobs raises `JobQueueFull` instead of waiting in an unbounded queue.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobQueueFull(RuntimeError):
+    pass
+
+
+class Job:
+    def __init__(self, key, label):
+        self.key = key
+        self.label = label
+        self.status = "queued"
+        # Updated by the job body, 0.0 to 1.0
+        self.progress = 0.0
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+
+    @property
+    def done(self):
+        return self.future is not None and self.future.done()
+
+    @property
+    def elapsed(self):
+        end = self.finished_at or time.monotonic()
+        return end - self.submitted_at
+
+    @property
+    def error(self):
+        return self.future.exception() if self.done else None
+
+    def result(self):
+        return self.future.result()
+
+
+class JobManager:
+    def __init__(self, max_workers=2, max_finished=64, max_in_flight=None):
+        self.max_finished = max_finished
+        self.max_in_flight = max_in_flight
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="weedai-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    # fn(job, *args) runs on the pool; an in-flight job with the same key is returned instead.
+    # Raises JobQueueFull when max_in_flight jobs are unfinished
+    def submit(self, key, label, fn, *args):
+        with self._lock:
+            existing = self._jobs.get(key)
+            if existing is not None and not existing.done:
+                return existing
+            in_flight = sum(1 for job in self._jobs.values() if not job.done)
+            if self.max_in_flight is not None and in_flight >= self.max_in_flight:
+                raise JobQueueFull(f"{in_flight} jobs are already running or queued")
+
+            job = Job(key, label)
+            job.future = self._executor.submit(self._run, job, fn, args)
+            self._jobs[key] = job
+            self._jobs.move_to_end(key)
+            self._prune()
+            return job
+
+    @property
+    def in_flight(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if not job.done)
+
+    def _run(self, job, fn, args):
+        job.status = "running"
+        job.started_at = time.monotonic()
+        try:
+            result = fn(job, *args)
+            job.status = "done"
+            job.progress = 1.0
+            return result
+        except Exception:
+            job.status = "failed"
+            raise
+        finally:
+            job.finished_at = time.monotonic()
+
+    def _prune(self):
+        finished = [key for key, job in self._jobs.items() if job.done]
+        for key in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[key]
@@ -0,0 +1,62 @@
+"""Latency of plain model.predict against the compiled, retrace-free inference function.
+
+Batch sizes deliberately include ones that are not bucket sizes, to show the
+compiled function never retraces. The last case feeds images of another size.
+CompiledModel resizes them to the model's input size before the compiled
+call, so they do not retrace either:
+
+    python benchmarks/bench_compiled.py --min-time 1.0
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from compiled_inference import CompiledModel
+from run_benchmarks import measure
+from standin_model import load_or_build
+
+BATCH_SIZES = [1, 3, 8, 17, 32, 64]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="model.predict vs compiled inference")
+    parser.add_argument("--model", default="crop_weed_classifier_final.keras",
+                        help="model to benchmark; a synthetic stand-in is used if it does not exist")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds to spend on each case")
+    args = parser.parse_args()
+
+    model, description = load_or_build(args.model)
+    height, width = model.input_shape[1:3]
+    rng = np.random.default_rng(0)
+    images = rng.random((max(BATCH_SIZES), height, width, 3), dtype=np.float32)
+    odd_size = rng.random((4, height + 37, width - 21, 3), dtype=np.float32)
+
+    variants = {
+        "model.predict": model,
+        "compiled": CompiledModel(model).warm_up(),
+        "compiled + XLA": CompiledModel(model, jit_compile=True).warm_up(),
+    }
+    print(f"model: {description}\n")
+    print(f"{'batch':>8}" + "".join(f"{name:>18}" for name in variants) + "   (median ms)")
+    for batch_size in BATCH_SIZES:
+        batch = images[:batch_size]
+        row = [measure(lambda: variant.predict(batch, batch_size=batch_size, verbose=0),
+                       batch_size, min_time=args.min_time)["median_ms"]
+               for variant in variants.values()]
+        print(f"{batch_size:>8}" + "".join(f"{ms:>18.2f}" for ms in row))
+
+    # model.predict cannot take a different spatial size; CompiledModel resizes before calling the compiled function
+    for name, variant in variants.items():
+        if isinstance(variant, CompiledModel):
+            stats = measure(lambda: variant.predict(odd_size), len(odd_size), min_time=args.min_time)
+            print(f"\n{name}: {stats['median_ms']:.2f} ms for 4 images at {height + 37}x{width - 21} "
+                  f"(resized before the compiled call), traces so far: {variant.traces}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Latency of the tank-mix cover search.
+
+Draws random sets of detected weeds with a random crop and a few randomly
+excluded products. Each query is timed three ways: a brute-force search over
+herbicide combinations held as Python sets, the bitset index on a cold
+cache, and the bitset index again once its answers are memoized. The first
+two must agree on the minimal mix size:
+
+    python benchmarks/bench_cover.py --queries 2000 --max-weeds 8
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from itertools import combinations
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.disable(logging.WARNING)
+
+from app import CROP_ADVICE_INGREDIENTS, WEED_INFO
+from herbicide_cover import build_index
+
+
+# Smallest mix size by trying every combination of allowed herbicides, smallest first
+def brute_force_size(index, weeds, allowed_mask):
+    allowed = [herbicide for j, herbicide in enumerate(index.herbicides) if allowed_mask >> j & 1]
+    controls = {herbicide: {weed for weed, info in WEED_INFO.items() if herbicide in info["pesticides"]}
+                for herbicide in allowed}
+    target = set(weeds) & set().union(*controls.values())
+    if not target:
+        return 0
+    for size in range(1, len(allowed) + 1):
+        for mix in combinations(allowed, size):
+            if target <= set().union(*(controls[herbicide] for herbicide in mix)):
+                return size
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tank-mix cover search latency")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--max-weeds", type=int, default=8)
+    parser.add_argument("--max-excluded", type=int, default=6, help="products left out of each query, at most")
+    parser.add_argument("--brute-force-queries", type=int, default=200,
+                        help="queries also answered by brute force; it is slow for large weed sets")
+    args = parser.parse_args()
+
+    index = build_index()
+    rng = np.random.default_rng(0)
+    crops = [None, *CROP_ADVICE_INGREDIENTS]
+    queries = []
+    for _ in range(args.queries):
+        weeds = list(rng.choice(index.weeds, size=rng.integers(1, args.max_weeds + 1), replace=False))
+        exclude = list(rng.choice(index.herbicides, size=rng.integers(0, args.max_excluded + 1), replace=False))
+        queries.append((weeds, crops[rng.integers(len(crops))], exclude))
+    print(f"{len(index.weeds)} weeds, {len(index.herbicides)} herbicides, {len(queries)} queries of "
+          f"1-{args.max_weeds} weeds")
+
+    start = time.perf_counter()
+    cold = [index.minimal_covers(*query) for query in queries]
+    cold_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for query in queries:
+        index.minimal_covers(*query)
+    warm_time = time.perf_counter() - start
+
+    checked = queries[:args.brute_force_queries]
+    start = time.perf_counter()
+    sizes = [brute_force_size(index, weeds, index.allowed_mask(exclude)) for weeds, _, exclude in checked]
+    brute_time = time.perf_counter() - start
+    mismatches = sum(size != len(result["combinations"][0] if result["combinations"] else ())
+                     for size, result in zip(sizes, cold))
+
+    print(f"\n{'search':<26}{'µs per query':>14}")
+    print(f"{'brute force (sets)':<26}{brute_time / len(checked) * 1e6:>14.1f}")
+    print(f"{'bitset index, cold':<26}{cold_time / len(queries) * 1e6:>14.1f}")
+    print(f"{'bitset index, memoized':<26}{warm_time / len(queries) * 1e6:>14.1f}")
+    print(f"\nMinimal size differs from brute force in {mismatches} of {len(checked)} queries")
+    print(f"Cache: {index.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Write and query throughput of the classification history store.
+
+Records synthetic predictions spread over one season, then times the
+dashboard's aggregate queries. They read the weekly rollup. For comparison,
+the same species-by-week counts are also computed straight from the raw
+predictions table:
+
+    python benchmarks/bench_history.py --rows 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import CLASS_NAMES
+from history_store import HistoryStore, connect, week_of
+
+SEASON_DAYS = 180
+
+
+def best_of(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="History store write and query throughput")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--fields", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--db", help="database file (default: a temporary file)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = HistoryStore(args.db or os.path.join(tmp, "history.sqlite3"), max_pending=args.rows + 1)
+        rng = np.random.default_rng(0)
+        end = time.time()
+        timestamps = end - rng.random(args.rows) * SEASON_DAYS * 24 * 3600
+        species = rng.integers(len(CLASS_NAMES), size=args.rows)
+        fields = rng.integers(args.fields, size=args.rows)
+        confidences = rng.random(args.rows)
+
+        start = time.perf_counter()
+        for i in range(args.rows):
+            store.record_prediction(CLASS_NAMES[species[i]], confidences[i], "bench", f"{i:064x}",
+                                    field=f"field-{fields[i]}", ts=timestamps[i])
+        enqueue_time = time.perf_counter() - start
+        store.flush()
+        total_time = time.perf_counter() - start
+        print(f"{args.rows} rows: {enqueue_time / args.rows * 1e6:.2f} µs per record call on the request path, "
+              f"{args.rows / total_time:,.0f} rows/s committed in {store.batches} batches")
+
+        since = end - 12 * 7 * 24 * 3600
+        raw = connect(store.path)
+
+        def raw_weekly():
+            rows = raw.execute("SELECT ts, species FROM predictions WHERE ts >= ?", (since,)).fetchall()
+            counts = {}
+            for ts, name in rows:
+                key = (week_of(ts), name)
+                counts[key] = counts.get(key, 0) + 1
+            return counts
+
+        def raw_group_by():
+            # SQLite computes the week itself; still a scan of every row in range
+            return raw.execute("""
+                SELECT date(ts, 'unixepoch', 'localtime', 'weekday 0', '-6 days') AS week, species, COUNT(*)
+                FROM predictions WHERE ts >= ? GROUP BY week, species
+            """, (since,)).fetchall()
+
+        queries = {
+            "weekly counts (rollup)": lambda: store.weekly_species_counts(since=since),
+            "weekly counts, one field (rollup)": lambda: store.weekly_species_counts("field-0", since=since),
+            "species totals (rollup)": lambda: store.species_totals(since=since),
+            "recent 50, one field": lambda: store.recent_predictions("field-0", 50),
+            "weekly counts (raw GROUP BY)": raw_group_by,
+            "weekly counts (raw rows in Python)": raw_weekly,
+        }
+        print(f"\n{'query (last 12 weeks)':<38}{'ms':>10}")
+        for name, query in queries.items():
+            print(f"{name:<38}{best_of(query, args.repeats) * 1000:>10.2f}")
+        raw.close()
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
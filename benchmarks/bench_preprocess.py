@@ -0,0 +1,115 @@
+"""Compare the original preprocess_image with the reduced-decode engine on large images.
+
+Each variant runs in its own process so that its peak resident memory is not
+hidden by allocations made by another variant:
+
+    python benchmarks/bench_preprocess.py --width 4032 --height 3024 --repeats 10
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from preprocessing import load_batch
+
+
+# preprocess_image as it was before the fast path: full decode, float64 output
+def legacy_preprocess(image, target_size=(120, 120)):
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image = image.resize(target_size)
+    image_array = np.array(image) / 255.0
+    return np.expand_dims(image_array, axis=0)
+
+
+def fast_preprocess(image, target_size=(120, 120)):
+    return load_batch([image], target_size)
+
+
+def fast_preprocess_uint8(image, target_size=(120, 120)):
+    return load_batch([image], target_size, dtype=np.uint8)
+
+
+VARIANTS = {
+    "legacy": legacy_preprocess,
+    "fast-float32": fast_preprocess,
+    "fast-uint8": fast_preprocess_uint8,
+}
+
+
+# Smooth gradients plus noise - compresses like a photo rather than like flat colour
+def make_test_image(path, width, height, image_format):
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis=-1)
+    pixels = np.clip(pixels + rng.integers(-20, 20, pixels.shape), 0, 255).astype(np.uint8)
+    Image.fromarray(pixels).save(path, format=image_format, quality=90)
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_variant(name, path, target_size, repeats, results):
+    preprocess = VARIANTS[name]
+    baseline_rss = peak_rss_mb()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with Image.open(path) as image:
+            output = preprocess(image, target_size)
+        timings.append(time.perf_counter() - start)
+
+    results[name] = {
+        "mean_ms": statistics.mean(timings) * 1000,
+        "p50_ms": statistics.median(timings) * 1000,
+        "min_ms": min(timings) * 1000,
+        "peak_rss_increase_mb": peak_rss_mb() - baseline_rss,
+        "output": f"{output.dtype}{list(output.shape)}",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image preprocessing on large images")
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--target", type=int, default=120, help="square model input size")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--formats", nargs="+", default=["JPEG", "PNG"])
+    args = parser.parse_args()
+
+    target_size = (args.target, args.target)
+    manager = multiprocessing.Manager()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for image_format in args.formats:
+            path = os.path.join(tmp_dir, f"field.{image_format.lower()}")
+            make_test_image(path, args.width, args.height, image_format)
+            print(f"\n{image_format} {args.width}x{args.height} -> {args.target}x{args.target} "
+                  f"({os.path.getsize(path) / 1e6:.1f} MB file, {args.repeats} repeats)")
+            print(f"{'variant':<14}{'mean ms':>10}{'p50 ms':>10}{'min ms':>10}{'peak RSS +MB':>14}  output")
+
+            results = manager.dict()
+            for name in VARIANTS:
+                process = multiprocessing.Process(target=run_variant,
+                                                  args=(name, path, target_size, args.repeats, results))
+                process.start()
+                process.join()
+
+            for name in VARIANTS:
+                r = results[name]
+                print(f"{name:<14}{r['mean_ms']:>10.1f}{r['p50_ms']:>10.1f}{r['min_ms']:>10.1f}"
+                      f"{r['peak_rss_increase_mb']:>14.1f}  {r['output']}")
+
+
+if __name__ == "__main__":
+    main()
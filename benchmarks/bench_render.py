@@ -0,0 +1,181 @@
+"""Compare the original piecewise card rendering with the templated cards.
+
+Counts the Streamlit element messages each approach sends per card and
+their payload size. Times both building the HTML alone and the full element
+calls through Streamlit, which run in bare mode here - the element protobufs
+are built but not sent:
+
+    python benchmarks/bench_render.py --repeats 2000
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import streamlit
+
+from app import WEED_INFO, get_pesticide_recommendation
+from templates import recommendation_card, result_card
+
+
+# Stands in for the streamlit module and records one message per element call
+class RecordingStreamlit:
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+
+    def _send(self, body, *args, **kwargs):
+        self.messages += 1
+        self.bytes += len(str(body).encode("utf-8"))
+
+    markdown = info = warning = _send
+
+
+# The result card as main() rendered it before templates.py: one f-string per rerun
+def legacy_result_card(st, predicted_class, confidence):
+    weed_icon = WEED_INFO.get(predicted_class, {}).get("icon", "🌿")
+    st.markdown(f"""
+    <div class="card animate-fade-in">
+        <div style="display:flex;align-items:center;gap:1.5rem;margin-bottom:1.5rem">
+            <div style="width:60px;height:60px;background:linear-gradient(135deg, var(--primary-light), var(--primary));color:white;display:flex;align-items:center;justify-content:center;border-radius:50%;font-size:2rem;box-shadow:0 4px 10px rgba(0,0,0,0.1)">
+                {weed_icon}
+            </div>
+            <div style="flex-grow:1">
+                <h3 style="margin:0;font-size:1.5rem;color:var(--primary-dark)">{predicted_class}</h3>
+                <div style="display:flex;align-items:center;gap:0.8rem;margin-top:0.5rem">
+                    <div style="flex-grow:1;background:#e0e0e0;border-radius:10px;height:10px;overflow:hidden">
+                        <div style="width:{confidence*100:.0f}%;background:linear-gradient(90deg, var(--primary), var(--primary-light));height:100%;border-radius:10px"></div>
+                    </div>
+                    <span style="font-weight:600;color:var(--primary-dark)">{confidence*100:.1f}% Confidence</span>
+                </div>
+            </div>
+        </div>
+        <div style="background:rgba(129, 199, 132, 0.1);border-radius:10px;padding:1rem;border-left:4px solid var(--primary)">
+            <p style="margin:0;font-size:1.05rem">{WEED_INFO.get(predicted_class, {}).get('description', '')}</p>
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
+
+
+# The recommendation card as main() rendered it before templates.py: one call per fragment
+def legacy_recommendation_card(st, pesticides, general_rec, specific_recs):
+    st.markdown("""
+    <div class="card animate-fade-in">
+        <div style="display:flex;align-items:center;gap:1rem;margin-bottom:1rem">
+<div style="width:40px;height:40px;background:linear-gradient(135deg, var(--accent-light), var(--accent));color:white;display:flex;align-items:center;justify-content:center;border-radius:50%;font-size:1.2rem">🧪</div>
+            <h4 style="margin:0;color:var(--accent-dark);font-size:1.3rem">Recommended Treatment</h4>
+        </div>
+    """, unsafe_allow_html=True)
+
+    if pesticides:
+        st.markdown("""
+        <div style="background:rgba(255, 255, 255, 0.7);border-radius:10px;padding:1rem;margin-bottom:1rem">
+            <h5 style="margin-top:0;color:var(--primary-dark);display:flex;align-items:center;gap:0.5rem">
+                <span style="color:var(--accent)">🧪</span> Recommended Herbicides
+            </h5>
+            <div style="display:flex;flex-wrap:wrap;gap:0.5rem">
+        """, unsafe_allow_html=True)
+        for pesticide in pesticides:
+            st.markdown(f"""
+                <span class="herbicide-pill">{pesticide}</span>
+            """, unsafe_allow_html=True)
+        st.markdown("</div></div>", unsafe_allow_html=True)
+
+        st.markdown("""
+        <div style="background:rgba(255, 255, 255, 0.7);border-radius:10px;padding:1rem;margin-bottom:1rem">
+            <h5 style="margin-top:0;color:var(--primary-dark);display:flex;align-items:center;gap:0.5rem">
+                <span style="color:var(--accent)">💡</span> Application Advice
+            </h5>
+        """, unsafe_allow_html=True)
+        st.info(general_rec)
+        st.markdown("</div>", unsafe_allow_html=True)
+
+        if specific_recs:
+            st.markdown("""
+            <div style="background:rgba(255, 255, 255, 0.7);border-radius:10px;padding:1rem;margin-bottom:1rem">
+                <h5 style="margin-top:0;color:var(--primary-dark);display:flex;align-items:center;gap:0.5rem">
+                    <span style="color:var(--accent)">🌦️</span> Environmental Considerations
+                </h5>
+                <ul style="margin-bottom:0">
+            """, unsafe_allow_html=True)
+            for rec in specific_recs:
+                st.markdown(f"<li>{rec}</li>", unsafe_allow_html=True)
+            st.markdown("</ul></div>", unsafe_allow_html=True)
+
+        st.markdown("""
+        <div style="background:rgba(255, 143, 0, 0.1);border-radius:10px;padding:1rem;border-left:4px solid var(--accent)">
+            <h5 style="margin-top:0;color:var(--accent-dark);display:flex;align-items:center;gap:0.5rem">
+                <span style="color:var(--accent)">⚠️</span> Safety Precautions
+            </h5>
+            <ul style="margin-bottom:0">
+                <li>Wear protective clothing, gloves, and eye protection</li>
+                <li>Avoid application on windy days (wind speed > 10 mph)</li>
+                <li>Follow manufacturer's instructions precisely</li>
+                <li>Observe pre-harvest intervals for food safety</li>
+                <li>Store pesticides in original containers away from children</li>
+            </ul>
+        </div>
+        """, unsafe_allow_html=True)
+    else:
+        st.warning("No specific recommendations available for this weed type")
+
+    st.markdown("</div>", unsafe_allow_html=True)
+
+
+def templated_result_card(st, predicted_class, confidence):
+    info = WEED_INFO.get(predicted_class, {})
+    st.markdown(result_card(predicted_class, confidence, info.get("icon", "🌿"), info.get("description", "")),
+                unsafe_allow_html=True)
+
+
+def templated_recommendation_card(st, pesticides, general_rec, specific_recs):
+    st.markdown(recommendation_card(tuple(pesticides), general_rec, tuple(specific_recs)), unsafe_allow_html=True)
+
+
+def time_per_call(render, st, args, repeats, cold):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        if cold:
+            result_card.cache_clear()
+            recommendation_card.cache_clear()
+        render(st, *args)
+    return (time.perf_counter() - start) / repeats * 1e6
+
+
+def measure(render, args, repeats, cold):
+    st = RecordingStreamlit()
+    render(st, *args)
+    render(streamlit, *args)
+    return (st.messages, st.bytes,
+            time_per_call(render, st, args, repeats, cold),
+            time_per_call(render, streamlit, args, repeats // 10 or 1, cold))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare piecewise and templated card rendering")
+    parser.add_argument("--repeats", type=int, default=2000)
+    parser.add_argument("--weed", default="Crabgrass")
+    args = parser.parse_args()
+    # Outside `streamlit run` every element call warns about the missing script context
+    logging.disable(logging.WARNING)
+
+    recommendation = get_pesticide_recommendation(args.weed, "Clay", 35, "Corn")
+    cards = {
+        "result card": ((args.weed, 0.9342), legacy_result_card, templated_result_card),
+        "recommendation card": (recommendation, legacy_recommendation_card, templated_recommendation_card),
+    }
+
+    print(f"{'card':<22}{'variant':<20}{'messages':>9}{'bytes':>8}{'build µs':>10}{'streamlit µs':>14}")
+    for card, (card_args, legacy, templated) in cards.items():
+        for variant, render, cold in [("legacy", legacy, False),
+                                      ("templated (cold)", templated, True),
+                                      ("templated (rerun)", templated, False)]:
+            messages, payload, build, total = measure(render, card_args, args.repeats, cold)
+            print(f"{card:<22}{variant:<20}{messages:>9}{payload:>8}{build:>10.2f}{total:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
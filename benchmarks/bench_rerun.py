@@ -0,0 +1,119 @@
+"""Server time and bytes sent per rerun of the Streamlit app.
+
+Drives the app headlessly with Streamlit's AppTest: uploads one photo, then
+submits the recommendation form repeatedly, which is the rerun a user
+triggers most often. For each rerun it reports the wall time, the bytes of
+element messages sent, and the bytes of media files (images) served.
+AppTest reruns the whole script even for widgets inside a fragment, so the
+recommendation rerun figures are an upper bound. Under `streamlit run`, a
+form inside a fragment reruns only that fragment:
+
+    python benchmarks/bench_rerun.py --reruns 10
+
+    # Compare with an earlier version of the app, checked out next to app.py
+    git show HEAD~1:app.py > app_before.py
+    python benchmarks/bench_rerun.py --app app_before.py
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from streamlit.runtime.forward_msg_queue import ForwardMsgQueue
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.testing.v1 import AppTest
+
+from run_benchmarks import make_image_bytes
+
+
+# Sums the serialized size of every element message and media file the app produces
+class TrafficCounter:
+    def __init__(self):
+        self.message_bytes = 0
+        self.media_bytes = 0
+        self._enqueue = ForwardMsgQueue.enqueue
+        self._add = MediaFileManager.add
+
+    def __enter__(self):
+        counter = self
+
+        def enqueue(queue, msg):
+            counter.message_bytes += msg.ByteSize()
+            return counter._enqueue(queue, msg)
+
+        def add(manager, path_or_data, *args, **kwargs):
+            if isinstance(path_or_data, bytes):
+                counter.media_bytes += len(path_or_data)
+            return counter._add(manager, path_or_data, *args, **kwargs)
+
+        self._patches = [mock.patch.object(ForwardMsgQueue, "enqueue", enqueue),
+                         mock.patch.object(MediaFileManager, "add", add)]
+        for patch in self._patches:
+            patch.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        for patch in self._patches:
+            patch.stop()
+        return False
+
+    def reset(self):
+        self.message_bytes = self.media_bytes = 0
+
+
+def run_once(at, counter, action):
+    counter.reset()
+    start = time.perf_counter()
+    action()
+    at.run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return time.perf_counter() - start, counter.message_bytes, counter.media_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-rerun server time and traffic of the Streamlit app")
+    parser.add_argument("--app", default=os.path.join(ROOT, "app.py"))
+    parser.add_argument("--reruns", type=int, default=10)
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    args = parser.parse_args()
+
+    photo = make_image_bytes(args.width, args.height, "RGB", "JPEG")
+    at = AppTest.from_file(os.path.abspath(args.app), default_timeout=300)
+    with TrafficCounter() as counter:
+        seconds, messages, media = run_once(at, counter, lambda: None)
+        print(f"{'initial load':<24}{seconds * 1000:>10.1f} ms{messages:>12} B msgs{media:>12} B media")
+        seconds, messages, media = run_once(
+            at, counter, lambda: at.file_uploader[0].set_value(("field.jpg", photo, "image/jpeg"))
+        )
+        print(f"{'upload':<24}{seconds * 1000:>10.1f} ms{messages:>12} B msgs{media:>12} B media")
+
+        soil = next(widget for widget in at.selectbox if widget.label == "Soil Type")
+        soil.set_value("Clay")
+        next(widget for widget in at.text_input if widget.label == "Weed Type").set_value("Crabgrass")
+        next(widget for widget in at.text_input if widget.label == "Crop Type").set_value("Corn")
+
+        timings, message_sizes, media_sizes = [], [], []
+        for i in range(args.reruns):
+            def submit(temperature=i % 40):
+                next(widget for widget in at.slider if widget.label == "Temperature (°C)").set_value(temperature)
+                next(button for button in at.button if button.label == "Get Custom Recommendations").click()
+            seconds, messages, media = run_once(at, counter, submit)
+            timings.append(seconds)
+            message_sizes.append(messages)
+            media_sizes.append(media)
+
+    print(f"{'recommendation rerun':<24}{statistics.median(timings) * 1000:>10.1f} ms"
+          f"{int(statistics.median(message_sizes)):>12} B msgs{int(statistics.median(media_sizes)):>12} B media"
+          f"   (median of {args.reruns})")
+
+
+if __name__ == "__main__":
+    main()
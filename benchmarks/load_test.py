@@ -0,0 +1,642 @@
+"""Concurrent-session load test of the Streamlit app.
+
+Starts the app through `serve_app.py` on a free local port with a synthetic stand-in
+model and drives it with simulated browser sessions. They speak Streamlit's
+own WebSocket protocol, so every session gets its own server-side session,
+script runs, uploads and widget state, exactly like a browser tab. Each
+session loads the page, uploads a photo and clicks Identify Weed. It answers
+the progress fragment's auto-reruns until the result card appears, then
+submits recommendation_form. Sessions stay connected until the end of their
+stage, like open tabs.
+
+Load comes in stages. A stage is either a Poisson arrival rate of new
+sessions per second (`--rates`) or a number of users, each starting a new
+session as soon as the last one ends (`--users`). For every stage the test
+reports:
+
+- throughput
+- p50/p95/p99 latency of each step
+- the server process's memory growth per session
+- the server's CPU use as a share of all cores
+
+It then names the first stage past the breaking point: errors or busy
+rejections above 1%, identify p95 above `--slo`, or sessions completing
+more slowly than they arrive.
+
+    python benchmarks/load_test.py run --rates 0.5 1 2 4 --duration 60 --image-sizes 640x480 4032x3024
+    python benchmarks/load_test.py run --users 10 25 50 --duration 60 --output results/load_main.json
+
+    # Flag stages whose identify p95, throughput or memory per session got more than 20% worse
+    python benchmarks/load_test.py compare results/load_main.json results/load_branch.json --threshold 0.2
+
+Server settings such as WEEDAI_MAX_CONCURRENT_INFERENCE are read from the
+environment as usual. Near-duplicate suppression is off unless
+`--near-duplicates` is given (which turns it on at distance 4 when
+WEEDAI_NEAR_DUPLICATE_DISTANCE does not already enable it), and every upload has unique bytes, so every
+upload reaches the model. The server's CPU and memory are read from /proc,
+so this runs on Linux.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+from datetime import datetime, timezone
+
+import numpy as np
+import websockets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.Common_pb2 import FileURLsRequest, FileUploaderState, UploadedFileInfo
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+from run_benchmarks import make_image_bytes
+
+STEPS = ["load", "upload", "identify", "recommend", "session"]
+PERCENTILES = [50, 95, 99]
+UPLOADER_LABEL = "Upload crop field image"
+IDENTIFY_BUTTON = "🔍 Identify Weed"
+RECOMMEND_BUTTON = "Get Custom Recommendations"
+RECOMMENDATION_FORM = "recommendation_form"
+# Rejections and errors above this share of sessions mark the breaking point
+MAX_FAILURE_RATE = 0.01
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# The app, started by serve_app.py, in a subprocess, with its CPU time and resident memory read from /proc
+class AppServer:
+    def __init__(self, env, log_path, port=None):
+        self.env = env
+        self.log_path = log_path
+        self.port = port or free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.process = None
+
+    def start(self, timeout=180):
+        self._log = open(self.log_path, "w", encoding="utf-8")
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "serve_app.py"),
+             "--server.headless", "true", "--server.address", "127.0.0.1", "--server.port", str(self.port),
+             "--server.enableXsrfProtection", "false", "--server.enableCORS", "false",
+             "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false"],
+            cwd=ROOT, env=self.env, stdout=self._log, stderr=subprocess.STDOUT,
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"the app server exited with status {self.process.returncode}, see {self.log_path}")
+            try:
+                with urllib.request.urlopen(f"{self.base_url}/_stcore/health", timeout=2) as response:
+                    if response.status == 200:
+                        return self
+            except OSError:
+                pass
+            time.sleep(0.5)
+        raise RuntimeError(f"the app server did not become healthy in {timeout} s, see {self.log_path}")
+
+    def cpu_seconds(self):
+        with open(f"/proc/{self.process.pid}/stat", encoding="utf-8") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # utime and stime, fields 14 and 15 of /proc/<pid>/stat
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def rss_bytes(self):
+        with open(f"/proc/{self.process.pid}/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.process is not None:
+            self._log.close()
+
+
+class SessionFailed(Exception):
+    def __init__(self, outcome, message):
+        super().__init__(message)
+        self.outcome = outcome
+
+
+# One simulated browser tab: the WebSocket, the widget ids the server last rendered and the widget values it holds
+class BrowserSession:
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.session_id = None
+        self.websocket = None
+        # (label, form id) -> widget id, from the elements of every run
+        self.widgets = {}
+        # widget id -> WidgetState, resent on every run like the frontend does
+        self.states = {}
+        self.auto_rerun = None
+        self._file_urls = None
+
+    async def connect(self):
+        url = self.base_url.replace("http://", "ws://") + "/_stcore/stream"
+        self.websocket = await websockets.connect(url, max_size=None)
+
+    async def close(self):
+        if self.websocket is not None:
+            await self.websocket.close()
+
+    def widget(self, label, form_id=""):
+        try:
+            return self.widgets[(label, form_id)]
+        except KeyError:
+            raise SessionFailed("failed", f"no widget labelled {label!r} on the page") from None
+
+    def set_state(self, widget_id, **value):
+        state = WidgetState(id=widget_id, **value)
+        self.states[widget_id] = state
+        return state
+
+    # Sends a rerun with the current widget values plus any one-off triggers and returns the elements rendered
+    async def rerun(self, triggers=(), fragment_id="", is_auto_rerun=False):
+        msg = BackMsg()
+        client_state = msg.rerun_script
+        client_state.widget_states.widgets.extend(list(self.states.values()) + list(triggers))
+        client_state.fragment_id = fragment_id
+        client_state.is_auto_rerun = is_auto_rerun
+        await self.websocket.send(msg.SerializeToString())
+        return await self._read_run()
+
+    async def upload(self, name, data):
+        request_id = uuid.uuid4().hex
+        msg = BackMsg(file_urls_request=FileURLsRequest(request_id=request_id, file_names=[name],
+                                                        session_id=self.session_id))
+        await self.websocket.send(msg.SerializeToString())
+        self._file_urls = None
+        while self._file_urls is None:
+            self._handle(await self._receive())
+        file_urls = self._file_urls.file_urls[0]
+        await asyncio.to_thread(put_file, self.base_url + file_urls.upload_url, name, data)
+        state = self.set_state(self.widget(UPLOADER_LABEL))
+        state.file_uploader_state_value.CopyFrom(FileUploaderState(
+            uploaded_file_info=[UploadedFileInfo(file_id=file_urls.file_id, name=name, size=len(data),
+                                                 file_urls=file_urls)],
+        ))
+        return await self.rerun()
+
+    async def _receive(self):
+        try:
+            return ForwardMsg.FromString(await asyncio.wait_for(self.websocket.recv(), self.timeout))
+        except asyncio.TimeoutError:
+            raise SessionFailed("failed", f"no message from the server in {self.timeout} s") from None
+
+    # Messages up to the end of a script run; a run cut short by st.rerun is followed by the next one
+    async def _read_run(self):
+        elements = []
+        while True:
+            msg = await self._receive()
+            kind = msg.WhichOneof("type")
+            if kind == "script_finished":
+                if msg.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    return elements
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                elements.append(msg.delta.new_element)
+            self._handle(msg)
+
+    def _handle(self, msg):
+        kind = msg.WhichOneof("type")
+        if kind == "new_session":
+            self.session_id = msg.new_session.initialize.session_id
+        elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+            element = msg.delta.new_element
+            widget = getattr(element, element.WhichOneof("type") or "", None)
+            if getattr(widget, "id", "") and hasattr(widget, "label"):
+                self.widgets[(widget.label, getattr(widget, "form_id", ""))] = widget.id
+        elif kind == "auto_rerun":
+            self.auto_rerun = (msg.auto_rerun.interval, msg.auto_rerun.fragment_id)
+        elif kind == "stop_auto_rerun":
+            self.auto_rerun = None
+        elif kind == "file_urls_response":
+            self._file_urls = msg.file_urls_response
+
+
+def put_file(url, name, data):
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{name}\"\r\n"
+            f"Content-Type: image/jpeg\r\n\r\n").encode("utf-8") + data + f"\r\n--{boundary}--\r\n".encode("utf-8")
+    request = urllib.request.Request(url, data=body, method="PUT",
+                                     headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        response.read()
+
+
+# Alert and exception elements the app shows when a step did not work
+def check_for_failure(elements):
+    for element in elements:
+        kind = element.WhichOneof("type")
+        if kind == "exception":
+            raise SessionFailed("failed", f"{element.exception.type}: {element.exception.message}")
+        if kind == "alert" and element.alert.body.startswith("⏳"):
+            raise SessionFailed("rejected", element.alert.body)
+        if kind == "alert" and element.alert.body.startswith("❌"):
+            raise SessionFailed("failed", element.alert.body)
+
+
+def has_markdown(elements, text):
+    return any(element.WhichOneof("type") == "markdown" and text in element.markdown.body for element in elements)
+
+
+# Upload, identify and recommend in one session; returns (outcome, seconds per step, message)
+async def run_session(session, image, name, rng):
+    steps = {}
+    start = time.perf_counter()
+    try:
+        await session.connect()
+        check_for_failure(await session.rerun())
+        steps["load"] = time.perf_counter() - start
+
+        step_start = time.perf_counter()
+        check_for_failure(await session.upload(name, image))
+        steps["upload"] = time.perf_counter() - step_start
+
+        step_start = time.perf_counter()
+        elements = await session.rerun([WidgetState(id=session.widget(IDENTIFY_BUTTON), trigger_value=True)])
+        deadline = time.monotonic() + session.timeout
+        # The browser reruns the progress fragment every interval until the job is done and it reruns the page
+        while not has_markdown(elements, "Confidence"):
+            check_for_failure(elements)
+            if session.auto_rerun is None or time.monotonic() > deadline:
+                raise SessionFailed("failed", "no result card after Identify Weed")
+            interval, fragment_id = session.auto_rerun
+            await asyncio.sleep(interval)
+            elements = await session.rerun(fragment_id=fragment_id, is_auto_rerun=True)
+        steps["identify"] = time.perf_counter() - step_start
+
+        step_start = time.perf_counter()
+        session.set_state(session.widget("Soil Type", RECOMMENDATION_FORM), string_value=rng.choice(
+            ["Clay", "Loamy", "Sandy", "Silty", "Peaty"]))
+        temperature = session.set_state(session.widget("Temperature (°C)", RECOMMENDATION_FORM))
+        temperature.double_array_value.data.append(rng.randint(0, 40))
+        session.set_state(session.widget("Crop Type", RECOMMENDATION_FORM), string_value=rng.choice(
+            ["Wheat", "Corn", "Soyabean"]))
+        elements = await session.rerun([WidgetState(id=session.widget(RECOMMEND_BUTTON, RECOMMENDATION_FORM),
+                                                    trigger_value=True)])
+        check_for_failure(elements)
+        if not has_markdown(elements, "Recommended Treatment"):
+            raise SessionFailed("failed", "no recommendation card after submitting the form")
+        steps["recommend"] = time.perf_counter() - step_start
+        steps["session"] = time.perf_counter() - start
+        return "ok", steps, None
+    except SessionFailed as e:
+        return e.outcome, steps, str(e)
+    except (OSError, websockets.WebSocketException) as e:
+        return "failed", steps, f"{type(e).__name__}: {e}"
+
+
+# A few distinct photos per size; each session appends unique bytes after the JPEG end marker, so the prediction
+# cache never hits while decoding is unchanged
+def make_images(image_sizes, variants=4):
+    return {size: [make_image_bytes(*size, "RGB", "JPEG", seed) for seed in range(variants)] for size in image_sizes}
+
+
+class Stage:
+    def __init__(self, label, rate=None, users=None):
+        self.label = label
+        self.rate = rate
+        self.users = users
+        self.results = []
+        self.sessions = []
+        self.samples = []
+
+
+async def sample_server(server, samples, interval):
+    previous_cpu, previous_time = server.cpu_seconds(), time.monotonic()
+    while True:
+        await asyncio.sleep(interval)
+        cpu, now = server.cpu_seconds(), time.monotonic()
+        samples.append(((cpu - previous_cpu) / (now - previous_time) / (os.cpu_count() or 1) * 100,
+                        server.rss_bytes()))
+        previous_cpu, previous_time = cpu, now
+
+
+async def run_stage(server, stage, args, images, rng):
+    counter = iter(range(10 ** 9))
+
+    async def one_session():
+        size = args.image_sizes[next(counter) % len(args.image_sizes)]
+        image = rng.choice(images[size]) + uuid.uuid4().bytes
+        session = BrowserSession(server.base_url, args.timeout)
+        stage.sessions.append(session)
+        stage.results.append(await run_session(session, image, f"field_{size[0]}x{size[1]}.jpg", rng))
+
+    rss_start = server.rss_bytes()
+    cpu_start, harness_cpu_start = server.cpu_seconds(), time.process_time()
+    sampler = asyncio.create_task(sample_server(server, stage.samples, args.sample_interval))
+    start = time.monotonic()
+    end = start + args.duration
+    if stage.rate:
+        tasks = []
+        while True:
+            await asyncio.sleep(rng.expovariate(stage.rate))
+            if time.monotonic() >= end:
+                break
+            tasks.append(asyncio.create_task(one_session()))
+        if tasks:
+            await asyncio.wait(tasks)
+    else:
+        async def user():
+            while time.monotonic() < end:
+                await one_session()
+                await asyncio.sleep(args.think_time)
+
+        await asyncio.gather(*(user() for _ in range(stage.users)))
+    elapsed = time.monotonic() - start
+    sampler.cancel()
+
+    # Measured while every session is still connected, like tabs left open
+    rss_end = server.rss_bytes()
+    cpu_share = (server.cpu_seconds() - cpu_start) / elapsed / (os.cpu_count() or 1) * 100
+    harness_share = (time.process_time() - harness_cpu_start) / elapsed / (os.cpu_count() or 1) * 100
+    await asyncio.gather(*(session.close() for session in stage.sessions), return_exceptions=True)
+    return summarize(stage, args.duration, elapsed, rss_start, rss_end, cpu_share, harness_share)
+
+
+def percentiles(values):
+    if not values:
+        return {f"p{p}": None for p in PERCENTILES}
+    return {f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES}
+
+
+def summarize(stage, duration, elapsed, rss_start, rss_end, cpu_share, harness_share):
+    ok = [steps for outcome, steps, _ in stage.results if outcome == "ok"]
+    outcomes = [outcome for outcome, _, _ in stage.results]
+    errors = {}
+    for outcome, _, message in stage.results:
+        if message:
+            errors[message] = errors.get(message, 0) + 1
+    cpu_samples = [cpu for cpu, _ in stage.samples]
+    return {
+        "label": stage.label,
+        "rate": stage.rate,
+        "users": stage.users,
+        "elapsed_s": elapsed,
+        # Time to finish the sessions still running when arrivals stopped
+        "drain_s": max(0.0, elapsed - duration),
+        "arrivals_per_s": len(stage.results) / duration,
+        "sessions": len(stage.results),
+        "ok": len(ok),
+        "rejected": outcomes.count("rejected"),
+        "failed": outcomes.count("failed"),
+        "throughput_per_s": len(ok) / elapsed if elapsed else 0.0,
+        "latency_s": {step: percentiles([steps[step] for steps in ok]) for step in STEPS},
+        "rss_start_mb": rss_start / 2 ** 20,
+        "rss_end_mb": rss_end / 2 ** 20,
+        "peak_rss_mb": max([rss for _, rss in stage.samples] + [rss_end]) / 2 ** 20,
+        "rss_per_session_mb": (rss_end - rss_start) / 2 ** 20 / max(1, len(stage.results)),
+        "server_cpu_pct": cpu_share,
+        "server_cpu_p95_pct": float(np.percentile(cpu_samples, 95)) if cpu_samples else cpu_share,
+        "harness_cpu_pct": harness_share,
+        "errors": dict(sorted(errors.items(), key=lambda item: -item[1])[:5]),
+    }
+
+
+# Why a stage is past the breaking point, or None
+def breaking_reason(result, slo):
+    if not result["sessions"]:
+        return None
+    failure_rate = (result["rejected"] + result["failed"]) / result["sessions"]
+    if failure_rate > MAX_FAILURE_RATE:
+        return f"{failure_rate * 100:.1f}% of sessions rejected or failed"
+    identify_p95 = result["latency_s"]["identify"]["p95"]
+    if identify_p95 is not None and identify_p95 > slo:
+        return f"identify p95 {identify_p95:.2f} s is above the {slo:g} s SLO"
+    # Sessions arriving faster than they complete leave a backlog that takes longer than a typical session to clear
+    session_p50 = result["latency_s"]["session"]["p50"]
+    if result["rate"] and session_p50 is not None and result["drain_s"] > 2 * session_p50:
+        return (f"{result['drain_s']:.1f} s to clear the backlog after arrivals stopped, "
+                f"{result['drain_s'] / session_p50:.1f}× a typical session")
+    return None
+
+
+def format_seconds(value):
+    return f"{value:>8.2f}" if value is not None else f"{'-':>8}"
+
+
+def print_stage(result):
+    print(f"\n{result['label']}: {result['sessions']} sessions in {result['elapsed_s']:.0f} s · {result['ok']} ok · "
+          f"{result['rejected']} rejected · {result['failed']} failed · "
+          f"{result['throughput_per_s']:.2f} sessions/s completed, {result['arrivals_per_s']:.2f}/s arrived")
+    print(f"  server CPU {result['server_cpu_pct']:.0f}% of all cores (p95 {result['server_cpu_p95_pct']:.0f}%), "
+          f"harness {result['harness_cpu_pct']:.0f}% · RSS {result['rss_start_mb']:.0f} -> "
+          f"{result['rss_end_mb']:.0f} MiB, {result['rss_per_session_mb']:.2f} MiB per session")
+    print(f"  {'step':<12}" + "".join(f"{f'p{p} s':>8}" for p in PERCENTILES))
+    for step in STEPS:
+        latency = result["latency_s"][step]
+        print(f"  {step:<12}" + "".join(format_seconds(latency[f"p{p}"]) for p in PERCENTILES))
+    for message, count in result["errors"].items():
+        print(f"  {count} × {message}")
+
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+async def run_stages(server, args):
+    rng = random.Random(args.seed)
+    images = make_images(args.image_sizes)
+    for _ in range(args.warmup):
+        # Loads the model and fills the first-run caches outside any stage
+        session = BrowserSession(server.base_url, args.timeout)
+        outcome, _, message = await run_session(session, images[args.image_sizes[0]][0] + uuid.uuid4().bytes,
+                                                "warmup.jpg", rng)
+        await session.close()
+        if outcome != "ok":
+            raise RuntimeError(f"warm-up session {outcome}: {message}")
+
+    stages = ([Stage(f"{rate:g} sessions/s", rate=rate) for rate in args.rates or []]
+              + [Stage(f"{users} users", users=users) for users in args.users or []])
+    results = []
+    for stage in stages:
+        result = await run_stage(server, stage, args, images, rng)
+        print_stage(result)
+        results.append(result)
+        reason = breaking_reason(result, args.slo)
+        if reason and args.stop_at_break:
+            break
+    return results
+
+
+def run(args):
+    args.image_sizes = [parse_size(size) for size in args.image_sizes]
+    if not args.rates and not args.users:
+        args.rates = [0.5, 1, 2]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = args.model
+        if model_path is None:
+            from standin_model import build_standin_model
+
+            model_path = os.path.join(tmp, "standin_weed_classifier.keras")
+            build_standin_model().save(model_path)
+        manifest = os.path.join(tmp, "models.json")
+        with open(manifest, "w", encoding="utf-8") as f:
+            json.dump({"models": [{"name": os.path.basename(model_path), "path": os.path.abspath(model_path)}]}, f)
+
+        env = {
+            **os.environ,
+            "WEEDAI_MODEL_MANIFEST": manifest,
+            "WEEDAI_MODEL_CACHE_DIR": os.path.join(tmp, "model_cache"),
+            "WEEDAI_HISTORY_DB": os.path.join(tmp, "history.sqlite3"),
+            "WEEDAI_EMBEDDING_DIR": os.path.join(tmp, "embeddings"),
+        }
+        if not args.near_duplicates:
+            env["WEEDAI_NEAR_DUPLICATE_DISTANCE"] = "-1"
+        elif int(env.get("WEEDAI_NEAR_DUPLICATE_DISTANCE", "-1")) < 0:
+            # The app leaves reuse off by default
+            env["WEEDAI_NEAR_DUPLICATE_DISTANCE"] = "4"
+        server = AppServer(env, args.server_log or os.path.join(tmp, "server.log"))
+        print(f"Starting the app on {server.base_url} with {'the stand-in model' if args.model is None else model_path}")
+        try:
+            server.start()
+            results = asyncio.run(run_stages(server, args))
+        finally:
+            server.stop()
+
+    print(f"\n{'stage':<18}{'sessions/s':>11}{'ok':>6}{'rej':>5}{'fail':>6}{'identify p95':>14}"
+          f"{'session p95':>13}{'CPU %':>7}{'MiB/session':>13}")
+    breaking_point = None
+    for result in results:
+        print(f"{result['label']:<18}{result['throughput_per_s']:>11.2f}{result['ok']:>6}{result['rejected']:>5}"
+              f"{result['failed']:>6}{format_seconds(result['latency_s']['identify']['p95']):>14}"
+              f"{format_seconds(result['latency_s']['session']['p95']):>13}{result['server_cpu_pct']:>7.0f}"
+              f"{result['rss_per_session_mb']:>13.2f}")
+        reason = breaking_reason(result, args.slo)
+        if reason and breaking_point is None:
+            breaking_point = {"stage": result["label"], "reason": reason}
+    if breaking_point:
+        print(f"\nBreaking point: {breaking_point['stage']} - {breaking_point['reason']}")
+    else:
+        print("\nNo stage passed the breaking point")
+
+    import streamlit
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "model": "synthetic stand-in" if args.model is None else args.model,
+            "python": platform.python_version(),
+            "streamlit": streamlit.__version__,
+            "cpu_count": os.cpu_count(),
+            "duration_s": args.duration,
+            "image_sizes": [f"{width}x{height}" for width, height in args.image_sizes],
+            "slo_s": args.slo,
+            "settings": {name: value for name, value in os.environ.items() if name.startswith("WEEDAI_")},
+        },
+        "stages": results,
+        "breaking_point": breaking_point,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+# (name, value from a stage result, True when higher is worse)
+COMPARED_METRICS = [
+    ("identify p95 s", lambda result: result["latency_s"]["identify"]["p95"], True),
+    ("sessions/s", lambda result: result["throughput_per_s"], False),
+    ("MiB/session", lambda result: result["rss_per_session_mb"], True),
+]
+
+
+# Exit status 1 when any stage got worse by more than the threshold on any compared metric
+def compare(args):
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = {result["label"]: result for result in json.load(f)["stages"]}
+    with open(args.current, encoding="utf-8") as f:
+        current = {result["label"]: result for result in json.load(f)["stages"]}
+
+    regressions = []
+    print(f"{'stage':<18}{'metric':<16}{'baseline':>10}{'current':>10}{'change':>9}")
+    for label in [label for label in baseline if label in current]:
+        for name, value, higher_is_worse in COMPARED_METRICS:
+            before, after = value(baseline[label]), value(current[label])
+            if before is None or after is None:
+                continue
+            change = (after - before) / before if before else 0.0
+            worse = change > args.threshold if higher_is_worse else change < -args.threshold
+            # Memory per session is noise below a megabyte
+            if name == "MiB/session" and max(before, after) < 1.0:
+                worse = False
+            if worse:
+                regressions.append((label, name))
+            print(f"{label:<18}{name:<16}{before:>10.2f}{after:>10.2f}{change * 100:>8.1f}%"
+                  f"{'  REGRESSION' if worse else ''}")
+    for label in sorted(set(baseline) ^ set(current)):
+        print(f"{label:<18}only in {'baseline' if label in baseline else 'current'}")
+
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) got worse by more than {args.threshold * 100:.0f}%")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-session load test of the WeedAI Streamlit app")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the load stages against a local app server")
+    run_parser.add_argument("--rates", type=float, nargs="+", help="stages of new sessions per second (Poisson)")
+    run_parser.add_argument("--users", type=int, nargs="+",
+                            help="stages of users who each start a new session when the last one ends")
+    run_parser.add_argument("--duration", type=float, default=30, help="seconds of arrivals per stage")
+    run_parser.add_argument("--image-sizes", nargs="+", default=["1920x1080"],
+                            help="upload sizes as WIDTHxHEIGHT, used in turn")
+    run_parser.add_argument("--think-time", type=float, default=1.0, help="pause between a user's sessions (s)")
+    run_parser.add_argument("--slo", type=float, default=5.0, help="identify p95 latency target (s)")
+    run_parser.add_argument("--timeout", type=float, default=120, help="longest wait for any one server reply (s)")
+    run_parser.add_argument("--model", help="model to serve instead of the synthetic stand-in")
+    run_parser.add_argument("--near-duplicates", action="store_true",
+                            help="turn near-duplicate suppression on (uploads differ only in trailing bytes)")
+    run_parser.add_argument("--warmup", type=int, default=1, help="sessions run before the first stage")
+    run_parser.add_argument("--stop-at-break", action="store_true", help="skip the stages after the breaking point")
+    run_parser.add_argument("--sample-interval", type=float, default=0.5, help="seconds between CPU / RSS samples")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--server-log", help="keep the app server's output in this file")
+    run_parser.add_argument("--output", help="JSON file to write the results to")
+
+    compare_parser = subparsers.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.20,
+                                help="relative change that counts as a regression")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Microbenchmarks for the preprocessing, classification and recommendation hot paths.
+
+Runs offline: when crop_weed_classifier_final.keras is missing a synthetic
+stand-in model with the same input and 15-class output is used instead.
+
+    # Run every benchmark and write the results
+    python benchmarks/run_benchmarks.py run --output results/main.json
+
+    # Only the classification benchmarks
+    python benchmarks/run_benchmarks.py run --filter classify --output results/branch.json
+
+    # Flag benchmarks whose median got more than 10% slower
+    python benchmarks/run_benchmarks.py compare results/main.json results/branch.json --threshold 0.10
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import (
+    CLASS_NAMES,
+    DEFAULT_MODEL_PATH,
+    classify_weed,
+    classify_weeds,
+    get_inference_governor,
+    get_pesticide_recommendation,
+    preprocess_image,
+    preprocess_images,
+)
+from bulk_recommend import build_table
+from preprocessing import model_input_size
+from standin_model import load_or_build
+
+BATCH_SIZES = [1, 8, 32, 64]
+
+# (name, width, height, mode, format) of the synthetic uploads
+IMAGE_CASES = [
+    ("rgb_640x480_jpeg", 640, 480, "RGB", "JPEG"),
+    ("rgb_1920x1080_jpeg", 1920, 1080, "RGB", "JPEG"),
+    ("huge_4032x3024_jpeg", 4032, 3024, "RGB", "JPEG"),
+    ("rgba_1024x1024_png", 1024, 1024, "RGBA", "PNG"),
+    ("grayscale_1024x768_jpeg", 1024, 768, "L", "JPEG"),
+    ("small_96x96_png", 96, 96, "RGB", "PNG"),
+]
+
+
+def make_image_bytes(width, height, mode, image_format, seed=0):
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis=-1)
+    pixels = np.clip(pixels + rng.integers(-20, 20, pixels.shape), 0, 255).astype(np.uint8)
+    image = Image.fromarray(pixels).convert(mode)
+    buffer = BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+# Runs fn at least min_runs times and for at least min_time seconds, after warmup calls
+def measure(fn, items=1, warmup=2, min_runs=5, min_time=0.5, max_runs=2000):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < max_runs and (len(timings) < min_runs or time.perf_counter() - started < min_time):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    timings.sort()
+    median = statistics.median(timings)
+    return {
+        "runs": len(timings),
+        "items": items,
+        "median_ms": median * 1000,
+        "mean_ms": statistics.mean(timings) * 1000,
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+        "min_ms": timings[0] * 1000,
+        "items_per_s": items / median if median else 0.0,
+    }
+
+
+def preprocess_benchmarks(target_size):
+    for name, width, height, mode, image_format in IMAGE_CASES:
+        data = make_image_bytes(width, height, mode, image_format)
+        # Image.open is lazy, so every run pays for the decode like a real upload does
+        yield f"preprocess/{name}", (lambda data=data: preprocess_image(Image.open(BytesIO(data)), target_size)), 1
+
+
+def classify_benchmarks(model, target_size):
+    images = [Image.open(BytesIO(make_image_bytes(640, 480, "RGB", "JPEG", seed))) for seed in range(max(BATCH_SIZES))]
+    full_batch = preprocess_images(images, target_size)
+
+    single = full_batch[:1]
+    yield "classify/single_image", (lambda: classify_weed(model, single, CLASS_NAMES)), 1
+    for batch_size in BATCH_SIZES:
+        batch = full_batch[:batch_size]
+        yield (f"classify/batch_{batch_size}",
+               (lambda batch=batch, batch_size=batch_size: classify_weeds(model, batch, CLASS_NAMES, batch_size)),
+               batch_size)
+
+
+def recommendation_benchmarks():
+    yield ("recommend/known_weed",
+           (lambda: get_pesticide_recommendation("Crabgrass", "Clay", 25, "Corn")), 1)
+    yield ("recommend/unknown_weed",
+           (lambda: get_pesticide_recommendation("Unknown", "Select", 40, "Rice")), 1)
+
+    # Every weed, soil and crop combination in one run
+    combinations = [
+        (weed, soil, temperature, crop)
+        for weed in CLASS_NAMES
+        for soil in ["Clay", "Loamy", "Sandy", "Silty", "Peaty"]
+        for temperature in [5, 20, 35]
+        for crop in ["Wheat", "Corn", "Soyabean"]
+    ]
+    yield ("recommend/all_combinations",
+           (lambda: [get_pesticide_recommendation(*combination) for combination in combinations]),
+           len(combinations))
+
+    table = build_table()
+    columns = [list(column) for column in zip(*combinations)]
+    yield ("recommend/bulk_all_combinations", (lambda: table.recommend(*columns)), len(combinations))
+
+
+def run(args):
+    # Sizes the TensorFlow thread pools as the app does, which only works before the model runs
+    get_inference_governor()
+    model, model_description = load_or_build(args.model)
+    target_size = model_input_size(model)
+
+    cases = [
+        *preprocess_benchmarks(target_size),
+        *classify_benchmarks(model, target_size),
+        *recommendation_benchmarks(),
+    ]
+    results = {}
+    for name, fn, items in cases:
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = stats = measure(fn, items, min_time=args.min_time)
+        print(f"{name:<36}{stats['median_ms']:>10.3f} ms  p95 {stats['p95_ms']:>10.3f} ms"
+              f"  {stats['items_per_s']:>10.1f} items/s")
+
+    import tensorflow as tf
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "model": model_description,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "tensorflow": tf.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+# Exit status 1 when any benchmark's median regressed by more than the threshold
+def compare(args):
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)["results"]
+
+    regressions = []
+    print(f"{'benchmark':<36}{'baseline ms':>13}{'current ms':>13}{'change':>9}")
+    for name in sorted(set(baseline) | set(current)):
+        if name not in baseline or name not in current:
+            print(f"{name:<36}{'only in ' + ('baseline' if name in baseline else 'current'):>35}")
+            continue
+        before, after = baseline[name]["median_ms"], current[name]["median_ms"]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > args.threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif change < -args.threshold:
+            flag = "  faster"
+        print(f"{name:<36}{before:>13.3f}{after:>13.3f}{change * 100:>8.1f}%{flag}")
+
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold * 100:.0f}%")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WeedAI microbenchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--model", default=DEFAULT_MODEL_PATH,
+                            help="model to benchmark; a synthetic stand-in is used if it does not exist")
+    run_parser.add_argument("--output", help="JSON file to write the results to")
+    run_parser.add_argument("--filter", help="only run benchmarks whose name contains this text")
+    run_parser.add_argument("--min-time", type=float, default=0.5, help="seconds to spend on each benchmark")
+
+    compare_parser = subparsers.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10,
+                                help="relative slowdown of the median that counts as a regression")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == "__main__":
+    main()
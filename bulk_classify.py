@@ -0,0 +1,260 @@
+"""Offline classification of whole image archives.
+
+Walks a directory tree and shards the images into batches across a process
+pool. Each worker loads the model once, preprocesses its batches with the
+app's own `preprocess_images` and calls the model directly. Results stream
+to a CSV or JSONL file, one row per image with its `WEED_INFO` details, and
+the file is flushed after every batch. The output doubles as the checkpoint.
+If the run is interrupted, running the same command again skips every image
+already classified and carries on. Images whose row records an error are
+tried again:
+
+    python bulk_classify.py scouting_2024/ results.csv --workers 4 --batch-size 64
+
+    # JSONL output, a TFLite model, starting over instead of resuming
+    python bulk_classify.py scouting_2024/ results.jsonl --model crop_weed_classifier_final_int8.tflite --restart
+
+Progress, throughput and the estimated time remaining go to stderr.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+COLUMNS = ["path", "weed", "confidence", "description", "recommendation", "pesticides", "error"]
+DEFAULT_MODEL_PATH = "crop_weed_classifier_final.keras"
+
+# Set in each worker process by _init_worker
+_worker_state = {}
+
+
+# Image paths under root, relative to it, in a stable order
+def walk_images(root):
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.relpath(os.path.join(directory, name), root)
+
+
+# Relative paths already classified in the output. Error rows - often transient (out of memory, I/O) - and a row
+# cut off by a crash are removed from the file, so those images are redone
+def finished_paths(output_path, output_format):
+    if not os.path.exists(output_path):
+        return set()
+    with open(output_path, "rb") as f:
+        data = f.read()
+    complete = data.rfind(b"\n") + 1
+    lines = data[:complete].decode("utf-8").splitlines()
+    if output_format == "jsonl":
+        rows = [json.loads(line) for line in lines if line.strip()]
+    else:
+        rows = list(csv.DictReader(lines))
+    # Empty in CSV, null in JSONL
+    finished = [row for row in rows if not row.get("error")]
+
+    if len(finished) < len(rows) or complete < len(data):
+        temporary_path = f"{output_path}.tmp"
+        with open(temporary_path, "w", newline="", encoding="utf-8") as f:
+            if output_format == "jsonl":
+                f.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in finished)
+            else:
+                writer = csv.DictWriter(f, fieldnames=COLUMNS)
+                writer.writeheader()
+                writer.writerows(finished)
+        os.replace(temporary_path, output_path)
+    return {row["path"] for row in finished}
+
+
+def _init_worker(model_path, intra_op_threads, root):
+    import logging
+
+    import tensorflow as tf
+
+    # Must be set before the first op runs in this process
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    # The app module warns about the missing Streamlit script context on every element call
+    logging.disable(logging.WARNING)
+
+    import app
+    from compiled_inference import CompiledModel
+    from inference_backends import KerasBackend, load_backend
+    from model_registry import class_names_for
+
+    model = load_backend(model_path)
+    if isinstance(model, KerasBackend):
+        model = CompiledModel(model.model).warm_up()
+    _worker_state.update(app=app, model=model, root=root,
+                         class_names=class_names_for(model_path, app.CLASS_NAMES))
+
+
+def _row(path, weed=None, confidence=None, error=None):
+    info = _worker_state["app"].WEED_INFO.get(weed, {})
+    return {
+        "path": path,
+        "weed": weed,
+        "confidence": None if confidence is None else round(confidence, 4),
+        "description": info.get("description"),
+        "recommendation": info.get("recommendation"),
+        "pesticides": info.get("pesticides", []),
+        "error": error,
+    }
+
+
+# Classifies one shard of relative paths; unreadable images get an error row instead of failing the shard
+def _classify_shard(paths):
+    from PIL import Image
+    from preprocessing import model_input_size
+
+    app, model, root = _worker_state["app"], _worker_state["model"], _worker_state["root"]
+    target_size = model_input_size(model)
+    rows, images, readable = [], [], []
+    for path in paths:
+        try:
+            images.append(Image.open(os.path.join(root, path)))
+            readable.append(path)
+        except Exception as e:
+            rows.append(_row(path, error=f"could not open: {e}"))
+
+    batch = app.preprocess_images(images, target_size) if images else None
+    if images and batch is None:
+        # One broken file spoils the batch - decode one by one to find it
+        batches, decoded = [], []
+        for path, image in zip(readable, images):
+            image_array = app.preprocess_image(image, target_size)
+            if image_array is None:
+                rows.append(_row(path, error="could not decode"))
+            else:
+                batches.append(image_array)
+                decoded.append(path)
+        batch = np.concatenate(batches) if batches else None
+        readable = decoded
+    for image in images:
+        image.close()
+
+    if batch is not None:
+        class_names = _worker_state["class_names"]
+        try:
+            # The model is called directly rather than through app.classify_weeds, whose inference governor would
+            # size TensorFlow's thread pools again after this worker has started them
+            predictions = model.predict(batch, batch_size=len(batch), verbose=0)
+        except Exception as e:
+            rows.extend(_row(path, error=f"classification failed: {e}") for path in readable)
+        else:
+            for path, (weed, confidence) in zip(readable, app.top_predictions(predictions, class_names)):
+                rows.append(_row(path, weed, confidence))
+    return rows
+
+
+class ResultWriter:
+    def __init__(self, output_path, output_format, append):
+        self.output_format = output_format
+        self._file = open(output_path, "a" if append else "w", newline="", encoding="utf-8")
+        self._csv = None
+        if output_format == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=COLUMNS)
+            if self._file.tell() == 0:
+                self._csv.writeheader()
+
+    def write(self, rows):
+        for row in rows:
+            if self._csv is not None:
+                self._csv.writerow({**row, "pesticides": "; ".join(row["pesticides"])})
+            else:
+                self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        # Every batch reaches the file before the next one, so the output is a valid checkpoint
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+# Images per second since start and the time left at that rate
+class Progress:
+    def __init__(self, total, already_done=0, interval=5.0, stream=sys.stderr):
+        self.total = total
+        self.already_done = already_done
+        self.done = 0
+        self.errors = 0
+        self.interval = interval
+        self.stream = stream
+        self.start = time.perf_counter()
+        self._last_report = 0.0
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.start
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def update(self, rows):
+        self.done += len(rows)
+        self.errors += sum(row["error"] is not None for row in rows)
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval or self.done == self.total:
+            self._last_report = now
+            self.report()
+
+    def report(self):
+        remaining = self.total - self.done
+        eta = format_duration(remaining / self.rate) if self.rate else "?"
+        print(f"{self.already_done + self.done}/{self.already_done + self.total} images · "
+              f"{self.rate:.1f} images/s · {self.errors} errors · ETA {eta}", file=self.stream, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify every image under a directory with a process pool")
+    parser.add_argument("images", help="root of the image archive, searched recursively")
+    parser.add_argument("output", help="results file, .csv or .jsonl")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help=".keras or .tflite model")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) // 2))
+    parser.add_argument("--intra-op-threads", type=int,
+                        help="TensorFlow threads per worker (default: cores divided by workers)")
+    parser.add_argument("--batch-size", type=int, default=64, help="images per shard and per model call")
+    parser.add_argument("--format", choices=["csv", "jsonl"],
+                        help="output format (default: from the output file extension)")
+    parser.add_argument("--restart", action="store_true", help="overwrite the output instead of resuming")
+    args = parser.parse_args()
+
+    output_format = args.format or ("jsonl" if args.output.endswith((".jsonl", ".json")) else "csv")
+    done = set() if args.restart else finished_paths(args.output, output_format)
+    pending = [path for path in walk_images(args.images) if path not in done]
+    print(f"{len(pending)} images to classify, {len(done)} already in {args.output}", file=sys.stderr)
+    if not pending:
+        return
+
+    intra_op_threads = args.intra_op_threads or max(1, (os.cpu_count() or 1) // args.workers)
+    shards = [pending[start:start + args.batch_size] for start in range(0, len(pending), args.batch_size)]
+    writer = ResultWriter(args.output, output_format, append=bool(done))
+    progress = Progress(len(pending), already_done=len(done))
+    # Spawned, not forked, so no worker inherits a half-initialized TensorFlow runtime
+    context = multiprocessing.get_context("spawn")
+    try:
+        with context.Pool(args.workers, initializer=_init_worker,
+                          initargs=(args.model, intra_op_threads, args.images)) as pool:
+            for rows in pool.imap_unordered(_classify_shard, shards):
+                writer.write(rows)
+                progress.update(rows)
+    except KeyboardInterrupt:
+        print("\nInterrupted - run the same command again to resume", file=sys.stderr)
+        sys.exit(130)
+    finally:
+        writer.close()
+    print(f"Classified {progress.done} images in {format_duration(time.perf_counter() - progress.start)} "
+          f"({progress.rate:.1f} images/s), {progress.errors} errors", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
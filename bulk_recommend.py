@@ -0,0 +1,239 @@
+"""Vectorized bulk recommendations for field records.
+
+The weed, soil, temperature-band and crop rules are compiled once into
+lookup tables. Whole columns of records are then mapped to integer codes
+and resolved with array indexing instead of one `get_pesticide_recommendation`
+call per field. Results are identical to the per-call function for the same
+Python values. In particular, a temperature that is None or a string gets
+the empty fallback result, as it does there. Only the CSV reader parses text
+temperatures into numbers.
+
+    # CSV with weed_type, soil_type, temperature and crop_type columns (extra columns pass through)
+    python bulk_recommend.py fields.csv recommendations.csv
+
+    # Streams in chunks, so files larger than memory work; "-" is stdin / stdout
+    cat fields.csv | python bulk_recommend.py - - --chunk-size 50000
+"""
+import argparse
+import csv
+import sys
+from itertools import islice
+
+import numpy as np
+
+INPUT_COLUMNS = ["weed_type", "soil_type", "temperature", "crop_type"]
+OUTPUT_COLUMNS = ["pesticides", "recommendation", "considerations"]
+TEMPERATURE_BANDS = ["hot", "cold", "ideal"]
+
+
+# Element by element, so tuples are stored as objects rather than broadcast into a 2-D array
+def _object_array(items):
+    array = np.empty(len(items), dtype=object)
+    for i, item in enumerate(items):
+        array[i] = item
+    return array
+
+
+class RecommendationTable:
+    def __init__(self, weed_info, soil_advice, crop_advice, temperature_advice,
+                 hot_temperature, cold_temperature):
+        self.hot_temperature = hot_temperature
+        self.cold_temperature = cold_temperature
+
+        # One extra slot at the end of each vocabulary for values without a rule
+        self._weed_codes = {weed: i for i, weed in enumerate(weed_info)}
+        self._soil_codes = {soil: i for i, soil in enumerate(soil_advice)}
+        self._crop_codes = {crop: i for i, crop in enumerate(crop_advice)}
+
+        infos = [*weed_info.values(), {}]
+        self._pesticides = _object_array([tuple(info.get("pesticides", [])) for info in infos])
+        self._general = _object_array([info.get("recommendation", "") for info in infos])
+
+        # Every soil x temperature band x crop combination, in the order the per-call function builds them
+        soils = [*soil_advice.values(), None]
+        crops = [*crop_advice.values(), None]
+        self._considerations = np.empty((len(soils), len(TEMPERATURE_BANDS), len(crops)), dtype=object)
+        for s, soil in enumerate(soils):
+            for t, band in enumerate(TEMPERATURE_BANDS):
+                for c, crop in enumerate(crops):
+                    advice = [soil, temperature_advice[band], crop]
+                    self._considerations[s, t, c] = tuple(item for item in advice if item is not None)
+
+    # Integer code per value and a mask of values the per-call function would fail on.
+    # Only distinct values are examined in Python; rows are mapped with a C-level map()
+    @staticmethod
+    def _encode(values, codes, lowercase):
+        values = list(values)
+        unknown = len(codes)
+        try:
+            distinct = dict.fromkeys(values)
+        except TypeError:
+            distinct = None
+
+        if distinct is None:
+            # Unhashable values somewhere in the column - fall back to one lookup per row
+            result = np.full(len(values), unknown, dtype=np.intp)
+            invalid = np.zeros(len(values), dtype=bool)
+            for i, value in enumerate(values):
+                try:
+                    result[i] = codes.get(value.lower() if lowercase else value, unknown)
+                except (AttributeError, TypeError):
+                    invalid[i] = True
+            return result, invalid
+
+        lookup = {}
+        for value in distinct:
+            try:
+                lookup[value] = codes.get(value.lower() if lowercase else value, unknown)
+            except (AttributeError, TypeError):
+                lookup[value] = -1
+        result = np.fromiter(map(lookup.__getitem__, values), dtype=np.intp, count=len(values))
+        invalid = result < 0
+        result[invalid] = unknown
+        return result, invalid
+
+    def _band(self, value):
+        if value > self.hot_temperature:
+            return TEMPERATURE_BANDS.index("hot")
+        if value < self.cold_temperature:
+            return TEMPERATURE_BANDS.index("cold")
+        return TEMPERATURE_BANDS.index("ideal")
+
+    # Temperature band code per value and a mask of values the per-call function would fail on. Numbers of any
+    # type are compared as they are; None and strings are invalid there, so they are here too (no float() coercion).
+    # Numeric arrays are banded with vectorized comparisons, anything else one distinct value at a time
+    def _bands(self, values):
+        if isinstance(values, np.ndarray) and values.dtype.kind in "biuf":
+            # NaN compares false both ways, so it lands in "ideal" exactly like the per-call function
+            bands = np.full(len(values), TEMPERATURE_BANDS.index("ideal"), dtype=np.intp)
+            bands[values < self.cold_temperature] = TEMPERATURE_BANDS.index("cold")
+            bands[values > self.hot_temperature] = TEMPERATURE_BANDS.index("hot")
+            return bands, np.zeros(len(values), dtype=bool)
+
+        values = list(values)
+        try:
+            distinct = dict.fromkeys(values)
+        except TypeError:
+            distinct = None
+
+        if distinct is None:
+            # Unhashable values somewhere in the column - fall back to one comparison per row
+            bands = np.empty(len(values), dtype=np.intp)
+            for i, value in enumerate(values):
+                try:
+                    bands[i] = self._band(value)
+                except (TypeError, ValueError):
+                    bands[i] = -1
+        else:
+            lookup = {}
+            for value in distinct:
+                try:
+                    lookup[value] = self._band(value)
+                except (TypeError, ValueError):
+                    lookup[value] = -1
+            bands = np.fromiter(map(lookup.__getitem__, values), dtype=np.intp, count=len(values))
+        invalid = bands < 0
+        bands[invalid] = TEMPERATURE_BANDS.index("ideal")
+        return bands, invalid
+
+    # Columns of equal length in; object arrays of pesticides, recommendation and considerations out
+    def recommend(self, weed_types, soil_types, temperatures, crop_types):
+        weed_codes, weed_invalid = self._encode(weed_types, self._weed_codes, lowercase=False)
+        soil_codes, soil_invalid = self._encode(soil_types, self._soil_codes, lowercase=True)
+        crop_codes, crop_invalid = self._encode(crop_types, self._crop_codes, lowercase=True)
+        bands, temperature_invalid = self._bands(temperatures)
+
+        pesticides = self._pesticides[weed_codes]
+        general = self._general[weed_codes]
+        considerations = self._considerations[soil_codes, bands, crop_codes]
+
+        # Rows the per-call function would reject get its empty fallback result
+        invalid = weed_invalid | soil_invalid | crop_invalid | temperature_invalid
+        for i in np.flatnonzero(invalid):
+            pesticides[i] = ()
+            general[i] = ""
+            considerations[i] = ()
+        return {"pesticides": pesticides, "recommendation": general, "considerations": considerations}
+
+    # Same (pesticides, general_rec, recommendations) tuples as get_pesticide_recommendation
+    def recommend_rows(self, weed_types, soil_types, temperatures, crop_types):
+        result = self.recommend(weed_types, soil_types, temperatures, crop_types)
+        return [
+            (list(pesticides), general, list(considerations))
+            for pesticides, general, considerations in zip(
+                result["pesticides"], result["recommendation"], result["considerations"]
+            )
+        ]
+
+
+def build_table():
+    from app import (
+        COLD_TEMPERATURE,
+        CROP_ADVICE,
+        HOT_TEMPERATURE,
+        SOIL_ADVICE,
+        TEMPERATURE_ADVICE,
+        WEED_INFO,
+    )
+
+    return RecommendationTable(WEED_INFO, SOIL_ADVICE, CROP_ADVICE, TEMPERATURE_ADVICE,
+                               HOT_TEMPERATURE, COLD_TEMPERATURE)
+
+
+# CSV cells are text: numbers are parsed, anything else (a blank cell, "n/a") gets the empty fallback result
+def parse_temperature(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return None
+
+
+# Reads and writes chunk_size rows at a time; returns the number of rows processed
+def recommend_csv(input_file, output_file, table, chunk_size=10000, separator="; "):
+    reader = csv.DictReader(input_file)
+    missing = [column for column in INPUT_COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"input is missing column(s): {', '.join(missing)}")
+
+    writer = csv.DictWriter(output_file, fieldnames=[*reader.fieldnames, *OUTPUT_COLUMNS])
+    writer.writeheader()
+    total = 0
+    while True:
+        rows = list(islice(reader, chunk_size))
+        if not rows:
+            return total
+        weed_types, soil_types, temperatures, crop_types = ([row[column] for row in rows] for column in INPUT_COLUMNS)
+        result = table.recommend(weed_types, soil_types, [parse_temperature(text) for text in temperatures], crop_types)
+        for row, pesticides, general, considerations in zip(
+            rows, result["pesticides"], result["recommendation"], result["considerations"]
+        ):
+            row["pesticides"] = separator.join(pesticides)
+            row["recommendation"] = general
+            row["considerations"] = separator.join(considerations)
+        writer.writerows(rows)
+        total += len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk pesticide recommendations for CSV field records")
+    parser.add_argument("input", help='CSV with weed_type, soil_type, temperature, crop_type columns ("-" for stdin)')
+    parser.add_argument("output", help='CSV to write ("-" for stdout)')
+    parser.add_argument("--chunk-size", type=int, default=10000, help="rows processed per vectorized pass")
+    parser.add_argument("--separator", default="; ", help="joins pesticides and considerations in one cell")
+    args = parser.parse_args()
+
+    table = build_table()
+    input_file = sys.stdin if args.input == "-" else open(args.input, newline="", encoding="utf-8")
+    output_file = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+    try:
+        total = recommend_csv(input_file, output_file, table, args.chunk_size, args.separator)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+    print(f"Wrote recommendations for {total} rows", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
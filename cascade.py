@@ -0,0 +1,186 @@
+"""Confidence-gated model cascade.
+
+A lightweight first-stage model classifies every image. Only images whose
+top probability is below the threshold are escalated to the full model, so
+clear close-up shots never pay for the full network. `Cascade` has the same
+`input_shape` / `predict` interface as a Keras model and the other backends,
+so `classify_weeds` runs it unchanged. The first stage is pluggable. It can
+be any `.keras` or `.tflite` model with the same 15 classes. The app only
+offers the cascade once one is configured. `evaluate` falls back to a small
+untrained stand-in, which is never confident and escalates everything; it
+only measures the first stage's cost until a real one is trained.
+
+    # Throughput gain and accuracy cost per threshold, on a folder with one subfolder per class
+    python cascade.py evaluate labeled/ --first-stage weed_first_stage.tflite --thresholds 0.6 0.8 0.9
+"""
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.8
+PATH_FIRST_STAGE = "first stage"
+PATH_FULL = "full model"
+
+
+# Small stand-in first stage: a quarter of the full model's input resolution, 8 filters
+def build_first_stage(input_shape=(60, 60, 3)):
+    from standin_model import build_standin_model
+
+    return build_standin_model(input_shape=input_shape, width=8, seed=1)
+
+
+# A .keras / .tflite first-stage model, or the stand-in when path is None
+def load_first_stage(path=None):
+    if path is None:
+        return build_first_stage()
+    from inference_backends import load_backend
+
+    return load_backend(path)
+
+
+# How many images the first stage answered and how many it escalated.
+# Cascades built over the same models can share one, so the counts outlive any one Cascade object
+class CascadeCounts:
+    def __init__(self):
+        self.first_stage_answers = 0
+        self.escalations = 0
+        self._lock = threading.Lock()
+
+    def add(self, first_stage_answers, escalations):
+        with self._lock:
+            self.first_stage_answers += first_stage_answers
+            self.escalations += escalations
+
+
+class Cascade:
+    name = "cascade"
+
+    def __init__(self, first_stage, full_model, threshold=DEFAULT_THRESHOLD, first_stage_name="stand-in",
+                 counts=None):
+        self.first_stage = first_stage
+        self.full_model = full_model
+        self.threshold = threshold
+        self.first_stage_name = first_stage_name
+        self.input_shape = full_model.input_shape
+        self.counts = counts if counts is not None else CascadeCounts()
+
+    # Distinguishes cached predictions made with different cascade settings
+    @property
+    def identity(self):
+        return f"cascade:{self.first_stage_name}:{self.threshold}"
+
+    @property
+    def first_stage_answers(self):
+        return self.counts.first_stage_answers
+
+    @property
+    def escalations(self):
+        return self.counts.escalations
+
+    @property
+    def escalation_rate(self):
+        total = self.first_stage_answers + self.escalations
+        return self.escalations / total if total else 0.0
+
+    def predict(self, image_batch, batch_size=32, verbose=0, return_paths=False):
+        image_batch = np.asarray(image_batch, dtype=np.float32)
+        predictions = np.array(
+            self.first_stage.predict(self._first_stage_input(image_batch), batch_size=batch_size, verbose=0),
+            dtype=np.float32,
+        )
+        escalate = predictions.max(axis=1) < self.threshold
+        if escalate.any():
+            predictions[escalate] = self.full_model.predict(image_batch[escalate], batch_size=batch_size, verbose=0)
+
+        escalated = int(escalate.sum())
+        self.counts.add(len(image_batch) - escalated, escalated)
+        if return_paths:
+            return predictions, [PATH_FULL if e else PATH_FIRST_STAGE for e in escalate]
+        return predictions
+
+    def _first_stage_input(self, image_batch):
+        size = tuple(self.first_stage.input_shape[1:3])
+        if size == image_batch.shape[1:3]:
+            return image_batch
+        import tensorflow as tf
+
+        return tf.image.resize(image_batch, size).numpy()
+
+
+def load_labeled_folder(directory, class_names, target_size):
+    from tflite_tools import find_images, load_images
+
+    paths, labels = [], []
+    for label, class_name in enumerate(class_names):
+        class_paths = find_images(os.path.join(directory, class_name))
+        paths.extend(class_paths)
+        labels.extend([label] * len(class_paths))
+    if not paths:
+        raise SystemExit(f"no images found in class subfolders of {directory}")
+    return load_images(paths, target_size), np.array(labels)
+
+
+# Best of repeats, so a scheduling hiccup does not decide the speedup
+def timed_predict(model, images, batch_size, repeats=3, **kwargs):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        predictions = model.predict(images, batch_size=batch_size, verbose=0, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return predictions, best
+
+
+def evaluate(args):
+    from app import CLASS_NAMES
+    from preprocessing import model_input_size
+    from standin_model import load_or_build
+
+    full_model, full_description = load_or_build(args.model)
+    first_stage = load_first_stage(args.first_stage)
+    images, labels = load_labeled_folder(args.images, CLASS_NAMES, model_input_size(full_model))
+    print(f"{len(images)} labeled images, full model: {full_description}, "
+          f"first stage: {args.first_stage or 'stand-in'}")
+
+    # Warm both models so graph tracing is not billed to the first row
+    full_model.predict(images[:1], verbose=0)
+    Cascade(first_stage, full_model, threshold=0.0).predict(images[:1])
+
+    full_predictions, full_time = timed_predict(full_model, images, args.batch_size, args.repeats)
+    full_top1 = full_predictions.argmax(axis=1)
+    print(f"\n{'threshold':>10}{'escalated':>11}{'accuracy':>10}{'vs full':>9}{'images/s':>10}{'speedup':>9}")
+    print(f"{'full':>10}{100.0:>10.1f}%{(full_top1 == labels).mean() * 100:>9.1f}%{100.0:>8.1f}%"
+          f"{len(images) / full_time:>10.1f}{1.0:>8.2f}x")
+
+    for threshold in args.thresholds:
+        cascade = Cascade(first_stage, full_model, threshold)
+        (predictions, paths), cascade_time = timed_predict(cascade, images, args.batch_size, args.repeats,
+                                                           return_paths=True)
+        top1 = predictions.argmax(axis=1)
+        escalated = paths.count(PATH_FULL) / len(paths)
+        print(f"{threshold:>10.2f}{escalated * 100:>10.1f}%{(top1 == labels).mean() * 100:>9.1f}%"
+              f"{(top1 == full_top1).mean() * 100:>8.1f}%{len(images) / cascade_time:>10.1f}"
+              f"{full_time / cascade_time:>8.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WeedAI confidence-gated model cascade")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    evaluate_parser = subparsers.add_parser("evaluate", help="throughput and accuracy per threshold")
+    evaluate_parser.add_argument("images", help="folder with one subfolder of images per weed class")
+    evaluate_parser.add_argument("--model", default="crop_weed_classifier_final.keras",
+                                 help="full model; a synthetic stand-in is used if it does not exist")
+    evaluate_parser.add_argument("--first-stage", help=".keras or .tflite first-stage model (default: stand-in)")
+    evaluate_parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.6, 0.7, 0.8, 0.9])
+    evaluate_parser.add_argument("--batch-size", type=int, default=32)
+    evaluate_parser.add_argument("--repeats", type=int, default=3, help="timed passes per row; the fastest counts")
+
+    args = parser.parse_args()
+    evaluate(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Retrace-free compiled inference for Keras models.
+
+`model.predict` sets up a data pipeline on every call, and inputs whose shape
+or dtype varies from call to call make TensorFlow retrace. Together these
+dominate single-image latency. `CompiledModel` wraps the model in one
+`tf.function` whose input signature is fixed to the model's input size.
+Batches are split into chunks of at most `batch_size` images and padded up to
+a small set of bucket sizes, so only a few distinct shapes ever reach the
+graph. Scaling when the input is uint8 runs inside the graph. An input of
+another size is resized once before it is chunked, so it never reaches the
+graph as a new shape. With `jit_compile=True` the function is also compiled
+with XLA on CPU, once per bucket. `traces` counts how often the Python
+function was traced; after construction it should stay at 1.
+
+`CompiledModel` has the same `input_shape` / `predict` interface as the
+other backends, so `classify_weeds` runs it unchanged. The graph also
+returns the input of the model's last Dense layer, and
+`predict_with_embeddings` hands it out with the probabilities from the
+same forward pass (see embedding_search.py).
+"""
+import threading
+
+import numpy as np
+
+from embedding_search import with_embeddings
+
+DEFAULT_BUCKETS = (1, 4, 16, 64)
+
+
+class CompiledModel:
+    name = "compiled"
+    # classify_weeds can skip its own resize fallback
+    resizes_inputs = True
+
+    def __init__(self, model, buckets=DEFAULT_BUCKETS, jit_compile=False, input_dtype=np.float32):
+        import tensorflow as tf
+
+        self.model = model
+        self.buckets = tuple(sorted(buckets))
+        self.jit_compile = jit_compile
+        self.input_dtype = np.dtype(input_dtype)
+        self.input_shape = model.input_shape
+        self.embedding_dim = None
+        self.traces = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+        height, width = model.input_shape[1:3]
+        scale = 1.0 / 255.0 if self.input_dtype == np.uint8 else 1.0
+
+        network = model
+        try:
+            network = with_embeddings(model)
+            self.embedding_dim = int(np.prod(network.outputs[1].shape[1:]))
+        except Exception:
+            # No functional graph to tap (e.g. a subclassed model) - probabilities only
+            pass
+
+        def infer(images):
+            # Runs only while tracing - a retrace shows up as traces > 1
+            self.traces += 1
+            images = tf.cast(images, tf.float32) * scale
+            if network is model:
+                probabilities = model(images, training=False)
+                return probabilities, tf.zeros((tf.shape(images)[0], 0))
+            probabilities, embeddings = network(images, training=False)
+            return probabilities, tf.reshape(embeddings, (tf.shape(embeddings)[0], -1))
+
+        self._infer = tf.function(
+            infer,
+            input_signature=[tf.TensorSpec([None, height, width, 3], tf.as_dtype(self.input_dtype))],
+            jit_compile=jit_compile,
+            reduce_retracing=True,
+        )
+        # Traced here so the first request does not pay for it
+        self._infer.get_concrete_function()
+
+    # Smallest bucket of at most limit images that holds n, else the largest such bucket (and the rest is split off)
+    def bucket_for(self, n, limit=None):
+        buckets = [bucket for bucket in self.buckets if limit is None or bucket <= limit] or self.buckets[:1]
+        for bucket in buckets:
+            if bucket >= n:
+                return bucket
+        return buckets[-1]
+
+    # One call per bucket, so the XLA compilations happen up front
+    def warm_up(self):
+        height, width = self.input_shape[1:3]
+        for bucket in self.buckets:
+            self._infer(np.zeros((bucket, height, width, 3), dtype=self.input_dtype))
+        return self
+
+    @property
+    def has_embeddings(self):
+        return self.embedding_dim is not None
+
+    # batch_size bounds the images - padding included - that go through the graph at once
+    def predict(self, image_batch, batch_size=32, verbose=0):
+        return self._run(image_batch, batch_size)[0]
+
+    # (probabilities, embeddings) from one forward pass
+    def predict_with_embeddings(self, image_batch, batch_size=32):
+        return self._run(image_batch, batch_size)
+
+    def _resize(self, image_batch):
+        import tensorflow as tf
+
+        resized = tf.image.resize(image_batch, self.input_shape[1:3]).numpy()
+        if self.input_dtype == np.uint8:
+            resized = np.clip(np.rint(resized), 0, 255)
+        return resized.astype(self.input_dtype)
+
+    def _run(self, image_batch, batch_size=32):
+        image_batch = np.asarray(image_batch, dtype=self.input_dtype)
+        if len(image_batch) and image_batch.shape[1:3] != tuple(self.input_shape[1:3]):
+            image_batch = self._resize(image_batch)
+        limit = max(1, batch_size or self.buckets[-1])
+        probabilities, embeddings = [], []
+        start = 0
+        while start < len(image_batch):
+            bucket = self.bucket_for(len(image_batch) - start, limit)
+            chunk = image_batch[start:start + bucket]
+            start += len(chunk)
+            if bucket != len(chunk):
+                padded = np.zeros((bucket, *chunk.shape[1:]), dtype=self.input_dtype)
+                padded[:len(chunk)] = chunk
+                chunk_probabilities, chunk_embeddings = self._infer(padded)
+            else:
+                chunk_probabilities, chunk_embeddings = self._infer(chunk)
+            probabilities.append(chunk_probabilities.numpy()[:len(chunk)])
+            embeddings.append(chunk_embeddings.numpy()[:len(chunk)])
+        with self._lock:
+            self.calls += 1
+        if not probabilities:
+            return (np.empty((0, self.model.output_shape[-1]), np.float32),
+                    np.empty((0, self.embedding_dim or 0), np.float32))
+        return np.concatenate(probabilities), np.concatenate(embeddings)
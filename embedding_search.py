@@ -0,0 +1,367 @@
+"""Embeddings of classified images and similarity search over confirmed ones.
+
+When a prediction is uncertain, the most similar images an agronomist has
+already confirmed are often the quickest way to settle it. The embedding of
+an image is the input of the classifier's last Dense layer. `CompiledModel`
+returns it from the same forward pass as the probabilities (see
+`with_embeddings`), so it costs no extra inference.
+
+Confirmed embeddings go into an `EmbeddingStore`, one directory per model
+file. Embeddings from different models are not comparable. Each store holds
+a float16 matrix of L2-normalised rows, memory-mapped from `vectors.npy`,
+which doubles in capacity as it fills. Species, image hash and time go one
+JSON line per row in `entries.jsonl`, and a small thumbnail of each image
+goes in `thumbnails/`. A search converts the matrix to float32 one chunk at
+a time, scores every query in the batch with a single matrix product, and
+keeps the top k of each chunk with `argpartition`. Memory stays bounded by
+the chunk size, and a query stays in the milliseconds at hundreds of
+thousands of rows.
+
+    # Add a folder of confirmed images (one subfolder per weed class) to the model's store
+    python embedding_search.py index labeled/ --model crop_weed_classifier_final.keras
+
+    # Search latency and store size with synthetic embeddings
+    python embedding_search.py bench --rows 300000 --dim 256 --queries 1 16
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+DEFAULT_STORE_DIR = os.path.join(os.path.expanduser("~"), ".local", "share", "weedai", "embeddings")
+SEARCH_CHUNK_ROWS = 4096
+THUMBNAIL_SIZE = (160, 160)
+
+
+# The input of the model's last Dense layer - the features its classifier head sees
+def penultimate_output(model):
+    from tensorflow import keras
+
+    for layer in reversed(model.layers):
+        if isinstance(layer, keras.layers.Dense):
+            return layer.input
+    return model.layers[-1].input
+
+
+# Same weights, one forward pass, two outputs: (probabilities, embeddings)
+def with_embeddings(model):
+    from tensorflow import keras
+
+    return keras.Model(model.inputs, [model.outputs[0], penultimate_output(model)])
+
+
+def normalize(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+# Store directory for a model file - a retrained model, with a new size or modification time, gets a fresh store
+def store_directory(root, model_path):
+    from prediction_cache import model_identity
+
+    try:
+        identity = model_identity(model_path)
+    except OSError:
+        identity = os.path.abspath(model_path)
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(root, f"{stem}-{hashlib.sha256(identity.encode('utf-8')).hexdigest()[:12]}")
+
+
+class EmbeddingStore:
+    def __init__(self, directory, dim, initial_capacity=1024, search_threads=None):
+        from numpy.lib.format import open_memmap
+
+        search_threads = search_threads or min(4, os.cpu_count() or 1)
+
+        self.directory = directory
+        self.dim = dim
+        self.searches = 0
+        self._vectors_path = os.path.join(directory, "vectors.npy")
+        self._entries_path = os.path.join(directory, "entries.jsonl")
+        self._thumbnail_dir = os.path.join(directory, "thumbnails")
+        os.makedirs(self._thumbnail_dir, exist_ok=True)
+
+        if os.path.exists(self._vectors_path):
+            self._vectors = np.load(self._vectors_path, mmap_mode="r+")
+            if self._vectors.shape[1] != dim:
+                raise ValueError(f"{self._vectors_path} holds {self._vectors.shape[1]}-dimensional embeddings, "
+                                 f"not {dim}")
+        else:
+            self._vectors = open_memmap(self._vectors_path, mode="w+", dtype=np.float16,
+                                        shape=(initial_capacity, dim))
+
+        # Rows are written before their entry line, so the entries decide how many rows are valid
+        self.species, self.image_hashes, self.timestamps = [], [], []
+        if os.path.exists(self._entries_path):
+            with open(self._entries_path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        # Cut off by a crash - overwritten by the next add
+                        break
+                    entry = json.loads(line)
+                    self.species.append(entry["species"])
+                    self.image_hashes.append(entry["image_hash"])
+                    self.timestamps.append(entry["ts"])
+        self._known = set(self.image_hashes)
+        self._lock = threading.Lock()
+        # Widening float16 is the bulk of a search and numpy does it on one core, so chunks are spread over the cores
+        self._pool = ThreadPoolExecutor(search_threads) if search_threads > 1 else None
+        self._buffers = threading.local()
+
+    def __len__(self):
+        return len(self.species)
+
+    @property
+    def capacity(self):
+        return len(self._vectors)
+
+    @property
+    def nbytes(self):
+        return self._vectors.nbytes
+
+    def __contains__(self, image_hash):
+        return image_hash in self._known
+
+    # Appends embeddings with their species; images already in the store are skipped. thumbnails are PIL images
+    # or None. Returns the number added
+    def add(self, vectors, species, image_hashes, thumbnails=None):
+        vectors = normalize(vectors)
+        thumbnails = thumbnails if thumbnails is not None else [None] * len(vectors)
+        with self._lock:
+            new, seen = [], set(self._known)
+            for i, image_hash in enumerate(image_hashes):
+                if image_hash not in seen:
+                    seen.add(image_hash)
+                    new.append(i)
+            if not new:
+                return 0
+            start = len(self.species)
+            end = start + len(new)
+            if end > self.capacity:
+                self._grow(end)
+            self._vectors[start:end] = vectors[new]
+            self._vectors.flush()
+
+            ts = time.time()
+            lines = []
+            for i in new:
+                if thumbnails[i] is not None:
+                    self._save_thumbnail(thumbnails[i], image_hashes[i])
+                lines.append(json.dumps({"species": species[i], "image_hash": image_hashes[i], "ts": ts}) + "\n")
+            self._truncate_partial_entry()
+            with open(self._entries_path, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+            for i in new:
+                self.species.append(species[i])
+                self.image_hashes.append(image_hashes[i])
+                self.timestamps.append(ts)
+                self._known.add(image_hashes[i])
+        return len(new)
+
+    def entry(self, row):
+        thumbnail = os.path.join(self._thumbnail_dir, f"{self.image_hashes[row]}.jpg")
+        return {
+            "row": row,
+            "species": self.species[row],
+            "image_hash": self.image_hashes[row],
+            "ts": self.timestamps[row],
+            "thumbnail": thumbnail if os.path.exists(thumbnail) else None,
+        }
+
+    # Top-k cosine similarity for each row of queries: one list of (similarity, entry) per query, best first.
+    # Rows whose image hash is in exclude are skipped, e.g. the query image itself
+    def search(self, queries, k=5, exclude=()):
+        queries = normalize(queries)
+        with self._lock:
+            count = len(self.species)
+            matrix = self._vectors[:count]
+            self.searches += 1
+        if not count:
+            return [[] for _ in queries]
+
+        candidates = min(count, k + len(exclude))
+        starts = range(0, count, SEARCH_CHUNK_ROWS)
+        if self._pool is not None and len(starts) > 1:
+            chunks = list(self._pool.map(lambda start: self._top_of_chunk(matrix, start, queries, candidates), starts))
+        else:
+            chunks = [self._top_of_chunk(matrix, start, queries, candidates) for start in starts]
+        rows = np.concatenate([chunk_rows for chunk_rows, _ in chunks])
+        scores = np.concatenate([chunk_scores for _, chunk_scores in chunks])
+        order = np.argsort(-scores, axis=0)
+
+        results = []
+        for q in range(len(queries)):
+            matches = []
+            for r in order[:, q]:
+                row = int(rows[r, q])
+                if self.image_hashes[row] in exclude:
+                    continue
+                matches.append((float(scores[r, q]), self.entry(row)))
+                if len(matches) == k:
+                    break
+            results.append(matches)
+        return results
+
+    # Rows and scores of the best candidates per query within one chunk of the matrix
+    def _top_of_chunk(self, matrix, start, queries, candidates):
+        chunk = matrix[start:start + SEARCH_CHUNK_ROWS]
+        rows = len(chunk)
+        buffer = getattr(self._buffers, "buffer", None)
+        if buffer is None:
+            buffer = self._buffers.buffer = np.empty((SEARCH_CHUNK_ROWS, self.dim), dtype=np.float32)
+        # float16 has no BLAS kernels - the chunk is widened into a reused, cache-sized buffer and scored in one product
+        np.copyto(buffer[:rows], chunk)
+        scores = buffer[:rows] @ queries.T
+        take = min(candidates, rows)
+        top = np.argpartition(scores, rows - take, axis=0)[rows - take:]
+        return top + start, np.take_along_axis(scores, top, axis=0)
+
+    # Doubles the matrix into a new file; searches already holding the old mapping keep reading it
+    def _grow(self, needed):
+        from numpy.lib.format import open_memmap
+
+        count = len(self.species)
+        tmp_path = f"{self._vectors_path}.{os.getpid()}.tmp"
+        grown = open_memmap(tmp_path, mode="w+", dtype=np.float16, shape=(max(needed, 2 * self.capacity), self.dim))
+        grown[:count] = self._vectors[:count]
+        grown.flush()
+        del grown
+        os.replace(tmp_path, self._vectors_path)
+        self._vectors = np.load(self._vectors_path, mmap_mode="r+")
+
+    def _truncate_partial_entry(self):
+        if not os.path.exists(self._entries_path):
+            return
+        with open(self._entries_path, "rb+") as f:
+            data = f.read()
+            complete = data.rfind(b"\n") + 1
+            if complete < len(data):
+                f.truncate(complete)
+
+    def _save_thumbnail(self, image, image_hash):
+        thumbnail = image.convert("RGB")
+        thumbnail.thumbnail(THUMBNAIL_SIZE)
+        thumbnail.save(os.path.join(self._thumbnail_dir, f"{image_hash}.jpg"), format="JPEG", quality=80)
+
+
+# Embeddings of recent predictions by prediction cache key, so a result shown later can still be searched
+class RecentEmbeddings:
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+            return embedding
+
+    def put(self, key, embedding):
+        with self._lock:
+            self._entries[key] = np.asarray(embedding, dtype=np.float16)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def index_folder(args):
+    from PIL import Image
+
+    from app import CLASS_NAMES
+    from compiled_inference import CompiledModel
+    from preprocessing import load_batch, model_input_size
+    from standin_model import load_or_build
+
+    model, description = load_or_build(args.model)
+    model = CompiledModel(model)
+    if not model.has_embeddings:
+        raise SystemExit(f"{description} has no Dense classifier head to take embeddings from")
+    target_size = model_input_size(model)
+    paths = []
+    for species in sorted(os.listdir(args.images)):
+        folder = os.path.join(args.images, species)
+        if species in CLASS_NAMES and os.path.isdir(folder):
+            paths.extend((os.path.join(folder, name), species) for name in sorted(os.listdir(folder))
+                         if name.lower().endswith((".jpg", ".jpeg", ".png")))
+    if not paths:
+        raise SystemExit(f"no images found in class subfolders of {args.images}")
+
+    store = EmbeddingStore(store_directory(args.store, args.model), model.embedding_dim)
+    print(f"{len(paths)} images, model: {description}, store: {store.directory} ({len(store)} rows)")
+    added = 0
+    start = time.perf_counter()
+    for offset in range(0, len(paths), args.batch_size):
+        chunk = paths[offset:offset + args.batch_size]
+        image_hashes, images = [], []
+        for path, _ in chunk:
+            with open(path, "rb") as f:
+                image_hashes.append(hashlib.sha256(f.read()).hexdigest())
+            images.append(Image.open(path))
+        _, embeddings = model.predict_with_embeddings(load_batch(images, target_size))
+        added += store.add(embeddings, [species for _, species in chunk], image_hashes, images)
+        for image in images:
+            image.close()
+    print(f"Added {added} embeddings in {time.perf_counter() - start:.1f} s; the store holds {len(store)}")
+
+
+def bench(args):
+    import tempfile
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = EmbeddingStore(tmp, args.dim, initial_capacity=args.rows)
+        start = time.perf_counter()
+        for offset in range(0, args.rows, 65536):
+            count = min(65536, args.rows - offset)
+            store.add(rng.standard_normal((count, args.dim), dtype=np.float32), ["bench"] * count,
+                      [f"{offset + i:064x}" for i in range(count)])
+        print(f"{len(store)} embeddings of {args.dim} dimensions: {store.nbytes / 2 ** 20:.1f} MiB float16 "
+              f"({store.nbytes * 2 / 2 ** 20:.1f} MiB as float32), added in {time.perf_counter() - start:.1f} s")
+
+        print(f"\n{'queries':>8}{'k':>5}{'ms per search':>16}{'ms per query':>15}")
+        for query_count in args.queries:
+            queries = rng.standard_normal((query_count, args.dim), dtype=np.float32)
+            best = float("inf")
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                store.search(queries, k=args.k)
+                best = min(best, time.perf_counter() - start)
+            print(f"{query_count:>8}{args.k:>5}{best * 1000:>16.2f}{best * 1000 / query_count:>15.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WeedAI embedding store and similarity search")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    index_parser = subparsers.add_parser("index", help="add a folder of confirmed images to the model's store")
+    index_parser.add_argument("images", help="folder with one subfolder of images per weed class")
+    index_parser.add_argument("--model", default="crop_weed_classifier_final.keras",
+                              help="model; a synthetic stand-in is used if it does not exist")
+    index_parser.add_argument("--store", default=DEFAULT_STORE_DIR, help="root of the per-model stores")
+    index_parser.add_argument("--batch-size", type=int, default=64)
+
+    bench_parser = subparsers.add_parser("bench", help="search latency over synthetic embeddings")
+    bench_parser.add_argument("--rows", type=int, default=300000)
+    bench_parser.add_argument("--dim", type=int, default=256)
+    bench_parser.add_argument("--queries", type=int, nargs="+", default=[1, 16])
+    bench_parser.add_argument("--k", type=int, default=5)
+    bench_parser.add_argument("--repeats", type=int, default=5)
+
+    args = parser.parse_args()
+    if args.command == "index":
+        index_folder(args)
+    else:
+        bench(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Tiled whole-field analysis.
+
+A wide field photo is cut into overlapping tiles and every tile is
+classified, instead of squashing the whole photo into one model input.
+Tiles are strided views of one decoded array (`sliding_window_view`), so
+no per-tile Python copies are made. Each inference batch is gathered with
+one vectorized fancy-index. Per-class tile probabilities give a density heatmap and
+aggregate weed coverage.
+"""
+import time
+
+import numpy as np
+from PIL import Image
+
+from preprocessing import decode_reduced
+
+# Colour used for the heatmap overlay (RGB)
+HEATMAP_COLOR = np.array([255, 64, 0], dtype=np.float32)
+
+
+# Decode at most max_dimension on the long side - a reduced JPEG decode does most of the work
+def decode_field_image(image, max_dimension=2048):
+    scale = min(1.0, max_dimension / max(image.size))
+    target_size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    image = decode_reduced(image, target_size)
+    if image.size != target_size:
+        image = image.resize(target_size, Image.BILINEAR, reducing_gap=3.0)
+    return np.asarray(image)
+
+
+# (rows, cols, tile, tile, 3) strided view over pixels - shares memory with pixels
+def tile_view(pixels, tile_size, stride):
+    height, width = pixels.shape[:2]
+    if height < tile_size or width < tile_size:
+        raise ValueError(f"image {width}x{height} is smaller than one {tile_size}px tile")
+    windows = np.lib.stride_tricks.sliding_window_view(pixels, (tile_size, tile_size), axis=(0, 1))
+    # sliding_window_view puts the window axes last: (rows, cols, 3, tile, tile)
+    return windows[::stride, ::stride].transpose(0, 1, 3, 4, 2)
+
+
+def predict_tiles(model, tiles, batch_size):
+    rows, cols = tiles.shape[:2]
+    input_size = tuple(model.input_shape[1:3])
+    probabilities = []
+    for start in range(0, rows * cols, batch_size):
+        # One vectorized gather + scale per batch; tiles are never copied one at a time
+        index = np.arange(start, min(start + batch_size, rows * cols))
+        batch = tiles[index // cols, index % cols].astype(np.float32) * np.float32(1.0 / 255.0)
+        if batch.shape[1:3] != input_size:
+            import tensorflow as tf
+            batch = tf.image.resize(batch, input_size).numpy()
+        probabilities.append(model.predict(batch, batch_size=len(batch), verbose=0))
+    return np.concatenate(probabilities).reshape(*tiles.shape[:2], -1)
+
+
+# Blend the per-tile density of one class over the image
+def render_heatmap(pixels, class_density, alpha=0.6):
+    height, width = pixels.shape[:2]
+    density = Image.fromarray((class_density * 255).astype(np.uint8))
+    density = np.asarray(density.resize((width, height), Image.BILINEAR), dtype=np.float32) / 255.0
+    weight = (density * alpha)[..., np.newaxis]
+    overlay = pixels.astype(np.float32) * (1.0 - weight) + HEATMAP_COLOR * weight
+    return Image.fromarray(overlay.astype(np.uint8))
+
+
+def analyze_field(model, image, class_names, tile_size=120, stride=60, batch_size=64,
+                  max_dimension=2048, min_confidence=0.5):
+    timings = {}
+
+    start = time.perf_counter()
+    pixels = decode_field_image(image, max_dimension)
+    timings["decode"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tiles = tile_view(pixels, tile_size, stride)
+    timings["tiling"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    probabilities = predict_tiles(model, tiles, batch_size)
+    timings["inference"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tile_classes = np.argmax(probabilities, axis=-1)
+    confident = np.max(probabilities, axis=-1) >= min_confidence
+    tile_count = tile_classes.size
+    counts = np.bincount(tile_classes[confident], minlength=len(class_names))
+    coverage = {
+        class_names[i]: float(counts[i] / tile_count * 100)
+        for i in np.argsort(counts)[::-1]
+        if counts[i]
+    }
+    uncertain = float(tile_count - int(confident.sum())) / tile_count * 100
+    timings["aggregation"] = time.perf_counter() - start
+
+    return {
+        "pixels": pixels,
+        "probabilities": probabilities,
+        "grid": tiles.shape[:2],
+        "tile_count": tile_count,
+        "coverage": coverage,
+        "uncertain": uncertain,
+        "timings": timings,
+    }
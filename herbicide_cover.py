@@ -0,0 +1,137 @@
+"""Smallest herbicide tank mixes that cover every detected weed.
+
+`WEED_INFO` lists the herbicides for each weed. `HerbicideIndex` inverts
+it once: each herbicide maps to a bitset of the weed classes it controls,
+held as a Python int with one bit per class. Given the detected weeds, it
+returns the smallest combinations of herbicides whose bitsets OR together
+to cover all of them.
+
+Products the caller excludes are removed from the allowed set first, which
+is also a bitset (one bit per herbicide). Nothing is excluded on the index's
+own authority. Soil and temperature only change the application advice that
+`get_pesticide_recommendation` gives, not which products are allowed, so the
+tank mix and the single-weed card never disagree. The crop only changes the
+order: combinations with the active ingredients of the products its advice
+recommends (`CROP_ADVICE_INGREDIENTS` in app.py) rank first among those of
+the same size.
+
+The search only keeps products whose coverage of the target is not a strict
+subset of another allowed product's. It tries sizes 1, 2, 3 and up, and
+stops at the first size that covers everything. Results are memoized on
+(target bitset, allowed bitset, preferred bitset). There are only 2^15
+possible targets, so per-tile and per-frame calls in bulk jobs are
+dictionary lookups.
+
+    # Latency per query, cold and memoized
+    python benchmarks/bench_cover.py
+"""
+from functools import lru_cache
+from itertools import combinations
+
+
+class HerbicideIndex:
+    # crop_preferred is CROP_ADVICE_INGREDIENTS: lower-case crop -> herbicides that suit it
+    def __init__(self, weed_info, crop_preferred=None):
+        self.weeds = list(weed_info)
+        self._weed_bits = {weed: 1 << i for i, weed in enumerate(self.weeds)}
+        self.herbicides = sorted({herbicide for info in weed_info.values() for herbicide in info.get("pesticides", [])})
+        self._herbicide_bits = {herbicide: 1 << j for j, herbicide in enumerate(self.herbicides)}
+
+        # The inverted index: herbicide -> bitset of the weeds it controls
+        self.coverage = [0] * len(self.herbicides)
+        for weed, info in weed_info.items():
+            for herbicide in info.get("pesticides", []):
+                self.coverage[self.herbicides.index(herbicide)] |= self._weed_bits[weed]
+
+        self._all_herbicides = (1 << len(self.herbicides)) - 1
+        self.crop_preferred = dict(crop_preferred or {})
+        self._crop_preferred = {crop: self.herbicide_mask(names) for crop, names in self.crop_preferred.items()}
+        self._search = lru_cache(maxsize=65536)(self._search_uncached)
+
+    # Names not in the index are ignored
+    def weed_mask(self, weeds):
+        mask = 0
+        for weed in weeds:
+            mask |= self._weed_bits.get(weed, 0)
+        return mask
+
+    def herbicide_mask(self, herbicides):
+        mask = 0
+        for herbicide in herbicides:
+            mask |= self._herbicide_bits.get(herbicide, 0)
+        return mask
+
+    def weeds_in(self, mask):
+        return [weed for weed, bit in self._weed_bits.items() if mask & bit]
+
+    # Herbicides controlling weed, straight from the inverted index
+    def herbicides_for(self, weed):
+        bit = self._weed_bits.get(weed, 0)
+        return [herbicide for herbicide, covered in zip(self.herbicides, self.coverage) if covered & bit]
+
+    # Bitset of every herbicide except the excluded ones
+    def allowed_mask(self, exclude=()):
+        return self._all_herbicides & ~self.herbicide_mask(exclude)
+
+    # The smallest combinations of herbicides, none of them excluded, covering weeds, best first. The crop
+    # is matched case-insensitively, like get_pesticide_recommendation, and only affects the order:
+    #   combinations  list of tuples of herbicide names, at most limit of them, all of the same minimal size
+    #   uncovered     weeds no allowed herbicide controls; the combinations cover the rest
+    def minimal_covers(self, weeds, crop_type=None, exclude=(), limit=5):
+        target = self.weed_mask(weeds)
+        allowed = self.allowed_mask(exclude)
+        preferred = self._crop_preferred.get((crop_type or "").lower(), 0)
+        covers, uncovered = self._search(target, allowed, preferred)
+        return {
+            "combinations": [tuple(self.herbicides[j] for j in cover) for cover in covers[:limit]],
+            "uncovered": self.weeds_in(uncovered),
+        }
+
+    def cache_info(self):
+        return self._search.cache_info()
+
+    def _search_uncached(self, target, allowed, preferred):
+        candidates = [j for j in range(len(self.herbicides))
+                      if allowed >> j & 1 and self.coverage[j] & target]
+        reachable = 0
+        for j in candidates:
+            reachable |= self.coverage[j]
+        uncovered = target & ~reachable
+        target &= reachable
+        if not target:
+            return (), uncovered
+
+        # Products with the same coverage of the target are interchangeable; a strict subset is never needed
+        groups = {}
+        for j in candidates:
+            groups.setdefault(self.coverage[j] & target, []).append(j)
+        masks = [mask for mask in groups if not any(mask != other and mask & other == mask for other in groups)]
+
+        for size in range(1, len(masks) + 1):
+            found = []
+            for combination in combinations(masks, size):
+                union = 0
+                for mask in combination:
+                    union |= mask
+                if union == target:
+                    found.extend(self._expand([groups[mask] for mask in combination]))
+            if found:
+                found.sort(key=lambda cover: (-sum(preferred >> j & 1 for j in cover),
+                                              -sum(self.coverage[j].bit_count() for j in cover),
+                                              [self.herbicides[j] for j in cover]))
+                return tuple(found), uncovered
+        return (), uncovered
+
+    # Every way to pick one product from each group of interchangeable products
+    @staticmethod
+    def _expand(groups):
+        covers = [()]
+        for group in groups:
+            covers = [cover + (j,) for cover in covers for j in group]
+        return [tuple(sorted(cover)) for cover in covers]
+
+
+def build_index():
+    from app import CROP_ADVICE_INGREDIENTS, WEED_INFO
+
+    return HerbicideIndex(WEED_INFO, CROP_ADVICE_INGREDIENTS)
@@ -0,0 +1,251 @@
+"""Persistent history of identifications and recommendations in SQLite.
+
+The request path never waits on the database. `record_prediction` and
+`record_recommendation` only put a row on a queue. One writer thread drains
+the queue and inserts everything that has arrived in a single transaction,
+about once a second or every `batch_size` rows. The database runs in WAL
+mode, so dashboard reads do not block the writer.
+
+Raw rows are indexed on time, on field + time and on species + time. In the
+same transaction, the writer also updates a weekly rollup of counts per
+field, week and species. Aggregate queries such as species counts by week
+read the rollup, so their cost depends on the number of weeks and species,
+not on the number of predictions:
+
+    # Write and query throughput at a million rows
+    python benchmarks/bench_history.py --rows 1000000
+"""
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+logger = logging.getLogger("weedai.history")
+
+DEFAULT_DB_PATH = os.path.join(os.path.expanduser("~"), ".local", "share", "weedai", "history.sqlite3")
+DEFAULT_FIELD = "default"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    field TEXT NOT NULL,
+    species TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    model TEXT NOT NULL,
+    image_hash TEXT NOT NULL,
+    path TEXT
+);
+CREATE INDEX IF NOT EXISTS predictions_ts ON predictions (ts);
+CREATE INDEX IF NOT EXISTS predictions_field_ts ON predictions (field, ts);
+CREATE INDEX IF NOT EXISTS predictions_species_ts ON predictions (species, ts);
+
+CREATE TABLE IF NOT EXISTS recommendations (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    field TEXT NOT NULL,
+    weed_type TEXT NOT NULL,
+    soil_type TEXT NOT NULL,
+    temperature REAL NOT NULL,
+    crop_type TEXT NOT NULL,
+    herbicides TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS recommendations_ts ON recommendations (ts);
+CREATE INDEX IF NOT EXISTS recommendations_field_ts ON recommendations (field, ts);
+
+CREATE TABLE IF NOT EXISTS weekly_species (
+    field TEXT NOT NULL,
+    week TEXT NOT NULL,
+    species TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    confidence_sum REAL NOT NULL,
+    PRIMARY KEY (field, week, species)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS weekly_species_week ON weekly_species (week, species);
+"""
+
+ROLLUP_UPSERT = """
+INSERT INTO weekly_species (field, week, species, count, confidence_sum) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (field, week, species) DO UPDATE SET
+    count = count + excluded.count,
+    confidence_sum = confidence_sum + excluded.confidence_sum
+"""
+
+
+# Monday of the (local time) week containing ts, as an ISO date - sorts and compares as text
+def week_of(ts):
+    day = date.fromtimestamp(ts)
+    return (day - timedelta(days=day.weekday())).isoformat()
+
+
+def connect(path):
+    connection = sqlite3.connect(path, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+class HistoryStore:
+    def __init__(self, path=DEFAULT_DB_PATH, batch_size=500, flush_interval=1.0, max_pending=100000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.batches = 0
+        # Rows dropped because the writer fell more than max_pending rows behind
+        self.dropped = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with connect(path) as connection:
+            connection.executescript(SCHEMA)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._readers = threading.local()
+        self._closed = False
+        self._writer = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._writer.start()
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    # Queues one (species, confidence) result; returns at once
+    def record_prediction(self, species, confidence, model, image_hash, field=DEFAULT_FIELD, path=None, ts=None):
+        self._put(("prediction", (ts or time.time(), field or DEFAULT_FIELD, species, float(confidence), model,
+                                  image_hash, path)))
+
+    def record_recommendation(self, weed_type, soil_type, temperature, crop_type, herbicides, field=DEFAULT_FIELD,
+                              ts=None):
+        self._put(("recommendation", (ts or time.time(), field or DEFAULT_FIELD, weed_type, soil_type,
+                                      float(temperature), crop_type, ", ".join(herbicides))))
+
+    # Blocks until every row queued so far is committed
+    def flush(self):
+        self._queue.join()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._writer.join()
+
+    # Species counts and mean confidence per week, oldest week first; since/until are timestamps
+    def weekly_species_counts(self, field=None, since=None, until=None):
+        where, params = self._rollup_filter(field, since, until)
+        return self._query(f"""
+            SELECT week, species, SUM(count), SUM(confidence_sum) / SUM(count)
+            FROM weekly_species {where}
+            GROUP BY week, species ORDER BY week, species
+        """, params)
+
+    # Total count and mean confidence per species, most frequent first
+    def species_totals(self, field=None, since=None, until=None):
+        where, params = self._rollup_filter(field, since, until)
+        return self._query(f"""
+            SELECT species, SUM(count), SUM(confidence_sum) / SUM(count)
+            FROM weekly_species {where}
+            GROUP BY species ORDER BY SUM(count) DESC
+        """, params)
+
+    def fields(self):
+        return [row[0] for row in self._query("SELECT DISTINCT field FROM weekly_species ORDER BY field")]
+
+    def recent_predictions(self, field=None, limit=100):
+        where, params = ("WHERE field = ?", [field]) if field else ("", [])
+        return self._query(f"""
+            SELECT ts, field, species, confidence, model, image_hash, path
+            FROM predictions {where} ORDER BY ts DESC LIMIT ?
+        """, params + [limit])
+
+    def recent_recommendations(self, field=None, limit=100):
+        where, params = ("WHERE field = ?", [field]) if field else ("", [])
+        return self._query(f"""
+            SELECT ts, field, weed_type, soil_type, temperature, crop_type, herbicides
+            FROM recommendations {where} ORDER BY ts DESC LIMIT ?
+        """, params + [limit])
+
+    def stats(self):
+        return {"written": self.written, "batches": self.batches, "pending": self.pending, "dropped": self.dropped}
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    @staticmethod
+    def _rollup_filter(field, since, until):
+        conditions, params = [], []
+        if field:
+            conditions.append("field = ?")
+            params.append(field)
+        if since is not None:
+            conditions.append("week >= ?")
+            params.append(week_of(since))
+        if until is not None:
+            conditions.append("week <= ?")
+            params.append(week_of(until))
+        return ("WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+    # Each reading thread keeps its own connection
+    def _query(self, sql, params=()):
+        connection = getattr(self._readers, "connection", None)
+        if connection is None:
+            connection = self._readers.connection = connect(self.path)
+        return connection.execute(sql, params).fetchall()
+
+    def _run(self):
+        connection = connect(self.path)
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            # Gather whatever else arrives within the flush interval, up to batch_size rows
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self._write(connection, batch)
+            except sqlite3.Error as e:
+                logger.error("Could not write %d history rows to %s: %s", len(batch), self.path, e)
+            finally:
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+            if stop:
+                break
+        connection.close()
+
+    def _write(self, connection, batch):
+        predictions = [row for kind, row in batch if kind == "prediction"]
+        recommendations = [row for kind, row in batch if kind == "recommendation"]
+        # The batch is pre-aggregated, so the rollup takes one upsert per (field, week, species)
+        rollup = defaultdict(lambda: [0, 0.0])
+        for ts, field, species, confidence, *_ in predictions:
+            totals = rollup[field, week_of(ts), species]
+            totals[0] += 1
+            totals[1] += confidence
+        with connection:
+            connection.executemany("""
+                INSERT INTO predictions (ts, field, species, confidence, model, image_hash, path)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, predictions)
+            connection.executemany("""
+                INSERT INTO recommendations (ts, field, weed_type, soil_type, temperature, crop_type, herbicides)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, recommendations)
+            connection.executemany(ROLLUP_UPSERT, [(*key, *totals) for key, totals in rollup.items()])
+        self.written += len(batch)
+        self.batches += 1
@@ -0,0 +1,97 @@
+"""Interchangeable inference backends for the weed classifier.
+
+Every backend exposes the two things `classify_weeds` uses from a Keras
+model - `input_shape` and `predict(batch, batch_size=..., verbose=...)`
+returning class probabilities - so the app can run on the full Keras model
+or on a float16 / int8 TFLite export with identical output handling.
+TensorFlow is imported when a backend is created, not with this module.
+"""
+import os
+import threading
+
+import numpy as np
+
+
+class KerasBackend:
+    name = "keras"
+
+    def __init__(self, model_path):
+        from tensorflow import keras
+
+        self.model_path = model_path
+        self.model = keras.models.load_model(model_path)
+        self.input_shape = self.model.input_shape
+
+    def predict(self, image_batch, batch_size=32, verbose=0):
+        return self.model.predict(image_batch, batch_size=batch_size, verbose=verbose)
+
+
+class TFLiteBackend:
+    def __init__(self, model_path, num_threads=None):
+        import tensorflow as tf
+
+        self.model_path = model_path
+        self.name = os.path.splitext(os.path.basename(model_path))[0]
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self.input_shape = (None, *(int(dim) for dim in self._input["shape"][1:]))
+        self._batch_size = int(self._input["shape"][0])
+        # A TFLite interpreter is not thread safe and Streamlit sessions share this backend
+        self._lock = threading.Lock()
+
+    def predict(self, image_batch, batch_size=32, verbose=0):
+        image_batch = np.asarray(image_batch, dtype=np.float32)
+        outputs = [
+            self._invoke(image_batch[start:start + batch_size])
+            for start in range(0, len(image_batch), batch_size)
+        ]
+        return np.concatenate(outputs)
+
+    def _invoke(self, chunk):
+        with self._lock:
+            if len(chunk) != self._batch_size:
+                self.interpreter.resize_tensor_input(self._input["index"], [len(chunk), *self.input_shape[1:]])
+                self.interpreter.allocate_tensors()
+                self._input = self.interpreter.get_input_details()[0]
+                self._output = self.interpreter.get_output_details()[0]
+                self._batch_size = len(chunk)
+
+            self.interpreter.set_tensor(self._input["index"], quantize(chunk, self._input))
+            self.interpreter.invoke()
+            return dequantize(self.interpreter.get_tensor(self._output["index"]), self._output)
+
+
+# Map float input onto an integer-quantized tensor; float tensors pass through unchanged
+def quantize(values, details):
+    if details["dtype"] == np.float32:
+        return values
+    scale, zero_point = details["quantization"]
+    info = np.iinfo(details["dtype"])
+    return np.clip(np.round(values / scale + zero_point), info.min, info.max).astype(details["dtype"])
+
+
+def dequantize(values, details):
+    if details["dtype"] == np.float32:
+        return values
+    scale, zero_point = details["quantization"]
+    return (values.astype(np.float32) - zero_point) * scale
+
+
+def load_backend(model_path, num_threads=None):
+    if model_path.endswith(".tflite"):
+        return TFLiteBackend(model_path, num_threads=num_threads)
+    return KerasBackend(model_path)
+
+
+# The Keras model plus any TFLite exports sitting next to it, e.g. crop_weed_classifier_final_int8.tflite
+def available_model_paths(model_path):
+    directory = os.path.dirname(model_path) or "."
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    exports = sorted(
+        os.path.join(directory, name) if directory != "." else name
+        for name in os.listdir(directory)
+        if name.startswith(stem) and name.endswith(".tflite")
+    )
+    return [model_path, *exports]
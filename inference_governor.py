@@ -0,0 +1,159 @@
+"""Admission control for model executions.
+
+Every Streamlit session that clicks "Identify Weed" ends up calling
+`predict`. Without a limit, a dozen simultaneous clicks start a dozen
+concurrent executions. They all compete for the same cores, and every one
+of them gets slow. `InferenceGovernor` lets at most `max_concurrent`
+executions run at once. Later callers wait in a FIFO queue, each for at most
+`max_wait` seconds. When `max_queue` callers are already waiting, a new one
+is turned away at once with `ServerBusy` rather than adding to everyone's
+latency.
+
+TensorFlow is sized to match. The intra-op pool, which parallelises a single
+op, is one pool shared by the whole process, so concurrent executions queue
+their work on the same threads rather than each starting their own. It keeps
+one thread per core, and a lone request still uses every core. The inter-op
+pool, which runs independent ops side by side, gets one thread per admitted
+execution. By default two executions run at once, or half the cores when
+that is more, so one long request does not queue everyone else behind it.
+
+`configure_tensorflow_threads` has to run before TensorFlow runs its first
+op. Before TensorFlow is imported it sets the `TF_NUM_*_THREADS` environment
+variables; after that it uses `tf.config.threading`. Only the first call
+configures anything, and later calls return the sizes it chose.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from instrumentation import StageHistogram
+
+logger = logging.getLogger("weedai.governor")
+
+
+class ServerBusy(RuntimeError):
+    pass
+
+
+# Two executions at once, or one per two cores on bigger hosts
+def default_max_concurrent():
+    return max(2, (os.cpu_count() or 1) // 2)
+
+
+# Pool sizes from the first call; TensorFlow reads them once, so later calls only report them
+_configured_threads = None
+
+
+def configure_tensorflow_threads(max_concurrent, intra_op_threads=None):
+    global _configured_threads
+    if _configured_threads is not None:
+        return _configured_threads
+    intra_op_threads = intra_op_threads or os.cpu_count() or 1
+    inter_op_threads = max_concurrent
+    if "tensorflow" not in sys.modules:
+        os.environ["TF_NUM_INTRAOP_THREADS"] = str(intra_op_threads)
+        os.environ["TF_NUM_INTEROP_THREADS"] = str(inter_op_threads)
+    else:
+        import tensorflow as tf
+
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+        except RuntimeError as e:
+            logger.warning("TensorFlow thread pools were already started, keeping their sizes: %s", e)
+            return None
+    _configured_threads = intra_op_threads, inter_op_threads
+    return _configured_threads
+
+
+class InferenceGovernor:
+    def __init__(self, max_concurrent=2, max_queue=16, max_wait=10.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.running = 0
+        self.admitted = 0
+        # Turned away because the queue was full / because the wait ran out
+        self.rejected = 0
+        self.timed_out = 0
+        self.waits = StageHistogram()
+        # One event per queued caller, first come first served; a finishing execution hands its slot to the head
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    # Runs the with-block once a slot is free; raises ServerBusy if the queue is full or the wait runs out
+    @contextmanager
+    def admit(self):
+        self._acquire()
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self):
+        with self._lock:
+            quantiles = self.waits.quantiles()
+            return {
+                "max_concurrent": self.max_concurrent,
+                "running": self.running,
+                "queued": len(self._waiters),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "wait_p50": quantiles[0.5],
+                "wait_p95": quantiles[0.95],
+                "wait_max": max(self.waits.recent, default=0.0),
+            }
+
+    def _acquire(self):
+        start = time.perf_counter()
+        with self._lock:
+            if self.running < self.max_concurrent and not self._waiters:
+                self.running += 1
+                self.admitted += 1
+                self.waits.add(0.0)
+                return
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise ServerBusy(f"The model is busy with {self.running} requests and {len(self._waiters)} "
+                                 f"waiting - please retry in a moment")
+            waiter = threading.Event()
+            self._waiters.append(waiter)
+
+        granted = waiter.wait(self.max_wait)
+        with self._lock:
+            # The slot may have been handed over just as the wait ran out
+            if not granted and not waiter.is_set():
+                self._waiters.remove(waiter)
+                self.timed_out += 1
+                raise ServerBusy(f"The model is still busy after {self.max_wait:g} s - please retry in a moment")
+            self.admitted += 1
+            self.waits.add(time.perf_counter() - start)
+
+    def _release(self):
+        with self._lock:
+            if self._waiters:
+                # running stays the same: the slot passes straight to the next caller
+                self._waiters.popleft().set()
+            else:
+                self.running -= 1
+
+
+# Model proxy whose every predict call goes through the governor, for pipelines that call predict themselves
+class GovernedModel:
+    def __init__(self, model, governor):
+        self.model = model
+        self.governor = governor
+        self.input_shape = model.input_shape
+
+    def predict(self, image_batch, batch_size=32, verbose=0):
+        with self.governor.admit():
+            return self.model.predict(image_batch, batch_size=batch_size, verbose=verbose)
@@ -0,0 +1,176 @@
+"""Per-stage latency instrumentation for the identify and recommend flows.
+
+    with metrics.stage("predict"):
+        predictions = model.predict(batch)
+
+When metrics are disabled `stage()` returns a shared no-op context manager,
+so instrumented code costs one attribute check. When enabled, every stage
+keeps a rolling window of recent durations for p50/p95/p99 plus cumulative
+counts and sums, exported in Prometheus text format.
+
+A single request can also be profiled on demand: `arm_profile("cprofile")`
+or `arm_profile("tensorflow")` makes the next `profile_request()` block
+capture a cProfile dump or a TensorFlow trace.
+"""
+import cProfile
+import io
+import os
+import pstats
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+QUANTILES = (0.5, 0.95, 0.99)
+PROFILE_DIR = os.path.join(tempfile.gettempdir(), "weedai-profiles")
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _TimedStage:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class StageHistogram:
+    def __init__(self, window=1024):
+        self.recent = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.recent.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def quantiles(self):
+        if not self.recent:
+            return {q: 0.0 for q in QUANTILES}
+        values = np.percentile(np.fromiter(self.recent, dtype=np.float64), [q * 100 for q in QUANTILES])
+        return dict(zip(QUANTILES, values.tolist()))
+
+
+class Metrics:
+    def __init__(self, enabled=False, window=1024):
+        self.enabled = enabled
+        self.window = window
+        self.last_profile = None
+        self._armed_profile = None
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _TimedStage(self, name)
+
+    def record(self, name, seconds):
+        with self._lock:
+            histogram = self._stages.get(name)
+            if histogram is None:
+                histogram = self._stages[name] = StageHistogram(self.window)
+            histogram.add(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+    # {stage: {"count", "sum", 0.5, 0.95, 0.99}} in seconds
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: {"count": histogram.count, "sum": histogram.total, **histogram.quantiles()}
+                for name, histogram in self._stages.items()
+            }
+
+    def prometheus_text(self, prefix="weedai"):
+        lines = [
+            f"# HELP {prefix}_stage_seconds Duration of each request stage (quantiles over the last {self.window} samples).",
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+        for name, stats in sorted(self.snapshot().items()):
+            for q in QUANTILES:
+                lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="{q}"}} {stats[q]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {stats["sum"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {stats["count"]}')
+        return "\n".join(lines) + "\n"
+
+    # Written to a temporary file and renamed so scrapers never read a partial file
+    def write_prometheus(self, path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def arm_profile(self, kind):
+        if kind not in ("cprofile", "tensorflow"):
+            raise ValueError(f"unknown profiler {kind}")
+        self._armed_profile = kind
+
+    @property
+    def armed_profile(self):
+        return self._armed_profile
+
+    # Profiles the enclosed block if a profile is armed, once
+    @contextmanager
+    def profile_request(self, label):
+        with self._lock:
+            kind, self._armed_profile = self._armed_profile, None
+        if kind is None:
+            yield
+            return
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        if kind == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                path = os.path.join(PROFILE_DIR, f"{label}-{stamp}.prof")
+                profiler.dump_stats(path)
+                summary = io.StringIO()
+                pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(25)
+                self.last_profile = {"kind": kind, "label": label, "path": path, "summary": summary.getvalue()}
+        else:
+            import tensorflow as tf
+
+            path = os.path.join(PROFILE_DIR, f"{label}-{stamp}")
+            tf.profiler.experimental.start(path)
+            try:
+                yield
+            finally:
+                tf.profiler.experimental.stop()
+                self.last_profile = {
+                    "kind": kind, "label": label, "path": path,
+                    "summary": f"TensorBoard trace written to {path} (tensorboard --logdir {path})",
+                }
+
+
+# Shared by every session and thread in the process
+metrics = Metrics(enabled=os.environ.get("WEEDAI_METRICS") == "1")
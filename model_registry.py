@@ -0,0 +1,192 @@
+"""Registry of the weed models the app can switch between.
+
+Models are described by a manifest or discovered from a directory, and each
+one carries its own class names, so region-specific or versioned models
+with different weed sets sit side by side. A model is only loaded the first
+time it is asked for. Loaded models are kept in least-recently-used order,
+and when their estimated memory exceeds the budget, the least recently used
+ones are evicted. The model just requested is never evicted, even when it
+alone is over budget.
+
+A manifest is a JSON file; paths are relative to the manifest:
+
+    {"models": [
+        {"name": "us-midwest-v3", "path": "midwest_v3.keras", "description": "Corn and soybean belt",
+         "class_names": ["Crabgrass", "Waterhemp", "..."]},
+        {"name": "us-midwest-v3 int8", "path": "midwest_v3_int8.tflite"}
+    ]}
+
+In a directory, every `.keras` and `.tflite` file is a model. Its class names
+come from a `<stem>.classes.json` file next to it, holding a JSON list, or
+default to the caller's list.
+"""
+import gc
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+MODEL_EXTENSIONS = (".keras", ".tflite")
+
+
+class ModelSpec:
+    def __init__(self, name, path, class_names, description=""):
+        self.name = name
+        self.path = path
+        self.class_names = list(class_names)
+        self.description = description
+
+    def __repr__(self):
+        return f"ModelSpec({self.name!r}, {self.path!r}, {len(self.class_names)} classes)"
+
+
+def load_manifest(manifest_path, default_class_names):
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    directory = os.path.dirname(os.path.abspath(manifest_path))
+    specs = []
+    for entry in manifest["models"]:
+        path = entry["path"] if os.path.isabs(entry["path"]) else os.path.join(directory, entry["path"])
+        specs.append(ModelSpec(entry.get("name") or os.path.basename(path), path,
+                               entry.get("class_names") or default_class_names, entry.get("description", "")))
+    return specs
+
+
+# Class names from a <stem>.classes.json file next to the model, else the defaults
+def class_names_for(model_path, default_class_names):
+    classes_path = f"{os.path.splitext(model_path)[0]}.classes.json"
+    if not os.path.exists(classes_path):
+        return list(default_class_names)
+    with open(classes_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def discover(directory, default_class_names):
+    specs = []
+    for name in sorted(os.listdir(directory)):
+        if os.path.splitext(name)[1] not in MODEL_EXTENSIONS:
+            continue
+        path = os.path.join(directory, name)
+        specs.append(ModelSpec(name, path, class_names_for(path, default_class_names)))
+    return specs
+
+
+# Estimated resident size: 4 bytes per parameter of a Keras model, else the size of the model file
+def model_nbytes(model, path):
+    resident = getattr(model, "resident_bytes", None)
+    if resident is not None:
+        return resident
+    # CompiledModel and KerasBackend keep the Keras model in .model
+    keras_model = getattr(model, "model", model)
+    count_params = getattr(keras_model, "count_params", None)
+    if callable(count_params):
+        return int(count_params()) * 4
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class ModelRegistry:
+    # loader(path) returns a model, or None when it could not be loaded
+    def __init__(self, specs, loader, memory_budget_bytes=1024 * 1024 * 1024):
+        self.specs = OrderedDict((spec.name, spec) for spec in specs)
+        if not self.specs:
+            raise ValueError("the model registry needs at least one model")
+        self.loader = loader
+        self.memory_budget_bytes = memory_budget_bytes
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+        # name -> (model, estimated bytes), least recently used first
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        # One lock per model file, so concurrent sessions wait for a load in progress instead of repeating it
+        self._load_locks = {spec.path: threading.Lock() for spec in self.specs.values()}
+
+    @property
+    def names(self):
+        return list(self.specs)
+
+    @property
+    def resident_bytes(self):
+        with self._lock:
+            return sum(nbytes for _, nbytes in self._loaded.values())
+
+    def is_loaded(self, name):
+        with self._lock:
+            return name in self._loaded
+
+    # The loaded model for name, loading it (and evicting others) if needed; None if it failed to load
+    def get(self, name):
+        spec = self.specs[name]
+        with self._lock:
+            if name in self._loaded:
+                self.hits += 1
+                self._loaded.move_to_end(name)
+                return self._loaded[name][0]
+            self.misses += 1
+
+        with self._load_locks[spec.path]:
+            with self._lock:
+                if name in self._loaded:
+                    self._loaded.move_to_end(name)
+                    return self._loaded[name][0]
+            start = time.perf_counter()
+            model = self.loader(spec.path)
+            if model is None:
+                return None
+            nbytes = model_nbytes(model, spec.path)
+            with self._lock:
+                self.loads += 1
+                self.load_seconds += time.perf_counter() - start
+                self._loaded[name] = (model, nbytes)
+                evicted = self._evict_over_budget(keep=name)
+        if evicted:
+            # Keras models hold reference cycles; collect now so the memory is actually returned
+            gc.collect()
+        return model
+
+    def evict(self, name):
+        with self._lock:
+            evicted = self._loaded.pop(name, None) is not None
+            if evicted:
+                self.evictions += 1
+        if evicted:
+            gc.collect()
+        return evicted
+
+    # Name and estimated size of every loaded model, least recently used first
+    def resident(self):
+        with self._lock:
+            return [(name, nbytes) for name, (_, nbytes) in self._loaded.items()]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "models": len(self.specs),
+                "loaded": len(self._loaded),
+                "resident_bytes": sum(nbytes for _, nbytes in self._loaded.values()),
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "load_seconds": self.load_seconds,
+            }
+
+    def _evict_over_budget(self, keep):
+        evicted = []
+        total = sum(nbytes for _, nbytes in self._loaded.values())
+        for name in list(self._loaded):
+            if total <= self.memory_budget_bytes:
+                break
+            if name == keep:
+                continue
+            total -= self._loaded.pop(name)[1]
+            evicted.append(name)
+        self.evictions += len(evicted)
+        return evicted
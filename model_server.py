@@ -0,0 +1,423 @@
+"""Local multi-process model server with shared-memory input tensors.
+
+Every Streamlit or service process would otherwise load its own copy of the
+model. This server keeps a pool of worker processes instead. Each worker holds
+one copy of the model and has its own intra-op thread budget, so the workers
+do not contend for the same cores. Callers connect to the server and get a
+shared-memory block per connection. They write the preprocessed batch
+straight into it, and the worker writes the probabilities back into the same
+block. Only small control messages go over the socket, so no array is
+pickled.
+
+    # 4 workers with 2 intra-op threads each, listening on a Unix socket
+    python model_server.py --workers 4 --intra-op-threads 2 --address /tmp/weedai-model.sock
+
+    # Point the app at it; classify_weed then runs on the pool
+    WEEDAI_MODEL_SERVER=/tmp/weedai-model.sock streamlit run app.py
+
+Messages on the socket are pickled, so the connection is authenticated. A
+Unix socket is only accessible to its owner and may use the built-in key. A
+TCP address ("host:port") needs an explicit key in
+WEEDAI_MODEL_SERVER_AUTHKEY on both sides.
+"""
+import argparse
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+DEFAULT_ADDRESS = os.path.join(tempfile.gettempdir(), "weedai-model.sock")
+# Only for Unix sockets, which are created owner-only
+LOCAL_AUTHKEY = b"weedai"
+MAX_BATCH_SIZE = 64
+# Longest wait for every worker to load the model
+START_TIMEOUT = 600
+# Longest wait for a worker's reply before the request fails and its connection is closed
+REQUEST_TIMEOUT = 120
+
+
+# "host:port" is a TCP address, anything else a Unix socket path
+def parse_address(address):
+    host, separator, port = address.rpartition(":")
+    if separator and port.isdigit():
+        return host or "127.0.0.1", int(port)
+    return address
+
+
+# An explicit key, else WEEDAI_MODEL_SERVER_AUTHKEY, else the built-in key - which only a Unix socket may use
+def resolve_authkey(address, authkey=None):
+    if authkey is None:
+        authkey = os.environ.get("WEEDAI_MODEL_SERVER_AUTHKEY")
+    if authkey is None:
+        if not isinstance(address, str):
+            raise ValueError(f"model server address {address[0]}:{address[1]} is TCP - set WEEDAI_MODEL_SERVER_AUTHKEY")
+        authkey = LOCAL_AUTHKEY
+    return authkey.encode() if isinstance(authkey, str) else authkey
+
+
+# Attach to a block created by another process without letting this process's resource tracker unlink it
+def _attach(name):
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+# Inputs at the start of the block, outputs after room for a full batch of inputs
+def _views(buffer, count, input_shape, num_classes):
+    inputs = np.ndarray((count, *input_shape), dtype=np.float32, buffer=buffer)
+    outputs = np.ndarray((count, num_classes), dtype=np.float32, buffer=buffer,
+                         offset=MAX_BATCH_SIZE * int(np.prod(input_shape)) * 4)
+    return inputs, outputs
+
+
+def _worker(model_path, intra_op_threads, tasks, replies, ready):
+    import tensorflow as tf
+
+    # Must be set before the first op runs in this process
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    try:
+        from compiled_inference import CompiledModel
+        from inference_backends import KerasBackend, load_backend
+
+        backend = load_backend(model_path)
+        if isinstance(backend, KerasBackend):
+            backend = CompiledModel(backend.model).warm_up()
+        input_shape = tuple(int(dim) for dim in backend.input_shape[1:])
+        num_classes = int(backend.predict(np.zeros((1, *input_shape), dtype=np.float32), verbose=0).shape[-1])
+    except Exception as e:
+        ready.put(("error", f"{type(e).__name__}: {e}"))
+        return
+    ready.put(("ready", (input_shape, num_classes)))
+
+    attached = {}
+    parent = multiprocessing.parent_process()
+    while True:
+        try:
+            task = tasks.get(timeout=1.0)
+        except queue.Empty:
+            # Exit with the server even if it was killed before it could send the shutdown message
+            if not parent.is_alive():
+                break
+            continue
+        if task is None:
+            break
+        request_id, shm_name, count = task
+        # Tells the server which requests to fail if this process dies
+        replies.put(("started", request_id, os.getpid()))
+        try:
+            shm = attached.get(shm_name)
+            if shm is None:
+                shm = attached[shm_name] = _attach(shm_name)
+            inputs, outputs = _views(shm.buf, count, input_shape, num_classes)
+            outputs[:] = backend.predict(inputs, batch_size=count, verbose=0)
+            del inputs, outputs
+            replies.put(("done", request_id, None))
+        except Exception as e:
+            replies.put(("done", request_id, str(e)))
+        finally:
+            # The client unlinks its block on close; stale attachments are dropped here
+            if len(attached) > 256:
+                for name in list(attached)[:128]:
+                    attached.pop(name).close()
+
+    for shm in attached.values():
+        shm.close()
+
+
+class ModelServer:
+    def __init__(self, model_path, address=DEFAULT_ADDRESS, workers=2, intra_op_threads=None,
+                 authkey=None, request_timeout=REQUEST_TIMEOUT):
+        self.model_path = os.path.abspath(model_path)
+        self.address = parse_address(address) if isinstance(address, str) else address
+        self.workers = workers
+        # By default the cores are split evenly between the workers
+        self.intra_op_threads = intra_op_threads or max(1, (os.cpu_count() or 1) // workers)
+        self.authkey = resolve_authkey(self.address, authkey)
+        self.request_timeout = request_timeout
+        self.requests_served = 0
+        self._context = multiprocessing.get_context("spawn")
+        self._tasks = self._context.Queue()
+        self._replies = self._context.Queue()
+        self._pending = {}
+        # Worker pid -> ids of the requests it is running
+        self._running = {}
+        self._pending_lock = threading.Lock()
+        self._request_ids = itertools.count()
+        self._processes = []
+
+    def start(self):
+        ready = self._context.Queue()
+        for i in range(self.workers):
+            process = self._context.Process(
+                target=_worker, name=f"weedai-model-worker-{i}", daemon=True,
+                args=(self.model_path, self.intra_op_threads, self._tasks, self._replies, ready),
+            )
+            process.start()
+            self._processes.append(process)
+        try:
+            self.input_shape, self.num_classes = self._wait_until_ready(ready)
+        except Exception:
+            for process in self._processes:
+                process.terminate()
+            raise
+        threading.Thread(target=self._dispatch_replies, name="model-server-replies", daemon=True).start()
+
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+        if isinstance(self.address, str):
+            # The socket is created owner-only, so there is no moment in which others can connect
+            previous_umask = os.umask(0o177)
+            try:
+                self._listener = Listener(self.address, authkey=self.authkey)
+            finally:
+                os.umask(previous_umask)
+        else:
+            self._listener = Listener(self.address, authkey=self.authkey)
+        return self
+
+    # One message per worker; a worker that reports an error, or exits without a word, fails the start
+    def _wait_until_ready(self, ready, timeout=START_TIMEOUT):
+        results = []
+        deadline = time.monotonic() + timeout
+        while len(results) < len(self._processes):
+            try:
+                status, value = ready.get(timeout=1.0)
+            except queue.Empty:
+                for process in self._processes:
+                    if not process.is_alive():
+                        raise RuntimeError(f"model worker {process.name} exited with code {process.exitcode} "
+                                           f"while loading {self.model_path}")
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"model workers did not load {self.model_path} in {timeout} s")
+                continue
+            if status == "error":
+                raise RuntimeError(f"model worker failed to load {self.model_path}: {value}")
+            results.append(value)
+        return results[0]
+
+    def serve_forever(self):
+        while True:
+            try:
+                connection = self._listener.accept()
+            except (OSError, EOFError):
+                continue
+            threading.Thread(target=self._handle, args=(connection,), daemon=True).start()
+
+    def close(self):
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+        self._listener.close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+    @property
+    def workers_alive(self):
+        return sum(process.is_alive() for process in self._processes)
+
+    def _dispatch_replies(self):
+        dead = set()
+        while True:
+            try:
+                kind, request_id, value = self._replies.get(timeout=1.0)
+            except queue.Empty:
+                kind = None
+            with self._pending_lock:
+                if kind == "started" and value in dead:
+                    # Its worker died before this message was read
+                    waiter = self._pending.pop(request_id, None)
+                    if waiter is not None:
+                        waiter.put("model worker exited while running the request")
+                elif kind == "started":
+                    self._running.setdefault(value, set()).add(request_id)
+                elif kind == "done":
+                    for running in self._running.values():
+                        running.discard(request_id)
+                    # None when the request already failed with a timeout
+                    waiter = self._pending.pop(request_id, None)
+                    if waiter is not None:
+                        waiter.put(value)
+
+                # A worker that died takes its running requests with it; with none left, nothing queued will run
+                for process in self._processes:
+                    if process.is_alive() or process.pid in dead:
+                        continue
+                    dead.add(process.pid)
+                    error = f"model worker {process.name} exited with code {process.exitcode}"
+                    failed = self._running.pop(process.pid, set())
+                    if len(dead) == len(self._processes):
+                        failed = set(self._pending)
+                    for request_id in failed:
+                        waiter = self._pending.pop(request_id, None)
+                        if waiter is not None:
+                            waiter.put(error)
+
+    # One thread per connection; each request is handed to whichever worker is free
+    def _handle(self, connection):
+        waiter = queue.Queue(maxsize=1)
+        with connection:
+            while True:
+                try:
+                    message = connection.recv()
+                except (EOFError, OSError):
+                    return
+                if message[0] == "info":
+                    connection.send((self.model_path, self.input_shape, self.num_classes, MAX_BATCH_SIZE))
+                    continue
+
+                _, shm_name, count = message
+                if not self.workers_alive:
+                    connection.send(("no model workers are running", True))
+                    continue
+                request_id = next(self._request_ids)
+                with self._pending_lock:
+                    self._pending[request_id] = waiter
+                self._tasks.put((request_id, shm_name, count))
+                try:
+                    error = waiter.get(timeout=self.request_timeout)
+                except queue.Empty:
+                    with self._pending_lock:
+                        self._pending.pop(request_id, None)
+                    # A worker may still write into the caller's block later, so the connection is not reused
+                    connection.send((f"no reply from the model workers in {self.request_timeout} s", False))
+                    return
+                self.requests_served += 1
+                # (error or None, whether the connection can be reused)
+                connection.send((error, True))
+
+
+class _Connection:
+    def __init__(self, address, authkey, input_shape, num_classes):
+        self.connection = Client(address, authkey=authkey)
+        size = MAX_BATCH_SIZE * (int(np.prod(input_shape)) + num_classes) * 4
+        self.shm = SharedMemory(create=True, size=size)
+
+    def close(self):
+        self.connection.close()
+        self.shm.close()
+        self.shm.unlink()
+
+
+# Stands in for a Keras model: exposes input_shape and predict(), runs on the server's workers
+class ModelServerClient:
+    name = "model server"
+    # The model lives in the server processes, not in the caller
+    resident_bytes = 0
+
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=None, max_connections=4):
+        self.address = parse_address(address) if isinstance(address, str) else address
+        self.authkey = resolve_authkey(self.address, authkey)
+        with Client(self.address, authkey=self.authkey) as connection:
+            connection.send(("info",))
+            self.model_path, input_shape, self.num_classes, self.max_batch_size = connection.recv()
+        self.input_shape = (None, *input_shape)
+        # Connections, each with its own shared-memory block, are created on demand and reused
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def serves(self, model_path):
+        return os.path.abspath(model_path) == self.model_path
+
+    def predict(self, image_batch, batch_size=32, verbose=0):
+        image_batch = np.asarray(image_batch, dtype=np.float32)
+        chunk_size = max(1, min(batch_size, self.max_batch_size))
+        outputs = np.empty((len(image_batch), self.num_classes), dtype=np.float32)
+        with self._slots:
+            connection = self._checkout()
+            reusable = False
+            try:
+                for start in range(0, len(image_batch), chunk_size):
+                    chunk = image_batch[start:start + chunk_size]
+                    outputs[start:start + len(chunk)] = self._predict_chunk(connection, chunk)
+                reusable = True
+            except (EOFError, OSError):
+                # The server went away or gave up mid-request - this connection is not reused
+                raise
+            except Exception:
+                # A bad input or an error reply from the server - the connection is still in step with it
+                reusable = True
+                raise
+            finally:
+                if reusable:
+                    self._idle.put(connection)
+                else:
+                    self._discard(connection)
+        return outputs
+
+    def _predict_chunk(self, connection, chunk):
+        inputs, results = _views(connection.shm.buf, len(chunk), self.input_shape[1:], self.num_classes)
+        try:
+            inputs[:] = chunk
+            connection.connection.send(("predict", connection.shm.name, len(chunk)))
+            error, reusable = connection.connection.recv()
+            if error is not None and not reusable:
+                raise ConnectionAbortedError(f"model server: {error}")
+            if error is not None:
+                raise RuntimeError(f"model server: {error}")
+            return results.copy()
+        finally:
+            del inputs, results
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            connection = _Connection(self.address, self.authkey, self.input_shape[1:], self.num_classes)
+            with self._lock:
+                self._connections.append(connection)
+            return connection
+
+    def _discard(self, connection):
+        with self._lock:
+            self._connections.remove(connection)
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WeedAI multi-process model server")
+    parser.add_argument("--model", default="crop_weed_classifier_final.keras", help=".keras or .tflite model to serve")
+    parser.add_argument("--address", default=DEFAULT_ADDRESS, help='Unix socket path or "host:port"')
+    parser.add_argument("--workers", type=int, default=2, help="worker processes, each holding one model copy")
+    parser.add_argument("--intra-op-threads", type=int,
+                        help="TensorFlow intra-op threads per worker (default: cores / workers)")
+    args = parser.parse_args()
+
+    # SIGTERM unwinds like Ctrl+C, so the workers are shut down and the socket removed
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    server = ModelServer(args.model, args.address, args.workers, args.intra_op_threads).start()
+    print(f"Serving {server.model_path} on {server.address} with {server.workers} workers "
+          f"x {server.intra_op_threads} intra-op threads")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
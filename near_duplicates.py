@@ -0,0 +1,227 @@
+"""Near-duplicate suppression for bursts and drone frames.
+
+Consecutive drone frames and phone bursts are nearly identical, yet their
+bytes differ, so the exact-hash prediction cache misses them. Each image
+gets a 64-bit difference hash, computed from the model-sized tensor that
+preprocessing has already produced. The grayscale image is averaged down to
+an 8x9 grid, and each bit records whether a cell is brighter than its
+right-hand neighbour. `NearDuplicateIndex` keeps the hashes of the most
+recently classified images in a fixed-size ring buffer. A lookup XORs the
+new hash against all of them at once and counts the differing bits. When
+the nearest hash is within `max_distance` bits, its prediction is reused and
+the image skips `predict`. Images in the same batch are matched against
+each other too, so a burst uploaded together is predicted once.
+
+A 64-bit hash of a low-texture field photo is a weak identity signal, so
+the app leaves this off unless WEEDAI_NEAR_DUPLICATE_DISTANCE is set, and
+keeps one index per field. Before enabling it, check the distance on
+representative photos. `evaluate` names the largest distance whose
+predictions agree with full inference at least `--min-agreement` of the
+time. It exits with status 1 when no distance does:
+
+    # Skip rate and agreement with full inference per distance, with synthetic 8-frame bursts
+    python near_duplicates.py evaluate samples/ --burst 8 --distances 0 2 4 6 8 --min-agreement 0.99
+"""
+import argparse
+import sys
+import threading
+
+import numpy as np
+
+HASH_SIZE = 8
+DEFAULT_MAX_DISTANCE = 4
+DEFAULT_MAX_ENTRIES = 4096
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+# Set bits per byte, for numpy releases before 2.0 that have no np.bitwise_count
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+# One uint64 difference hash per image of an (N, H, W, 3) float or uint8 batch
+def perceptual_hashes(batch):
+    gray = np.asarray(batch, dtype=np.float32) @ _LUMA
+    count, height, width = gray.shape
+    rows = np.linspace(0, height, HASH_SIZE + 1).astype(int)
+    cols = np.linspace(0, width, HASH_SIZE + 2).astype(int)
+    cells = np.add.reduceat(np.add.reduceat(gray, rows[:-1], axis=1), cols[:-1], axis=2)
+    cells /= np.outer(np.diff(rows), np.diff(cols))
+    bits = cells[:, :, 1:] > cells[:, :, :-1]
+    return np.packbits(bits.reshape(count, HASH_SIZE * HASH_SIZE), axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+def hamming_distances(hashes, others):
+    differences = np.bitwise_xor.outer(hashes, others)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(differences)
+    return _POPCOUNT[differences.view(np.uint8)].reshape(*differences.shape, 8).sum(axis=-1, dtype=np.uint8)
+
+
+class NearDuplicateIndex:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_distance=DEFAULT_MAX_DISTANCE):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.lookups = 0
+        self.skips = 0
+        self._hashes = np.zeros(max_entries, dtype=np.uint64)
+        self._results = [None] * max_entries
+        self._size = 0
+        # Next slot to overwrite - the oldest entry once the buffer is full
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def skip_rate(self):
+        return self.skips / self.lookups if self.lookups else 0.0
+
+    # Splits a batch by its hashes into
+    #   reused:     {i: result} for images within max_distance of an indexed image
+    #   to_predict: [i, ...] for images that need the model
+    #   same_as:    {i: j} for images within max_distance of image j, an earlier image of this batch in to_predict
+    def match_batch(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        reused, to_predict, same_as = {}, [], {}
+        with self._lock:
+            if self._size and len(hashes):
+                distances = hamming_distances(hashes, self._hashes[:self._size])
+                nearest = distances.argmin(axis=1)
+                nearest_distance = distances[np.arange(len(hashes)), nearest]
+            for i, image_hash in enumerate(hashes):
+                if self._size and nearest_distance[i] <= self.max_distance:
+                    reused[i] = self._results[nearest[i]]
+                    continue
+                if to_predict:
+                    batch_distances = hamming_distances(image_hash[None], hashes[to_predict])[0]
+                    j = int(batch_distances.argmin())
+                    if batch_distances[j] <= self.max_distance:
+                        same_as[i] = to_predict[j]
+                        continue
+                to_predict.append(i)
+            self.lookups += len(hashes)
+            self.skips += len(reused) + len(same_as)
+        return reused, to_predict, same_as
+
+    def add(self, hashes, results):
+        with self._lock:
+            for image_hash, result in zip(hashes, results):
+                self._hashes[self._next] = image_hash
+                self._results[self._next] = result
+                self._next = (self._next + 1) % self.max_entries
+                self._size = min(self._size + 1, self.max_entries)
+
+    # Runs predict(batch_of_images) only for the images that are not near-duplicates and returns
+    # one result per image, plus the indices that were predicted. Results are None if predict returns None
+    def predict(self, batch, predict):
+        hashes = perceptual_hashes(batch)
+        reused, to_predict, same_as = self.match_batch(hashes)
+        results = [None] * len(batch)
+        if to_predict:
+            fresh = predict(batch[to_predict])
+            if fresh is None:
+                return None, to_predict
+            for i, result in zip(to_predict, fresh):
+                results[i] = result
+            self.add(hashes[to_predict], fresh)
+        for i, result in reused.items():
+            results[i] = result
+        for i, j in same_as.items():
+            results[i] = results[j]
+        return results, to_predict
+
+    def clear(self):
+        with self._lock:
+            self._size = self._next = 0
+            self._results = [None] * self.max_entries
+
+
+# Copies of each image with a little pixel noise, brightness change and a one-pixel shift, like a burst
+def synthetic_bursts(images, burst, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for image in images:
+        for k in range(burst):
+            frame = image if k == 0 else np.roll(image, rng.integers(-1, 2, size=2), axis=(0, 1))
+            if k:
+                frame = frame * rng.uniform(0.97, 1.03) + rng.normal(0, 0.01, frame.shape)
+            frames.append(np.clip(frame, 0.0, 1.0))
+    return np.asarray(frames, dtype=np.float32)
+
+
+def evaluate(args):
+    from cascade import load_labeled_folder
+    from preprocessing import model_input_size
+    from standin_model import load_or_build
+    from tflite_tools import find_images, load_images
+
+    model, description = load_or_build(args.model)
+    target_size = model_input_size(model)
+    if args.labeled:
+        from app import CLASS_NAMES
+
+        images, labels = load_labeled_folder(args.images, CLASS_NAMES, target_size)
+    else:
+        images, labels = load_images(find_images(args.images), target_size), None
+    if args.burst > 1:
+        images = synthetic_bursts(images, args.burst)
+        labels = None if labels is None else np.repeat(labels, args.burst)
+    print(f"{len(images)} images ({args.burst} per burst), model: {description}")
+
+    full = model.predict(images, batch_size=args.batch_size, verbose=0)
+    passing = []
+    full_top1 = full.argmax(axis=1)
+    header = f"{'distance':>9}{'skipped':>10}{'agree':>9}{'conf diff':>11}"
+    print(f"\n{header}{'accuracy':>10}" if labels is not None else f"\n{header}")
+    for distance in args.distances:
+        index = NearDuplicateIndex(max_distance=distance)
+        predictions = []
+        for start in range(0, len(images), args.batch_size):
+            chunk = images[start:start + args.batch_size]
+            results, _ = index.predict(chunk, lambda batch: list(model.predict(batch, verbose=0)))
+            predictions.extend(results)
+        predictions = np.asarray(predictions)
+        top1 = predictions.argmax(axis=1)
+        confidence_diff = np.abs(predictions.max(axis=1) - full.max(axis=1)).mean()
+        agreement = (top1 == full_top1).mean()
+        if agreement >= args.min_agreement:
+            passing.append(distance)
+        row = (f"{distance:>9}{index.skip_rate * 100:>9.1f}%{agreement * 100:>8.1f}%"
+               f"{confidence_diff:>11.4f}")
+        if labels is not None:
+            row += f"{(top1 == labels).mean() * 100:>9.1f}%"
+        print(row)
+    if labels is not None:
+        print(f"{'full':>9}{0.0:>9.1f}%{100.0:>8.1f}%{0.0:>11.4f}{(full_top1 == labels).mean() * 100:>9.1f}%")
+
+    if not passing:
+        print(f"\nNo distance agrees with full inference on {args.min_agreement * 100:g}% of images - "
+              f"leave WEEDAI_NEAR_DUPLICATE_DISTANCE unset")
+        return 1
+    print(f"\nLargest distance agreeing on at least {args.min_agreement * 100:g}% of images: "
+          f"WEEDAI_NEAR_DUPLICATE_DISTANCE={max(passing)}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WeedAI near-duplicate suppression")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    evaluate_parser = subparsers.add_parser("evaluate", help="skip rate and agreement with full inference")
+    evaluate_parser.add_argument("images", help="folder of images, read recursively")
+    evaluate_parser.add_argument("--labeled", action="store_true",
+                                 help="images are in one subfolder per weed class; also report accuracy")
+    evaluate_parser.add_argument("--model", default="crop_weed_classifier_final.keras",
+                                 help="model; a synthetic stand-in is used if it does not exist")
+    evaluate_parser.add_argument("--distances", type=int, nargs="+", default=[0, 2, 4, 6, 8])
+    evaluate_parser.add_argument("--burst", type=int, default=1,
+                                 help="expand every image into a synthetic burst of this many frames")
+    evaluate_parser.add_argument("--batch-size", type=int, default=32)
+    evaluate_parser.add_argument("--min-agreement", type=float, default=0.99,
+                                 help="share of images whose top-1 class must match full inference")
+
+    args = parser.parse_args()
+    sys.exit(evaluate(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Content-addressed cache of weed predictions.
+
+Entries are keyed by a hash of the raw uploaded bytes plus the identity of the
+model file, so re-uploading the same photo skips decode, resize and predict,
+while replacing or swapping the model invalidates every earlier entry.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+# Path, size and modification time of the model file - changes whenever the model does
+def model_identity(model_path):
+    stat = os.stat(model_path)
+    return f"{os.path.abspath(model_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+class PredictionCache:
+    def __init__(self, max_entries=512, cache_dir=None):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(image_bytes, model_id):
+        digest = hashlib.sha256(model_id.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(image_bytes)
+        return digest.hexdigest()
+
+    @property
+    def hits(self):
+        return self.memory_hits + self.disk_hits
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Returns the cached (class, confidence) or None, checking memory before disk
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return self._entries[key]
+
+        result = self._read_disk(key)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, result)
+        return result
+
+    def put(self, key, result):
+        predicted_class, confidence = result
+        result = (predicted_class, float(confidence))
+        with self._lock:
+            self._remember(key, result)
+        self._write_disk(key, result)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _remember(self, key, result):
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._disk_path(key), encoding="utf-8") as f:
+                entry = json.load(f)
+            return entry["class"], float(entry["confidence"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    # Written to a temporary file first so a crash never leaves a half-written entry
+    def _write_disk(self, key, result):
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"class": result[0], "confidence": result[1]}, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
@@ -0,0 +1,55 @@
+"""Fast decode and preprocessing for model input.
+
+Phone photos are often 12+ megapixels while the model only needs a small
+square, so JPEGs are decoded directly at a reduced DCT scale (`Image.draft`),
+other formats are shrunk with a cheap box reduction before the final
+resample (`reducing_gap`), and pixels are written straight into a
+preallocated float32 (or uint8) batch in a single pass.
+"""
+import numpy as np
+from PIL import Image
+
+# Resize in two steps when the source is at least this many times the target:
+# a fast integer reduce first, then a proper resample of the small image
+REDUCING_GAP = 3.0
+
+
+# (width, height) the model expects, read from its (batch, height, width, channels) input shape
+def model_input_size(model, default=(120, 120)):
+    height, width = model.input_shape[1:3]
+    if height is None or width is None:
+        return default
+    return width, height
+
+
+# Decode an image at (roughly) the smallest scale that still covers target_size, as RGB
+def decode_reduced(image, target_size):
+    if image.format == "JPEG":
+        # Only effective before the pixel data is loaded - Image.open is lazy
+        image.draft("RGB", target_size)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return image
+
+
+# Write a single image into out, an (height, width, 3) float32 or uint8 view
+def fill_model_input(image, target_size, out):
+    image = decode_reduced(image, target_size)
+    if image.size != tuple(target_size):
+        image = image.resize(target_size, Image.BICUBIC, reducing_gap=REDUCING_GAP)
+
+    pixels = np.asarray(image)
+    if out.dtype == np.uint8:
+        out[...] = pixels
+    else:
+        np.multiply(pixels, np.float32(1.0 / 255.0), out=out, casting="unsafe")
+    return out
+
+
+# Stack images into one (N, height, width, 3) tensor, scaled to [0, 1] unless dtype is uint8
+def load_batch(images, target_size=(120, 120), dtype=np.float32):
+    width, height = target_size
+    batch = np.empty((len(images), height, width, 3), dtype=dtype)
+    for i, image in enumerate(images):
+        fill_model_input(image, (width, height), batch[i])
+    return batch
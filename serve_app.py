@@ -0,0 +1,30 @@
+"""Start the Streamlit app with the model loading from server start.
+
+Streamlit executes app.py only when a browser session connects, so under
+`streamlit run app.py` the first visitor after every deploy or restart pays
+for the TensorFlow import, the model load and the warm-up. This launcher
+runs in the Streamlit server's own process. It sizes the TensorFlow thread
+pools and starts the default model's preloader (see warm_start.py) first,
+then hands over to `streamlit run`. Script runs find the same process-wide
+preloader, so the first session gets a model that is ready or nearly so.
+
+    python serve_app.py --server.port 8501 --server.headless true
+"""
+import os
+import sys
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+
+def main():
+    from streamlit.web import cli as streamlit_cli
+
+    import app
+
+    app.start_model_preloading()
+    sys.argv = ["streamlit", "run", APP_PATH, *sys.argv[1:]]
+    sys.exit(streamlit_cli.main())
+
+
+if __name__ == "__main__":
+    main()
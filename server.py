@@ -0,0 +1,269 @@
+"""Headless HTTP inference service for WeedAI.
+
+Serves the same model and recommendation engine as the Streamlit app so that
+field tablets and the drone ground station can call it directly:
+
+    python server.py --port 8000 --max-batch-size 32 --max-wait-ms 10
+
+    curl -X POST --data-binary @leaf.jpg http://localhost:8000/classify
+    curl -X POST -H "Content-Type: application/json" \
+         -d '{"weed_type": "Crabgrass", "soil_type": "Clay", "temperature": 25, "crop_type": "Corn"}' \
+         http://localhost:8000/recommend
+    curl -X POST -H "Content-Type: application/json" \
+         -d '{"weeds": ["Waterhemp", "Crabgrass"], "temperature": 25, "crop_type": "Corn", "exclude": ["Atrazine"]}' \
+         http://localhost:8000/tank-mix
+
+Concurrent /classify requests are gathered into micro-batches so that many
+requests share one model call instead of paying for one predict each.
+"""
+import os
+
+# The service is CPU only - hide any GPU before TensorFlow is imported
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "-1")
+
+import argparse
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from app import (
+    CLASS_NAMES,
+    DEFAULT_MODEL_PATH,
+    WEED_INFO,
+    application_considerations,
+    classify_weeds,
+    get_herbicide_index,
+    get_inference_governor,
+    get_pesticide_recommendation,
+    load_model,
+    preprocess_image,
+)
+from inference_governor import ServerBusy
+from instrumentation import metrics
+from preprocessing import model_input_size
+
+
+# Gathers single-image requests into batches for one model call
+class MicroBatcher:
+    def __init__(self, model, max_batch_size=32, max_wait_ms=10):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches_run = 0
+        self.images_classified = 0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    # Queue one preprocessed (1, H, W, 3) array and get a Future for its (class, confidence)
+    def submit(self, image_array):
+        future = Future()
+        self._queue.put((image_array, future))
+        return future
+
+    # Block for the first request, then keep collecting until the batch is full or the wait expires
+    def _collect(self):
+        pending = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(pending) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            futures = [future for _, future in pending]
+            try:
+                image_batch = np.concatenate([image_array for image_array, _ in pending])
+                results = classify_weeds(self.model, image_batch, CLASS_NAMES,
+                                         batch_size=len(pending))
+                if results is None:
+                    raise RuntimeError("classification failed")
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            self.batches_run += 1
+            self.images_classified += len(results)
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    batcher = None
+    request_timeout = 30.0
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {
+                "status": "ok",
+                "batches_run": self.batcher.batches_run,
+                "images_classified": self.batcher.images_classified,
+                "inference": get_inference_governor().stats(),
+            })
+        elif self.path == "/metrics":
+            body = metrics.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {"error": f"unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        if self.path == "/classify":
+            with metrics.stage("http_classify"):
+                self._classify()
+        elif self.path == "/recommend":
+            with metrics.stage("http_recommend"):
+                self._recommend()
+        elif self.path == "/tank-mix":
+            with metrics.stage("http_tank_mix"):
+                self._tank_mix()
+        else:
+            self._send_json(404, {"error": f"unknown endpoint {self.path}"})
+
+    # Raw image bytes in, predicted weed with its WEED_INFO details out
+    def _classify(self):
+        try:
+            image = Image.open(BytesIO(self._read_body()))
+            image_array = preprocess_image(image, model_input_size(self.batcher.model))
+            if image_array is None:
+                raise ValueError("image could not be preprocessed")
+        except Exception as e:
+            self._send_json(400, {"error": f"invalid image: {e}"})
+            return
+
+        try:
+            predicted_class, confidence = self.batcher.submit(image_array).result(self.request_timeout)
+        except ServerBusy as e:
+            self._send_json(503, {"error": str(e)}, headers={"Retry-After": "1"})
+            return
+        except Exception as e:
+            self._send_json(503, {"error": f"classification failed: {e}"})
+            return
+
+        info = WEED_INFO.get(predicted_class, {})
+        self._send_json(200, {
+            "weed": predicted_class,
+            "confidence": confidence,
+            "description": info.get("description", ""),
+            "icon": info.get("icon", "🌿"),
+        })
+
+    # JSON with weed_type, soil_type, temperature and crop_type in, recommendations out
+    def _recommend(self):
+        try:
+            params = json.loads(self._read_body())
+            pesticides, general_rec, specific_recs = get_pesticide_recommendation(
+                params["weed_type"], params["soil_type"], float(params["temperature"]), params["crop_type"]
+            )
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": f"invalid request: {e}"})
+            return
+
+        self._send_json(200, {
+            "pesticides": pesticides,
+            "recommendation": general_rec,
+            "considerations": specific_recs,
+        })
+
+    # JSON with weeds and optional soil_type, temperature, crop_type, exclude and limit in; smallest covering mixes,
+    # plus the application considerations once temperature is given, out
+    def _tank_mix(self):
+        try:
+            params = json.loads(self._read_body())
+            weeds = params["weeds"]
+            unknown = [weed for weed in weeds if weed not in WEED_INFO]
+            if unknown:
+                raise ValueError(f"unknown weeds {unknown}")
+            temperature = params.get("temperature")
+            cover = get_herbicide_index().minimal_covers(weeds, params.get("crop_type"), params.get("exclude", []),
+                                                         limit=int(params.get("limit", 5)))
+            considerations = ([] if temperature is None else
+                              application_considerations(params.get("soil_type"), float(temperature),
+                                                         params.get("crop_type")))
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": f"invalid request: {e}"})
+            return
+
+        self._send_json(200, {
+            "combinations": [list(combination) for combination in cover["combinations"]],
+            "uncovered": cover["uncovered"],
+            "considerations": considerations,
+        })
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(model, host="127.0.0.1", port=8000, max_batch_size=32, max_wait_ms=10):
+    handler = type("BoundInferenceRequestHandler", (InferenceRequestHandler,), {
+        "batcher": MicroBatcher(model, max_batch_size, max_wait_ms),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WeedAI headless inference service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="path to the .keras model")
+    parser.add_argument("--max-batch-size", type=int, default=32,
+                        help="largest number of requests sent to the model in one call")
+    parser.add_argument("--max-wait-ms", type=float, default=10,
+                        help="longest a request waits for others to join its batch")
+    parser.add_argument("--metrics", action="store_true",
+                        help="record per-stage latencies, served in Prometheus format at /metrics")
+    args = parser.parse_args()
+    metrics.enabled = metrics.enabled or args.metrics
+
+    # Sizes the TensorFlow thread pools before the model loads
+    get_inference_governor()
+    model = load_model(args.model)
+    if model is None:
+        raise SystemExit(f"Could not load model from {args.model}")
+
+    server = create_server(model, args.host, args.port, args.max_batch_size, args.max_wait_ms)
+    print(f"WeedAI inference service listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
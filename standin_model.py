@@ -0,0 +1,31 @@
+"""Small synthetic stand-in for the weed classifier.
+
+Has the real model's interface - a (120, 120, 3) float input and a 15-way
+softmax output - so benchmarks, load tests and offline tooling run when
+`crop_weed_classifier_final.keras` is not available. Its predictions are
+meaningless; only its cost and shapes matter.
+"""
+import os
+
+NUM_CLASSES = 15
+
+
+def build_standin_model(input_shape=(120, 120, 3), num_classes=NUM_CLASSES, width=16, seed=0):
+    from tensorflow import keras
+
+    keras.utils.set_random_seed(seed)
+    inputs = keras.Input(shape=input_shape)
+    x = keras.layers.Conv2D(width, 3, strides=2, activation="relu")(inputs)
+    x = keras.layers.Conv2D(width * 2, 3, strides=2, activation="relu")(x)
+    x = keras.layers.GlobalAveragePooling2D()(x)
+    outputs = keras.layers.Dense(num_classes, activation="softmax")(x)
+    return keras.Model(inputs, outputs, name="standin_weed_classifier")
+
+
+# The real model when the file exists, otherwise the stand-in; returns (model, description)
+def load_or_build(model_path):
+    if os.path.exists(model_path):
+        from tensorflow import keras
+
+        return keras.models.load_model(model_path), model_path
+    return build_standin_model(), "synthetic stand-in"
@@ -0,0 +1,150 @@
+"""Precompiled HTML templates for the result and recommendation cards.
+
+Every `st.markdown` call reaches the browser as its own message, and a card
+assembled from a dozen calls arrives as a dozen fragments whose opening and
+closing `<div>`s end up in different elements. Each card is rendered here
+into one HTML payload instead. Templates are parsed once at import, static
+sections such as the safety precautions are substituted in ahead of time,
+and rendered cards are memoized on their inputs, so a rerun that shows the
+same result builds no HTML. Values are HTML-escaped, so weed and crop names
+typed into the form cannot inject markup.
+"""
+import html
+from functools import lru_cache
+from string import Formatter
+
+
+# Already-rendered HTML that is inserted without escaping
+class Markup(str):
+    pass
+
+
+class Template:
+    def __init__(self, source):
+        # A blank line would end Markdown's HTML block, so inserted fragments carry no surrounding whitespace
+        self.source = source.strip()
+        # (literal text, field name, format spec) - parsed once instead of on every render
+        self._parts = [(literal, field, spec) for literal, field, spec, _ in Formatter().parse(self.source)]
+
+    def render(self, **values):
+        out = []
+        for literal, field, spec in self._parts:
+            out.append(literal)
+            if field is None:
+                continue
+            value = values[field]
+            out.append(value if isinstance(value, Markup) else html.escape(format(value, spec or "")))
+        return "".join(out)
+
+
+RESULT_CARD = Template("""
+<div class="card animate-fade-in">
+    <div style="display:flex;align-items:center;gap:1.5rem;margin-bottom:1.5rem">
+        <div style="width:60px;height:60px;background:linear-gradient(135deg, var(--primary-light), var(--primary));color:white;display:flex;align-items:center;justify-content:center;border-radius:50%;font-size:2rem;box-shadow:0 4px 10px rgba(0,0,0,0.1)">
+            {icon}
+        </div>
+        <div style="flex-grow:1">
+            <h3 style="margin:0;font-size:1.5rem;color:var(--primary-dark)">{weed}</h3>
+            <div style="display:flex;align-items:center;gap:0.8rem;margin-top:0.5rem">
+                <div style="flex-grow:1;background:#e0e0e0;border-radius:10px;height:10px;overflow:hidden">
+                    <div style="width:{percent:.0f}%;background:linear-gradient(90deg, var(--primary), var(--primary-light));height:100%;border-radius:10px"></div>
+                </div>
+                <span style="font-weight:600;color:var(--primary-dark)">{percent:.1f}% Confidence</span>
+            </div>
+        </div>
+    </div>
+    <div style="background:rgba(129, 199, 132, 0.1);border-radius:10px;padding:1rem;border-left:4px solid var(--primary)">
+        <p style="margin:0;font-size:1.05rem">{description}</p>
+    </div>
+</div>
+""")
+
+SAFETY_PRECAUTIONS = """
+<div style="background:rgba(255, 143, 0, 0.1);border-radius:10px;padding:1rem;border-left:4px solid var(--accent)">
+    <h5 style="margin-top:0;color:var(--accent-dark);display:flex;align-items:center;gap:0.5rem">
+        <span style="color:var(--accent)">⚠️</span> Safety Precautions
+    </h5>
+    <ul style="margin-bottom:0">
+        <li>Wear protective clothing, gloves, and eye protection</li>
+        <li>Avoid application on windy days (wind speed > 10 mph)</li>
+        <li>Follow manufacturer's instructions precisely</li>
+        <li>Observe pre-harvest intervals for food safety</li>
+        <li>Store pesticides in original containers away from children</li>
+    </ul>
+</div>
+"""
+
+RECOMMENDATION_CARD = Template("""
+<div class="card animate-fade-in">
+    <div style="display:flex;align-items:center;gap:1rem;margin-bottom:1rem">
+        <div style="width:40px;height:40px;background:linear-gradient(135deg, var(--accent-light), var(--accent));color:white;display:flex;align-items:center;justify-content:center;border-radius:50%;font-size:1.2rem">🧪</div>
+        <h4 style="margin:0;color:var(--accent-dark);font-size:1.3rem">Recommended Treatment</h4>
+    </div>
+    {body}
+</div>
+""")
+
+TREATMENT = Template("""
+<div style="background:rgba(255, 255, 255, 0.7);border-radius:10px;padding:1rem;margin-bottom:1rem">
+    <h5 style="margin-top:0;color:var(--primary-dark);display:flex;align-items:center;gap:0.5rem">
+        <span style="color:var(--accent)">🧪</span> Recommended Herbicides
+    </h5>
+    <div style="display:flex;flex-wrap:wrap;gap:0.5rem">{pills}</div>
+</div>
+<div style="background:rgba(255, 255, 255, 0.7);border-radius:10px;padding:1rem;margin-bottom:1rem">
+    <h5 style="margin-top:0;color:var(--primary-dark);display:flex;align-items:center;gap:0.5rem">
+        <span style="color:var(--accent)">💡</span> Application Advice
+    </h5>
+    <div style="background:rgba(28, 131, 225, 0.1);color:#004280;border-radius:0.5rem;padding:1rem">{advice}</div>
+</div>
+{considerations}
+""" + SAFETY_PRECAUTIONS.strip())
+
+CONSIDERATIONS = Template("""
+<div style="background:rgba(255, 255, 255, 0.7);border-radius:10px;padding:1rem;margin-bottom:1rem">
+    <h5 style="margin-top:0;color:var(--primary-dark);display:flex;align-items:center;gap:0.5rem">
+        <span style="color:var(--accent)">🌦️</span> Environmental Considerations
+    </h5>
+    <ul style="margin-bottom:0">{items}</ul>
+</div>
+""")
+
+NO_RECOMMENDATION = Markup(
+    '<div style="background:rgba(255, 193, 7, 0.15);color:#7a5b00;border-radius:0.5rem;padding:1rem">'
+    "No specific recommendations available for this weed type</div>"
+)
+
+PILL = Template('<span class="herbicide-pill">{name}</span>')
+TANK_MIX = Template('<div style="display:flex;flex-wrap:wrap;align-items:center;gap:0.5rem;margin-bottom:0.6rem">'
+                    '<span style="font-weight:600;min-width:1.5rem">{rank}.</span>{pills}</div>')
+LIST_ITEM = Template("<li>{text}</li>")
+
+
+@lru_cache(maxsize=256)
+def result_card(weed, confidence, icon, description):
+    return RESULT_CARD.render(icon=icon, weed=weed, percent=confidence * 100, description=description)
+
+
+# pesticides and considerations are tuples so the rendered card can be memoized
+@lru_cache(maxsize=256)
+def recommendation_card(pesticides, general_rec, considerations):
+    if not pesticides:
+        return RECOMMENDATION_CARD.render(body=NO_RECOMMENDATION)
+
+    body = TREATMENT.render(
+        pills=Markup("".join(PILL.render(name=pesticide) for pesticide in pesticides)),
+        advice=general_rec,
+        considerations=Markup(CONSIDERATIONS.render(
+            items=Markup("".join(LIST_ITEM.render(text=item) for item in considerations))
+        ) if considerations else ""),
+    )
+    return RECOMMENDATION_CARD.render(body=Markup(body))
+
+
+# combinations is a tuple of tuples of herbicide names, best first
+@lru_cache(maxsize=256)
+def tank_mix_options(combinations):
+    return "".join(
+        TANK_MIX.render(rank=rank, pills=Markup("".join(PILL.render(name=name) for name in combination)))
+        for rank, combination in enumerate(combinations, 1)
+    )
@@ -0,0 +1,90 @@
+import os
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+from background_jobs import JobManager, JobQueueFull
+
+
+def blocked_until(event, result=None):
+    def body(job):
+        event.wait(10)
+        return result
+    return body
+
+
+def test_a_key_in_flight_returns_the_existing_job():
+    manager = JobManager(max_workers=2)
+    release = threading.Event()
+    job = manager.submit("key", "first", blocked_until(release, "first result"))
+    assert manager.submit("key", "second", blocked_until(release, "second result")) is job
+    assert manager.in_flight == 1
+    release.set()
+    assert job.future.result(timeout=10) == "first result"
+    assert job.status == "done"
+    assert job.progress == 1.0
+
+
+def test_a_finished_key_starts_a_new_job():
+    manager = JobManager(max_workers=1)
+    first = manager.submit("key", "job", lambda job: 1)
+    first.future.result(timeout=10)
+    second = manager.submit("key", "job", lambda job: 2)
+    assert second is not first
+    assert second.future.result(timeout=10) == 2
+
+
+def test_a_failing_job_keeps_its_exception():
+    manager = JobManager(max_workers=1)
+
+    def body(job):
+        raise ValueError("bad image")
+
+    job = manager.submit("key", "job", body)
+    job.future.exception(timeout=10)
+    assert job.status == "failed"
+    assert isinstance(job.error, ValueError)
+    with pytest.raises(ValueError):
+        job.result()
+
+
+def test_submissions_beyond_max_in_flight_are_refused():
+    manager = JobManager(max_workers=2, max_in_flight=2)
+    release = threading.Event()
+    jobs = [manager.submit(key, "job", blocked_until(release)) for key in ("a", "b")]
+    with pytest.raises(JobQueueFull):
+        manager.submit("c", "job", lambda job: None)
+    # Joining a job already in flight is still allowed
+    assert manager.submit("a", "job", lambda job: None) is jobs[0]
+    release.set()
+    for job in jobs:
+        job.future.result(timeout=10)
+    assert manager.submit("c", "job", lambda job: "ran").future.result(timeout=10) == "ran"
+
+
+def test_finished_jobs_are_pruned_down_to_max_finished():
+    manager = JobManager(max_workers=1, max_finished=3)
+    for i in range(6):
+        manager.submit(i, "job", lambda job: None).future.result(timeout=10)
+    manager.submit("last", "job", lambda job: None).future.result(timeout=10)
+    assert len(manager._jobs) <= 4
+
+
+def test_an_identify_job_fails_with_the_classification_error(monkeypatch):
+    class BrokenModel:
+        input_shape = (None, 8, 8, 3)
+
+        def predict(self, image_batch, batch_size=32, verbose=0):
+            raise ValueError("weights do not match the input")
+
+    monkeypatch.setattr(app, "get_history_store", lambda: None)
+    job = app.submit_identify_job(BrokenModel(), "broken.keras", app.CLASS_NAMES, [b"image bytes"],
+                                  image_batch=np.zeros((1, 8, 8, 3), dtype=np.float32))
+    job.future.exception(timeout=30)
+    assert isinstance(job.error, ValueError)
+    assert "weights do not match the input" in str(job.error)
@@ -0,0 +1,45 @@
+import itertools
+import os
+import sys
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import CLASS_NAMES, get_pesticide_recommendation
+from bulk_recommend import build_table, parse_temperature
+
+WEEDS = [CLASS_NAMES[0], CLASS_NAMES[-1], "Unknown", None, 7]
+SOILS = ["Clay", "SANDY", "Select", None, 3]
+TEMPERATURES = [35, 35.0, 5, 20, np.float64(35), np.int64(5), float("nan"), True, Decimal("31"), None, "35", "",
+                [35]]
+CROPS = ["Corn", "soyabean", "Rice", None]
+
+
+@pytest.fixture(scope="module")
+def table():
+    return build_table()
+
+
+# Every combination of mixed-type values, in columns, must give what one call per row gives
+def test_recommend_rows_matches_per_call_function_on_mixed_types(table):
+    rows = list(itertools.product(WEEDS, SOILS, TEMPERATURES, CROPS))
+    expected = [get_pesticide_recommendation(*row) for row in rows]
+    assert table.recommend_rows(*(list(column) for column in zip(*rows))) == expected
+
+
+def test_numeric_array_temperatures_match_per_call_function(table):
+    temperatures = np.array([-5.0, 10.0, 29.5, 30.0, 30.5, np.nan])
+    rows = [("Crabgrass", "Clay", temperature, "Corn") for temperature in temperatures]
+    expected = [get_pesticide_recommendation(*row) for row in rows]
+    assert table.recommend_rows(*(np.array(column) if i == 2 else list(column)
+                                  for i, column in enumerate(zip(*rows)))) == expected
+
+
+def test_parse_temperature():
+    assert parse_temperature("35") == 35.0
+    assert parse_temperature(" -2.5 ") == -2.5
+    assert parse_temperature("") is None
+    assert parse_temperature("n/a") is None
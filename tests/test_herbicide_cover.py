@@ -0,0 +1,89 @@
+import itertools
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import CROP_ADVICE_INGREDIENTS, WEED_INFO
+from herbicide_cover import HerbicideIndex, build_index
+
+
+@pytest.fixture(scope="module")
+def index():
+    return build_index()
+
+
+# Every smallest combination of allowed herbicides that controls all the coverable weeds, by trying them all
+def brute_force(weeds, exclude=()):
+    allowed = sorted({herbicide for info in WEED_INFO.values() for herbicide in info["pesticides"]} - set(exclude))
+    controls = {herbicide: {weed for weed in weeds if herbicide in WEED_INFO[weed]["pesticides"]}
+                for herbicide in allowed}
+    coverable = set().union(*controls.values()) if controls else set()
+    uncovered = [weed for weed in weeds if weed not in coverable]
+    if not coverable:
+        return [], uncovered
+    for size in range(1, len(allowed) + 1):
+        found = [combination for combination in itertools.combinations(allowed, size)
+                 if set().union(*(controls[herbicide] for herbicide in combination)) == coverable]
+        if found:
+            return found, uncovered
+    return [], uncovered
+
+
+# No product in the combination is useless for these weeds
+def useful(combination, weeds):
+    return all(any(herbicide in WEED_INFO[weed]["pesticides"] for weed in weeds) for herbicide in combination)
+
+
+def test_minimal_covers_match_brute_force(index):
+    rng = np.random.default_rng(0)
+    herbicides = index.herbicides
+    for _ in range(150):
+        weeds = list(rng.choice(index.weeds, size=rng.integers(1, 6), replace=False))
+        exclude = list(rng.choice(herbicides, size=rng.integers(0, 8), replace=False))
+        result = index.minimal_covers(weeds, exclude=exclude, limit=10000)
+        expected, uncovered = brute_force(weeds, exclude)
+        assert sorted(result["uncovered"]) == sorted(uncovered)
+        # Same minimal size; products dominated by another one are left out, so the index lists a subset
+        found = {tuple(sorted(combination)) for combination in result["combinations"]}
+        assert bool(found) == bool(expected)
+        assert found <= set(expected)
+
+
+def test_excluded_products_never_appear(index):
+    weeds = ["Waterhemp", "Crabgrass"]
+    first = index.minimal_covers(weeds)["combinations"][0]
+    result = index.minimal_covers(weeds, exclude=first)
+    assert result["combinations"]
+    assert all(herbicide not in first for combination in result["combinations"] for herbicide in combination)
+
+
+def test_weeds_nothing_allowed_controls_are_reported(index):
+    weed = "Crabgrass"
+    result = index.minimal_covers([weed, "Waterhemp"], exclude=WEED_INFO[weed]["pesticides"])
+    assert result["uncovered"] == [weed]
+    assert all(useful(combination, ["Waterhemp"]) for combination in result["combinations"])
+
+
+def test_the_crop_only_reorders_mixes_of_the_same_size(index):
+    weeds = ["Waterhemp", "Crabgrass", "Morningglory"]
+    plain = index.minimal_covers(weeds, limit=10000)["combinations"]
+    for crop, ingredients in CROP_ADVICE_INGREDIENTS.items():
+        ranked = index.minimal_covers(weeds, crop.title(), limit=10000)["combinations"]
+        assert sorted(ranked) == sorted(plain)
+        preferred = [sum(herbicide in ingredients for herbicide in combination) for combination in ranked]
+        assert preferred == sorted(preferred, reverse=True)
+
+
+def test_crop_ingredients_are_products_the_index_knows(index):
+    for ingredients in CROP_ADVICE_INGREDIENTS.values():
+        assert set(ingredients) <= set(index.herbicides)
+
+
+def test_unknown_weeds_are_ignored():
+    index = HerbicideIndex({"A": {"pesticides": ["x"]}, "B": {"pesticides": ["y"]}})
+    assert index.minimal_covers(["A", "Not a weed"]) == {"combinations": [("x",)], "uncovered": []}
+    assert index.minimal_covers([]) == {"combinations": [], "uncovered": []}
@@ -0,0 +1,82 @@
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history_store import HistoryStore, week_of
+
+# A Wednesday and the Monday and Sunday around it, then the next Monday, in local time
+MONDAY = datetime(2024, 6, 3, 9).timestamp()
+WEDNESDAY = datetime(2024, 6, 5, 12).timestamp()
+SUNDAY = datetime(2024, 6, 9, 23).timestamp()
+NEXT_MONDAY = datetime(2024, 6, 10, 8).timestamp()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite3"), batch_size=3, flush_interval=0.05)
+    yield store
+    store.close()
+
+
+def test_week_of_is_the_monday_of_the_week():
+    assert week_of(MONDAY) == week_of(WEDNESDAY) == week_of(SUNDAY) == "2024-06-03"
+    assert week_of(NEXT_MONDAY) == "2024-06-10"
+
+
+def test_weekly_rollup_matches_the_raw_rows(store):
+    rows = [("Crabgrass", 0.9, "north", MONDAY), ("Crabgrass", 0.7, "north", SUNDAY),
+            ("Purslane", 0.6, "north", WEDNESDAY), ("Crabgrass", 0.5, "south", WEDNESDAY),
+            ("Crabgrass", 0.8, "north", NEXT_MONDAY)]
+    for species, confidence, field, ts in rows:
+        store.record_prediction(species, confidence, "model", "hash", field=field, ts=ts)
+    store.flush()
+
+    assert store.weekly_species_counts(field="north") == [
+        ("2024-06-03", "Crabgrass", 2, pytest.approx(0.8)),
+        ("2024-06-03", "Purslane", 1, pytest.approx(0.6)),
+        ("2024-06-10", "Crabgrass", 1, pytest.approx(0.8)),
+    ]
+    assert store.species_totals() == [("Crabgrass", 4, pytest.approx(0.725)), ("Purslane", 1, pytest.approx(0.6))]
+    assert store.species_totals(since=NEXT_MONDAY) == [("Crabgrass", 1, pytest.approx(0.8))]
+    assert store.species_totals(until=SUNDAY, field="south") == [("Crabgrass", 1, pytest.approx(0.5))]
+    assert store.fields() == ["north", "south"]
+    assert len(store.recent_predictions()) == len(rows)
+
+
+def test_rows_written_in_several_batches_add_up_in_the_rollup(store):
+    for i in range(10):
+        store.record_prediction("Waterhemp", 0.5, "model", f"hash{i}", ts=WEDNESDAY)
+    store.flush()
+    assert store.written == 10
+    assert store.batches >= 4
+    assert store.species_totals() == [("Waterhemp", 10, pytest.approx(0.5))]
+
+
+def test_recommendations_are_recorded(store):
+    store.record_recommendation("Crabgrass", "Clay", 25, "Corn", ["Dithiopyr", "Prodiamine"], field="north",
+                                ts=MONDAY)
+    store.flush()
+    assert store.recent_recommendations() == [(MONDAY, "north", "Crabgrass", "Clay", 25.0, "Corn",
+                                               "Dithiopyr, Prodiamine")]
+
+
+def test_a_missing_field_is_recorded_as_the_default(store):
+    store.record_prediction("Crabgrass", 0.9, "model", "hash", field=None, ts=MONDAY)
+    store.flush()
+    assert store.fields() == ["default"]
+
+
+def test_rows_beyond_max_pending_are_dropped_not_blocking(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite3"), max_pending=1)
+    try:
+        for _ in range(2000):
+            store.record_prediction("Crabgrass", 0.9, "model", "hash")
+        store.flush()
+        assert store.dropped > 0
+        assert store.written + store.dropped == 2000
+    finally:
+        store.close()
@@ -0,0 +1,144 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import inference_governor
+from inference_governor import (GovernedModel, InferenceGovernor, ServerBusy, configure_tensorflow_threads,
+                                default_max_concurrent)
+
+
+# Holds a slot until released, recording when it got in
+def hold_slot(governor, release, admitted, errors):
+    try:
+        with governor.admit():
+            admitted.append(threading.current_thread().name)
+            release.wait(10)
+    except ServerBusy as e:
+        errors.append(e)
+
+
+def start_callers(governor, count, release, admitted, errors, name="caller"):
+    threads = []
+    for i in range(count):
+        thread = threading.Thread(target=hold_slot, args=(governor, release, admitted, errors), name=f"{name}-{i}")
+        thread.start()
+        threads.append(thread)
+        # Queued callers are served in arrival order, so arrive one at a time
+        time.sleep(0.02)
+    return threads
+
+
+def test_callers_beyond_the_limit_queue_and_beyond_the_queue_are_rejected():
+    governor = InferenceGovernor(max_concurrent=2, max_queue=1, max_wait=10)
+    release = threading.Event()
+    admitted, errors = [], []
+    threads = start_callers(governor, 3, release, admitted, errors)
+    assert (governor.running, governor.queued) == (2, 1)
+
+    with pytest.raises(ServerBusy):
+        with governor.admit():
+            pass
+    release.set()
+    for thread in threads:
+        thread.join(10)
+
+    stats = governor.stats()
+    assert (stats["running"], stats["queued"], stats["admitted"], stats["rejected"]) == (0, 0, 3, 1)
+    assert admitted == ["caller-0", "caller-1", "caller-2"]
+    assert errors == []
+
+
+def test_queued_callers_are_admitted_first_come_first_served():
+    governor = InferenceGovernor(max_concurrent=1, max_queue=8, max_wait=10)
+    release = threading.Event()
+    admitted, errors = [], []
+    threads = start_callers(governor, 5, release, admitted, errors)
+    release.set()
+    for thread in threads:
+        thread.join(10)
+    assert admitted == [f"caller-{i}" for i in range(5)]
+
+
+def test_a_wait_that_runs_out_raises_and_leaves_the_queue():
+    governor = InferenceGovernor(max_concurrent=1, max_queue=4, max_wait=0.05)
+    release = threading.Event()
+    admitted, errors = [], []
+    holder = start_callers(governor, 1, release, admitted, errors)
+    with pytest.raises(ServerBusy):
+        with governor.admit():
+            pass
+    assert governor.queued == 0
+    assert governor.timed_out == 1
+    release.set()
+    holder[0].join(10)
+    assert governor.running == 0
+
+
+def test_slots_are_never_lost_when_waits_time_out_during_a_handover():
+    # Waits about as long as each execution, so some slots are handed over just as a wait runs out
+    governor = InferenceGovernor(max_concurrent=2, max_queue=64, max_wait=0.003)
+    outcomes = []
+
+    def call():
+        for _ in range(50):
+            try:
+                with governor.admit():
+                    time.sleep(0.002)
+                outcomes.append("ok")
+            except ServerBusy:
+                outcomes.append("busy")
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    assert (governor.running, governor.queued) == (0, 0)
+    assert outcomes.count("ok") == governor.admitted
+    assert outcomes.count("busy") == governor.rejected + governor.timed_out
+    with governor.admit():
+        assert governor.running == 1
+
+
+def test_a_slot_is_released_when_the_execution_raises():
+    governor = InferenceGovernor(max_concurrent=1)
+    with pytest.raises(ValueError):
+        with governor.admit():
+            raise ValueError("predict failed")
+    assert governor.running == 0
+
+
+def test_governed_model_admits_every_predict():
+    class Model:
+        input_shape = (None, 8, 8, 3)
+
+        def predict(self, image_batch, batch_size=32, verbose=0):
+            return governor.running
+
+    governor = InferenceGovernor(max_concurrent=1)
+    assert GovernedModel(Model(), governor).predict(None) == 1
+    assert governor.admitted == 1
+
+
+def test_default_concurrency_admits_more_than_one_request(monkeypatch):
+    for cores, expected in [(1, 2), (4, 2), (16, 8)]:
+        monkeypatch.setattr(os, "cpu_count", lambda: cores)
+        assert default_max_concurrent() == expected
+
+
+def test_thread_pools_are_configured_once_before_tensorflow_loads(monkeypatch):
+    monkeypatch.setattr(inference_governor, "_configured_threads", None)
+    monkeypatch.setattr(os, "cpu_count", lambda: 8)
+    monkeypatch.delitem(sys.modules, "tensorflow", raising=False)
+    monkeypatch.delenv("TF_NUM_INTRAOP_THREADS", raising=False)
+    monkeypatch.delenv("TF_NUM_INTEROP_THREADS", raising=False)
+    assert configure_tensorflow_threads(4) == (8, 4)
+    assert (os.environ["TF_NUM_INTRAOP_THREADS"], os.environ["TF_NUM_INTEROP_THREADS"]) == ("8", "4")
+    # Later calls only report the sizes TensorFlow will use
+    assert configure_tensorflow_threads(2) == (8, 4)
+    assert os.environ["TF_NUM_INTEROP_THREADS"] == "4"
@@ -0,0 +1,103 @@
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_registry import ModelRegistry, ModelSpec, discover, load_manifest
+
+CLASSES = ["Crabgrass", "Purslane"]
+
+
+# Stands in for a loaded model; the registry sizes it by resident_bytes
+class FakeModel:
+    def __init__(self, path, resident_bytes):
+        self.path = path
+        self.resident_bytes = resident_bytes
+
+
+def make_registry(sizes, budget, loads=None):
+    def loader(path):
+        if loads is not None:
+            loads.append(path)
+        return FakeModel(path, sizes[path])
+    return ModelRegistry([ModelSpec(name, name, CLASSES) for name in sizes], loader, memory_budget_bytes=budget)
+
+
+def test_the_least_recently_used_model_is_evicted_over_budget():
+    registry = make_registry({"a": 40, "b": 40, "c": 40}, budget=100)
+    registry.get("a")
+    registry.get("b")
+    registry.get("a")
+    registry.get("c")
+    assert [name for name, _ in registry.resident()] == ["a", "c"]
+    assert registry.stats()["evictions"] == 1
+    assert registry.resident_bytes == 80
+
+
+def test_the_requested_model_stays_even_when_it_alone_is_over_budget():
+    registry = make_registry({"small": 10, "huge": 500}, budget=100)
+    registry.get("small")
+    assert registry.get("huge").path == "huge"
+    assert [name for name, _ in registry.resident()] == ["huge"]
+
+
+def test_a_loaded_model_is_a_hit_and_an_evicted_one_loads_again():
+    loads = []
+    registry = make_registry({"a": 60, "b": 60}, budget=100, loads=loads)
+    first = registry.get("a")
+    assert registry.get("a") is first
+    registry.get("b")
+    registry.get("a")
+    assert loads == ["a", "b", "a"]
+    stats = registry.stats()
+    assert (stats["hits"], stats["misses"], stats["loads"]) == (1, 3, 3)
+
+
+def test_concurrent_requests_for_one_model_load_it_once():
+    loads = []
+
+    def slow_loader(path):
+        loads.append(path)
+        time.sleep(0.1)
+        return FakeModel(path, 1)
+
+    registry = ModelRegistry([ModelSpec("a", "a", CLASSES)], slow_loader)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("a"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert loads == ["a"]
+    assert len({id(model) for model in results}) == 1
+
+
+def test_a_failed_load_is_not_kept():
+    registry = ModelRegistry([ModelSpec("a", "a", CLASSES)], lambda path: None)
+    assert registry.get("a") is None
+    assert not registry.is_loaded("a")
+
+
+def test_manifest_paths_are_relative_to_the_manifest(tmp_path):
+    manifest = tmp_path / "models.json"
+    manifest.write_text(json.dumps({"models": [
+        {"name": "v3", "path": "v3.keras", "class_names": ["Waterhemp"], "description": "Midwest"},
+        {"path": "v3_int8.tflite"},
+    ]}))
+    specs = load_manifest(str(manifest), CLASSES)
+    assert [spec.name for spec in specs] == ["v3", "v3_int8.tflite"]
+    assert specs[0].path == os.path.join(str(tmp_path), "v3.keras")
+    assert specs[0].class_names == ["Waterhemp"]
+    assert specs[1].class_names == CLASSES
+
+
+def test_discover_reads_class_names_next_to_the_model(tmp_path):
+    (tmp_path / "a.keras").write_bytes(b"")
+    (tmp_path / "a.classes.json").write_text(json.dumps(["Waterhemp"]))
+    (tmp_path / "b.tflite").write_bytes(b"")
+    (tmp_path / "notes.txt").write_text("")
+    specs = discover(str(tmp_path), CLASSES)
+    assert [(spec.name, spec.class_names) for spec in specs] == [("a.keras", ["Waterhemp"]), ("b.tflite", CLASSES)]
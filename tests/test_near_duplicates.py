@@ -0,0 +1,84 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from near_duplicates import NearDuplicateIndex, hamming_distances, perceptual_hashes
+
+
+def random_images(count, seed=0):
+    return np.random.default_rng(seed).random((count, 32, 32, 3), dtype=np.float32)
+
+
+def test_hamming_distance_lookup_table_matches_bitwise_count(monkeypatch):
+    rng = np.random.default_rng(0)
+    hashes = rng.integers(0, 2 ** 63, size=20, dtype=np.uint64)
+    others = rng.integers(0, 2 ** 63, size=30, dtype=np.uint64)
+    expected = [[bin(int(a) ^ int(b)).count("1") for b in others] for a in hashes]
+    assert hamming_distances(hashes, others).tolist() == expected
+    monkeypatch.delattr(np, "bitwise_count", raising=False)
+    assert hamming_distances(hashes, others).tolist() == expected
+
+
+def test_hashes_are_stable_under_small_noise_and_differ_between_images():
+    images = random_images(2)
+    noisy = np.clip(images + np.random.default_rng(1).normal(0, 0.002, images.shape), 0, 1)
+    distances = hamming_distances(perceptual_hashes(images), perceptual_hashes(noisy))
+    assert distances[0, 0] <= 4 and distances[1, 1] <= 4
+    assert distances[0, 1] > 4
+
+
+def test_near_duplicates_reuse_earlier_predictions():
+    index = NearDuplicateIndex(max_distance=4)
+    images = random_images(3)
+    calls = []
+
+    def predict(batch):
+        calls.append(len(batch))
+        return [("Crabgrass", 0.9)] * len(batch)
+
+    results, predicted = index.predict(images, predict)
+    assert predicted == [0, 1, 2]
+    results, predicted = index.predict(images[[1]], predict)
+    assert predicted == []
+    assert results == [("Crabgrass", 0.9)]
+    assert calls == [3]
+    assert index.skip_rate == pytest.approx(1 / 4)
+
+
+def test_duplicates_within_one_batch_are_predicted_once():
+    index = NearDuplicateIndex(max_distance=4)
+    image = random_images(1)
+    burst = np.concatenate([image, image, random_images(1, seed=5), image])
+    results, predicted = index.predict(burst, lambda batch: [(f"weed {i}", 0.5) for i in range(len(batch))])
+    assert predicted == [0, 2]
+    assert results == [("weed 0", 0.5), ("weed 0", 0.5), ("weed 1", 0.5), ("weed 0", 0.5)]
+
+
+def test_a_negative_distance_never_reuses():
+    index = NearDuplicateIndex(max_distance=-1)
+    images = random_images(2)
+    index.predict(images, lambda batch: [("Crabgrass", 0.9)] * len(batch))
+    _, predicted = index.predict(images, lambda batch: [("Crabgrass", 0.9)] * len(batch))
+    assert predicted == [0, 1]
+
+
+def test_the_ring_buffer_forgets_the_oldest_entries():
+    index = NearDuplicateIndex(max_entries=2, max_distance=0)
+    hashes = np.array([1, 2 ** 20 - 1, 2 ** 40 - 1], dtype=np.uint64)
+    index.add(hashes, ["a", "b", "c"])
+    assert len(index) == 2
+    reused, to_predict, _ = index.match_batch(hashes)
+    assert to_predict == [0]
+    assert reused == {1: "b", 2: "c"}
+
+
+def test_a_failed_predict_is_not_indexed():
+    index = NearDuplicateIndex()
+    results, predicted = index.predict(random_images(2), lambda batch: None)
+    assert results is None
+    assert len(index) == 0
+
@@ -0,0 +1,59 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prediction_cache import PredictionCache, model_identity
+
+
+def test_memory_tier_evicts_the_least_recently_used_entry():
+    cache = PredictionCache(max_entries=2)
+    cache.put("a", ("Crabgrass", 0.9))
+    cache.put("b", ("Purslane", 0.8))
+    assert cache.get("a") == ("Crabgrass", 0.9)
+    cache.put("c", ("Waterhemp", 0.7))
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == ("Crabgrass", 0.9)
+    assert cache.get("c") == ("Waterhemp", 0.7)
+    assert (cache.memory_hits, cache.misses) == (3, 1)
+
+
+def test_disk_tier_survives_a_new_cache_and_refills_memory(tmp_path):
+    PredictionCache(max_entries=4, cache_dir=str(tmp_path)).put("k" * 64, ("Crabgrass", 0.5))
+    cache = PredictionCache(max_entries=4, cache_dir=str(tmp_path))
+    assert cache.get("k" * 64) == ("Crabgrass", 0.5)
+    assert cache.get("k" * 64) == ("Crabgrass", 0.5)
+    assert (cache.disk_hits, cache.memory_hits) == (1, 1)
+
+
+def test_disk_tier_ignores_a_corrupt_entry(tmp_path):
+    cache = PredictionCache(cache_dir=str(tmp_path))
+    key = "ab" + "0" * 62
+    os.makedirs(tmp_path / key[:2])
+    (tmp_path / key[:2] / f"{key}.json").write_text("{not json")
+    assert cache.get(key) is None
+    assert cache.misses == 1
+
+
+def test_confidence_is_stored_as_a_plain_float():
+    cache = PredictionCache()
+    cache.put("a", ("Crabgrass", np.float32(0.25)))
+    assert type(cache.get("a")[1]) is float
+
+
+def test_keys_depend_on_the_bytes_and_the_model():
+    key = PredictionCache.make_key(b"image", "model-1")
+    assert key == PredictionCache.make_key(b"image", "model-1")
+    assert key != PredictionCache.make_key(b"image", "model-2")
+    assert key != PredictionCache.make_key(b"other", "model-1")
+
+
+def test_model_identity_changes_when_the_file_does(tmp_path):
+    path = tmp_path / "model.keras"
+    path.write_bytes(b"v1")
+    before = model_identity(str(path))
+    path.write_bytes(b"version 2")
+    assert model_identity(str(path)) != before
@@ -0,0 +1,143 @@
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import CLASS_NAMES
+from server import MicroBatcher, create_server
+
+
+# Answers every image with class index `label` and records the size of each batch it is given
+class FakeModel:
+    input_shape = (None, 32, 32, 3)
+
+    def __init__(self, label=0, delay=0.0, error=None):
+        self.label = label
+        self.delay = delay
+        self.error = error
+        self.batch_sizes = []
+
+    def predict(self, image_batch, batch_size=32, verbose=0):
+        self.batch_sizes.append(len(image_batch))
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        predictions = np.full((len(image_batch), len(CLASS_NAMES)), 0.01, dtype=np.float32)
+        predictions[:, self.label] = 0.9
+        return predictions
+
+
+def image_array():
+    return np.zeros((1, 32, 32, 3), dtype=np.float32)
+
+
+def test_requests_within_the_wait_share_one_batch():
+    model = FakeModel(label=3)
+    batcher = MicroBatcher(model, max_batch_size=8, max_wait_ms=500)
+    futures = [batcher.submit(image_array()) for _ in range(5)]
+    results = [future.result(timeout=10) for future in futures]
+    assert results == [(CLASS_NAMES[3], pytest.approx(0.9))] * 5
+    assert model.batch_sizes == [5]
+    assert batcher.batches_run == 1
+    assert batcher.images_classified == 5
+
+
+def test_batches_never_exceed_max_batch_size():
+    model = FakeModel()
+    batcher = MicroBatcher(model, max_batch_size=4, max_wait_ms=200)
+    futures = [batcher.submit(image_array()) for _ in range(10)]
+    for future in futures:
+        future.result(timeout=10)
+    assert sum(model.batch_sizes) == 10
+    assert max(model.batch_sizes) <= 4
+
+
+def test_a_lone_request_is_answered_once_the_wait_expires():
+    model = FakeModel()
+    batcher = MicroBatcher(model, max_batch_size=32, max_wait_ms=50)
+    start = time.monotonic()
+    batcher.submit(image_array()).result(timeout=10)
+    assert 0.04 <= time.monotonic() - start < 5
+    assert model.batch_sizes == [1]
+
+
+def test_a_failed_batch_fails_every_request_in_it():
+    batcher = MicroBatcher(FakeModel(error=ValueError("broken model")), max_batch_size=8, max_wait_ms=200)
+    futures = [batcher.submit(image_array()) for _ in range(3)]
+    for future in futures:
+        with pytest.raises(Exception):
+            future.result(timeout=10)
+    # The worker survives and serves the next batch
+    batcher.model = FakeModel(label=1)
+    assert batcher.submit(image_array()).result(timeout=10)[0] == CLASS_NAMES[1]
+
+
+@pytest.fixture(scope="module")
+def base_url():
+    server = create_server(FakeModel(label=2), port=0, max_wait_ms=1)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def request(url, body=None, content_type="application/json"):
+    data = json.dumps(body).encode("utf-8") if isinstance(body, dict) else body
+    http_request = urllib.request.Request(url, data=data, headers={"Content-Type": content_type})
+    try:
+        with urllib.request.urlopen(http_request, timeout=30) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def test_classify_endpoint(base_url):
+    buffer = BytesIO()
+    Image.new("RGB", (64, 48), (40, 120, 40)).save(buffer, format="PNG")
+    status, body = request(f"{base_url}/classify", buffer.getvalue(), "application/octet-stream")
+    assert status == 200
+    assert json.loads(body)["weed"] == CLASS_NAMES[2]
+
+
+def test_classify_endpoint_rejects_bytes_that_are_not_an_image(base_url):
+    status, body = request(f"{base_url}/classify", b"not an image", "application/octet-stream")
+    assert status == 400
+
+
+def test_recommend_endpoint(base_url):
+    status, body = request(f"{base_url}/recommend", {"weed_type": "Crabgrass", "soil_type": "Clay",
+                                                     "temperature": 25, "crop_type": "Corn"})
+    assert status == 200
+    assert json.loads(body)["pesticides"]
+    assert request(f"{base_url}/recommend", {"weed_type": "Crabgrass"})[0] == 400
+
+
+def test_tank_mix_endpoint(base_url):
+    status, body = request(f"{base_url}/tank-mix", {"weeds": ["Waterhemp", "Crabgrass"], "temperature": 25,
+                                                    "crop_type": "Corn", "exclude": ["Glyphosate"]})
+    result = json.loads(body)
+    assert status == 200
+    assert result["combinations"]
+    assert all("Glyphosate" not in combination for combination in result["combinations"])
+    assert result["considerations"]
+    assert request(f"{base_url}/tank-mix", {"weeds": ["Not a weed"]})[0] == 400
+
+
+def test_health_and_metrics_endpoints(base_url):
+    with urllib.request.urlopen(f"{base_url}/health", timeout=10) as response:
+        health = json.loads(response.read())
+    assert health["status"] == "ok"
+    assert "inference" in health
+    with urllib.request.urlopen(f"{base_url}/metrics", timeout=10) as response:
+        assert response.headers["Content-Type"].startswith("text/plain")
+    assert request(f"{base_url}/nowhere")[0] == 404
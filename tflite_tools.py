@@ -0,0 +1,167 @@
+"""Export the weed classifier to TFLite and compare backends against Keras.
+
+    # float16 and int8 exports next to the Keras model, int8 calibrated on field photos
+    python tflite_tools.py export --calibration-dir samples/
+
+    # latency, memory footprint and top-1 agreement of every backend vs. Keras
+    python tflite_tools.py compare --images samples/
+"""
+import argparse
+import os
+import statistics
+import time
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+from tensorflow import keras
+
+from inference_backends import KerasBackend, available_model_paths, load_backend
+from preprocessing import fill_model_input, model_input_size
+
+DEFAULT_MODEL_PATH = "crop_weed_classifier_final.keras"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def find_images(directory, limit=None):
+    paths = []
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+    paths.sort()
+    return paths[:limit] if limit else paths
+
+
+def load_images(paths, target_size):
+    width, height = target_size
+    batch = np.empty((len(paths), height, width, 3), dtype=np.float32)
+    for i, path in enumerate(paths):
+        with Image.open(path) as image:
+            fill_model_input(image, target_size, batch[i])
+    return batch
+
+
+def convert_float16(model):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.target_spec.supported_types = [tf.float16]
+    return converter.convert()
+
+
+# Full integer quantization; activation ranges come from the calibration batch
+def convert_int8(model, calibration_batch):
+    def representative_dataset():
+        for image in calibration_batch:
+            yield [image[np.newaxis]]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+
+def export(model_path, calibration_dir, calibration_count=100, variants=("float16", "int8")):
+    model = keras.models.load_model(model_path)
+    stem = os.path.splitext(model_path)[0]
+    written = []
+    for variant in variants:
+        if variant == "float16":
+            flatbuffer = convert_float16(model)
+        elif variant == "int8":
+            if not calibration_dir:
+                raise ValueError("int8 export needs --calibration-dir with sample images")
+            paths = find_images(calibration_dir, calibration_count)
+            if not paths:
+                raise ValueError(f"no calibration images found in {calibration_dir}")
+            flatbuffer = convert_int8(model, load_images(paths, model_input_size(model)))
+        else:
+            raise ValueError(f"unknown variant {variant}")
+
+        output_path = f"{stem}_{variant}.tflite"
+        with open(output_path, "wb") as f:
+            f.write(flatbuffer)
+        written.append(output_path)
+    return written
+
+
+# Current resident memory in MB (Linux); 0 where /proc is not available
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError):
+        return 0.0
+
+
+def time_predict(backend, batch, batch_size, repeats):
+    backend.predict(batch[:batch_size], batch_size=batch_size)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        backend.predict(batch, batch_size=batch_size)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def compare(model_path, image_dir, repeats=5, batch_size=32, limit=None):
+    paths = find_images(image_dir, limit)
+    if not paths:
+        raise ValueError(f"no images found in {image_dir}")
+
+    rows = []
+    baseline = None
+    for path in available_model_paths(model_path):
+        rss_before = current_rss_mb()
+        backend = KerasBackend(path) if path == model_path else load_backend(path)
+        load_rss = current_rss_mb() - rss_before
+
+        batch = load_images(paths, model_input_size(backend))
+        predictions = np.argmax(backend.predict(batch, batch_size=batch_size), axis=1)
+        if baseline is None:
+            baseline = predictions
+
+        rows.append({
+            "backend": os.path.basename(path),
+            "file_mb": os.path.getsize(path) / 1e6,
+            "rss_mb": load_rss,
+            "single_ms": time_predict(backend, batch[:1], 1, repeats) * 1000,
+            "batch_ms_per_image": time_predict(backend, batch, batch_size, repeats) / len(batch) * 1000,
+            "agreement": float(np.mean(predictions == baseline)),
+        })
+    return rows, len(paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TFLite export and backend comparison")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="write float16 and int8 TFLite models")
+    export_parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    export_parser.add_argument("--calibration-dir", help="folder of sample images for int8 calibration")
+    export_parser.add_argument("--calibration-count", type=int, default=100)
+    export_parser.add_argument("--variants", nargs="+", default=["float16", "int8"], choices=["float16", "int8"])
+
+    compare_parser = subparsers.add_parser("compare", help="compare every backend against Keras")
+    compare_parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    compare_parser.add_argument("--images", required=True, help="folder of sample images")
+    compare_parser.add_argument("--limit", type=int, help="use at most this many images")
+    compare_parser.add_argument("--batch-size", type=int, default=32)
+    compare_parser.add_argument("--repeats", type=int, default=5)
+
+    args = parser.parse_args()
+    if args.command == "export":
+        for path in export(args.model, args.calibration_dir, args.calibration_count, args.variants):
+            print(f"Wrote {path} ({os.path.getsize(path) / 1e6:.2f} MB)")
+    else:
+        rows, image_count = compare(args.model, args.images, args.repeats, args.batch_size, args.limit)
+        print(f"{image_count} images, batch size {args.batch_size}")
+        print(f"{'backend':<42}{'file MB':>9}{'load RSS MB':>13}{'1-image ms':>12}{'batch ms/img':>14}{'top-1 agree':>13}")
+        for row in rows:
+            print(f"{row['backend']:<42}{row['file_mb']:>9.2f}{row['rss_mb']:>13.1f}{row['single_ms']:>12.2f}"
+                  f"{row['batch_ms_per_image']:>14.2f}{row['agreement'] * 100:>12.1f}%")
+
+
+if __name__ == "__main__":
+    main()
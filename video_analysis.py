@@ -0,0 +1,234 @@
+"""Streaming weed classification for drone and tractor-cam video.
+
+Frames are read with OpenCV and subsampled to a configurable rate on a
+decode thread. A preprocess thread resizes them into model-sized batches,
+and the caller's thread runs inference. The three stages are connected by
+small bounded queues, so they overlap and memory stays constant however
+long the video is. Detections are yielded one frame at a time and merged
+into a compact timeline of species segments. With a `NearDuplicateIndex`,
+frames that are near-duplicates of recent ones reuse their prediction
+instead of going through the model.
+"""
+import queue
+import threading
+import time
+
+import numpy as np
+
+# Marks the end of a stage's output
+_END = object()
+
+
+class StageStats:
+    def __init__(self):
+        self.frames = 0
+        self.busy = 0.0
+
+    @property
+    def fps(self):
+        return self.frames / self.busy if self.busy else 0.0
+
+
+# Stops the pipeline threads when the consumer stops iterating or a stage fails
+class _Pipeline:
+    def __init__(self, queue_size):
+        self.stop = threading.Event()
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.batches = queue.Queue(maxsize=queue_size)
+
+    def put(self, target, item):
+        while not self.stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    # Next item, or _END once the pipeline is stopped
+    def get(self, source):
+        while not self.stop.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+
+def video_info(path):
+    import cv2
+
+    capture = cv2.VideoCapture(path)
+    try:
+        if not capture.isOpened():
+            raise ValueError(f"could not open video {path}")
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        return fps, frame_count
+    finally:
+        capture.release()
+
+
+# Yields (timestamp seconds, BGR frame) for sample_fps frames per second of video
+def read_frames(path, sample_fps=2.0, stats=None):
+    import cv2
+
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"could not open video {path}")
+    try:
+        video_fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        step = max(1, round(video_fps / sample_fps))
+        index = 0
+        while True:
+            start = time.perf_counter()
+            # grab() skips the colour conversion of frames that are not sampled
+            if not capture.grab():
+                break
+            frame = None
+            if index % step == 0:
+                ok, frame = capture.retrieve()
+                if not ok:
+                    break
+            if stats is not None:
+                stats.busy += time.perf_counter() - start
+            if frame is not None:
+                if stats is not None:
+                    stats.frames += 1
+                yield index / video_fps, frame
+            index += 1
+    finally:
+        capture.release()
+
+
+class VideoClassifier:
+    def __init__(self, model, class_names, sample_fps=2.0, batch_size=32, queue_size=4, near_duplicates=None):
+        self.model = model
+        self.near_duplicates = near_duplicates
+        self.class_names = class_names
+        self.sample_fps = sample_fps
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.stats = {"decode": StageStats(), "preprocess": StageStats(), "inference": StageStats()}
+
+    # Yields (timestamp, class, confidence) for every sampled frame, in order
+    def classify(self, path):
+        pipeline = _Pipeline(self.queue_size)
+        errors = []
+        threads = [
+            threading.Thread(target=self._decode, args=(path, pipeline, errors), daemon=True),
+            threading.Thread(target=self._preprocess, args=(pipeline, errors), daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+
+        stats = self.stats["inference"]
+        try:
+            while True:
+                item = pipeline.get(pipeline.batches)
+                if item is _END:
+                    break
+                timestamps, batch = item
+                start = time.perf_counter()
+                if self.near_duplicates is not None:
+                    predictions, _ = self.near_duplicates.predict(
+                        batch, lambda frames: list(self.model.predict(frames, batch_size=len(frames), verbose=0))
+                    )
+                else:
+                    predictions = self.model.predict(batch, batch_size=len(batch), verbose=0)
+                stats.busy += time.perf_counter() - start
+                stats.frames += len(batch)
+                for timestamp, prediction in zip(timestamps, predictions):
+                    predicted_class = int(np.argmax(prediction))
+                    yield timestamp, self.class_names[predicted_class], float(prediction[predicted_class])
+        finally:
+            pipeline.stop.set()
+            for thread in threads:
+                thread.join()
+        if errors:
+            raise errors[0]
+
+    def _decode(self, path, pipeline, errors):
+        try:
+            for item in read_frames(path, self.sample_fps, self.stats["decode"]):
+                if not pipeline.put(pipeline.frames, item):
+                    return
+        except Exception as e:
+            errors.append(e)
+        finally:
+            pipeline.put(pipeline.frames, _END)
+
+    def _preprocess(self, pipeline, errors):
+        import cv2
+
+        stats = self.stats["preprocess"]
+        height, width = self.model.input_shape[1:3]
+        timestamps = []
+        batch = np.empty((self.batch_size, height, width, 3), dtype=np.float32)
+        try:
+            while True:
+                item = pipeline.get(pipeline.frames)
+                if item is _END:
+                    break
+                start = time.perf_counter()
+                timestamp, frame = item
+                frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                np.multiply(rgb, np.float32(1.0 / 255.0), out=batch[len(timestamps)], casting="unsafe")
+                timestamps.append(timestamp)
+                stats.busy += time.perf_counter() - start
+                stats.frames += 1
+
+                if len(timestamps) == self.batch_size:
+                    if not pipeline.put(pipeline.batches, (timestamps, batch)):
+                        return
+                    timestamps = []
+                    batch = np.empty_like(batch)
+
+            if timestamps:
+                pipeline.put(pipeline.batches, (timestamps, batch[:len(timestamps)]))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            pipeline.put(pipeline.batches, _END)
+
+
+# Merges per-frame detections into (start, end, species) segments and per-species totals
+class DetectionTimeline:
+    def __init__(self, min_confidence=0.5):
+        self.min_confidence = min_confidence
+        self.segments = []
+        self.species = {}
+        self.frames = 0
+
+    def add(self, timestamp, predicted_class, confidence):
+        self.frames += 1
+        if confidence < self.min_confidence:
+            return
+
+        summary = self.species.setdefault(predicted_class, {"frames": 0, "confidence": 0.0, "first_seen": timestamp})
+        summary["frames"] += 1
+        summary["confidence"] += confidence
+
+        last = self.segments[-1] if self.segments else None
+        if last and last["species"] == predicted_class:
+            last["end"] = timestamp
+            last["frames"] += 1
+        else:
+            self.segments.append({"start": timestamp, "end": timestamp, "species": predicted_class, "frames": 1})
+
+    def summary(self):
+        return sorted(
+            (
+                {
+                    "species": species,
+                    "frames": totals["frames"],
+                    "share": totals["frames"] / self.frames * 100,
+                    "mean_confidence": totals["confidence"] / totals["frames"],
+                    "first_seen": totals["first_seen"],
+                }
+                for species, totals in self.species.items()
+            ),
+            key=lambda row: row["frames"],
+            reverse=True,
+        )
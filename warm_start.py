@@ -0,0 +1,178 @@
+"""Fast cold start for the weed classifier.
+
+TensorFlow is only imported when a model is actually needed, and a
+background thread imports it, loads the model and runs one dummy batch
+through it as soon as the process starts. The first user click then finds
+a warmed-up model instead of paying for the import, the `.keras` archive
+load and graph tracing.
+
+`preload` keeps one preloader per model for the whole process. Streamlit
+executes the app script only when a browser session starts, so
+`serve_app.py` calls it before it starts the Streamlit server, and the
+script runs pick up the same preloader.
+
+The first load also writes the model's architecture and weights as plain
+JSON + `.npy` files under a cache directory. Later restarts rebuild the model
+from these, which is quicker than unpacking the `.keras` zip archive.
+
+    # Build the reload cache at deploy time
+    python warm_start.py crop_weed_classifier_final.keras
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from prediction_cache import model_identity
+
+logger = logging.getLogger("weedai.startup")
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "weedai", "models")
+
+
+def fast_cache_path(model_path, cache_dir):
+    digest = hashlib.sha256(model_identity(model_path).encode("utf-8")).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(cache_dir, f"{stem}-{digest}")
+
+
+# Rebuild from architecture JSON and memory-mapped weights; None when there is no usable cache
+def load_fast_cache(path, keras):
+    try:
+        with open(os.path.join(path, "architecture.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        model = keras.models.model_from_json(manifest["architecture"])
+        weights = [
+            np.load(os.path.join(path, f"weight_{i}.npy"), mmap_mode="r")
+            for i in range(manifest["weight_count"])
+        ]
+        model.set_weights(weights)
+        return model
+    except (OSError, ValueError, KeyError) as e:
+        if os.path.isdir(path):
+            logger.warning("Ignoring unusable model reload cache %s: %s", path, e)
+        return None
+
+
+# Written to a temporary directory and renamed, so a crash never leaves a partial cache
+def write_fast_cache(model, path):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(tmp_path, exist_ok=True)
+        weights = model.get_weights()
+        for i, weight in enumerate(weights):
+            np.save(os.path.join(tmp_path, f"weight_{i}.npy"), weight)
+        with open(os.path.join(tmp_path, "architecture.json"), "w", encoding="utf-8") as f:
+            json.dump({"architecture": model.to_json(), "weight_count": len(weights)}, f)
+        os.replace(tmp_path, path)
+    except (OSError, ValueError, NotImplementedError) as e:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        logger.warning("Could not write model reload cache %s: %s", path, e)
+
+
+def warm_up(model, batch_size=1):
+    dummy_batch = np.zeros((batch_size, *model.input_shape[1:]), dtype=np.float32)
+    model.predict(dummy_batch, verbose=0)
+
+
+# Imports TensorFlow, loads and warms up one Keras model on a background thread
+class ModelPreloader:
+    def __init__(self, model_path, cache_dir=DEFAULT_CACHE_DIR):
+        self.model_path = model_path
+        self.cache_dir = cache_dir
+        self.timings = {}
+        self.loaded_from = None
+        self._model = None
+        self.taken = False
+        self._error = None
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="model-preloader", daemon=True)
+        self._thread.start()
+
+    @property
+    def ready(self):
+        return self._done.is_set()
+
+    # Block until the model is loaded and warmed up, re-raising any load error
+    def result(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"model {self.model_path} is still loading")
+        if self._error is not None:
+            raise self._error
+        return self._model
+
+    # Like result(), but hands the model over and drops the preloader's reference, so the caller
+    # (e.g. a model registry that evicts) decides how long it stays in memory
+    def take(self, timeout=None):
+        model = self.result(timeout)
+        self._model = None
+        self.taken = True
+        return model
+
+    def _run(self):
+        try:
+            start = time.perf_counter()
+            from tensorflow import keras
+            self.timings["imports"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            model = None
+            cache_path = None
+            if self.cache_dir:
+                cache_path = fast_cache_path(self.model_path, self.cache_dir)
+                model = load_fast_cache(cache_path, keras)
+            self.loaded_from = "reload cache" if model is not None else "keras archive"
+            if model is None:
+                model = keras.models.load_model(self.model_path)
+            self.timings["artifact_load"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            warm_up(model)
+            self.timings["first_predict"] = time.perf_counter() - start
+
+            self._model = model
+            logger.info(
+                "Model %s ready from %s: imports %.2fs, artifact load %.2fs, first predict %.2fs",
+                self.model_path, self.loaded_from,
+                self.timings["imports"], self.timings["artifact_load"], self.timings["first_predict"],
+            )
+            if cache_path and self.loaded_from == "keras archive":
+                write_fast_cache(model, cache_path)
+        except Exception as e:
+            self._error = e
+            logger.error("Model %s failed to load: %s", self.model_path, e)
+        finally:
+            self._done.set()
+
+
+_preloaders = {}
+_preloaders_lock = threading.Lock()
+
+
+# The process-wide preloader for model_path, started on the first call
+def preload(model_path, cache_dir=DEFAULT_CACHE_DIR):
+    with _preloaders_lock:
+        preloader = _preloaders.get(model_path)
+        if preloader is None:
+            preloader = _preloaders[model_path] = ModelPreloader(model_path, cache_dir)
+        return preloader
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load, warm up and cache a model, printing startup timings")
+    parser.add_argument("model_path")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    ModelPreloader(args.model_path, args.cache_dir).result()
+
+
+if __name__ == "__main__":
+    main()